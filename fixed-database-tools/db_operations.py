@@ -1,11 +1,11 @@
 import pymysql
-from pymysql.cursors import DictCursor
 import os
 import json
 import csv
 import random
 import string
 from datetime import datetime
+from query_stats import query_stats, traced, InstrumentedDictCursor
 
 class DatabaseOperations:
     def __init__(self):
@@ -21,6 +21,9 @@ class DatabaseOperations:
         
         # 加载配置
         self.load_config()
+        
+        # 定期输出SQL耗时统计，query_stats.snapshot()可获取完整数据
+        query_stats.start_periodic_log(60)
 
     def connect_source_db(self, host, port, user, password, database):
         """连接源数据库"""
@@ -35,7 +38,7 @@ class DatabaseOperations:
                 user=user,
                 password=password,
                 database=database,
-                cursorclass=DictCursor,
+                cursorclass=InstrumentedDictCursor,
                 charset='utf8mb4'
             )
             return True, f"已成功连接到源数据库: {database}"
@@ -55,7 +58,7 @@ class DatabaseOperations:
                 user=user,
                 password=password,
                 database=database,
-                cursorclass=DictCursor,
+                cursorclass=InstrumentedDictCursor,
                 charset='utf8mb4'
             )
             
@@ -158,6 +161,7 @@ class DatabaseOperations:
             self.target_conn.rollback()
             return False, f"更新失败: {str(e)}"
 
+    @traced("DatabaseOperations.sync_to_target")
     def sync_to_target(self):
         """同步数据到目标数据库"""
         if not self.source_conn or not self.target_conn:
@@ -1,12 +1,18 @@
 import sys
-import pandas as pd
+import os
+import time
+import threading
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout, 
-                            QHBoxLayout, QPushButton, QFileDialog, QMessageBox, QTableWidget,
-                            QTableWidgetItem, QLabel, QLineEdit, QDialog, QFormLayout,
-                            QGroupBox, QDateEdit, QCheckBox, QScrollArea, QFrame)
-from PyQt5.QtCore import Qt, QDateTime, QDate
+                            QHBoxLayout, QPushButton, QFileDialog, QMessageBox, QTableView,
+                            QHeaderView, QLabel, QLineEdit, QDialog, QFormLayout,
+                            QGroupBox, QDateEdit, QCheckBox, QScrollArea, QFrame, QProgressBar,
+                            QComboBox)
+from PyQt5.QtCore import (Qt, QDateTime, QDate, QThread, QTimer, pyqtSignal,
+                          QAbstractTableModel, QModelIndex)
 from PyQt5.QtGui import QFont, QBrush, QColor
+from columnar import ColumnarTable
 from db_utils import DBConfig, DBManager, DataProcessor
+from row_index import EnabledRowIndex
 
 class DBConfigDialog(QDialog):
     """数据库连接配置对话框"""
@@ -69,7 +75,12 @@ class DBConfigDialog(QDialog):
             "database": self.db_edit.text(),
             "table": self.table_edit.text(),
             "last_csv_path": self.config.get("last_csv_path", ""),
-            "export_columns": self.config.get("export_columns", [])
+            "export_columns": self.config.get("export_columns", []),
+            "pool_size": self.config.get("pool_size", 4),
+            "pool_idle_timeout": self.config.get("pool_idle_timeout", 300),
+            "snapshot_path": self.config.get("snapshot_path", "db_snapshot.sqlite"),
+            "fetch_partitions": self.config.get("fetch_partitions", 1),
+            "partition_by": self.config.get("partition_by", "date")
         }
         
     def test_connection(self):
@@ -77,6 +88,7 @@ class DBConfigDialog(QDialog):
         config = self.get_config()
         db_manager = DBManager(config)
         success, msg = db_manager.test_connection()
+        db_manager.close()
         if success:
             QMessageBox.information(self, "成功", "数据库连接测试成功！")
         else:
@@ -151,8 +163,195 @@ class ColumnSelectionDialog(QDialog):
         """获取选中的列"""
         return [col for col, checkbox in self.checkboxes.items() if checkbox.isChecked()]
 
+class TaskWorker(QThread):
+    """后台任务线程，执行耗时操作并通过信号把进度、数据块和结果送回界面线程"""
+    progress = pyqtSignal(int, int)  # 已加载行数, 估算字节数
+    chunk_ready = pyqtSignal(object, object)  # 列名, 行数据块
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, func, parent=None):
+        super().__init__(parent)
+        self.func = func
+        self.cancel_event = threading.Event()
+    
+    def run(self):
+        try:
+            result = self.func(self)
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.succeeded.emit(result)
+    
+    def cancel(self):
+        """请求取消任务"""
+        self.cancel_event.set()
+
+class ColumnarTableModel(QAbstractTableModel):
+    """以列存数据为后端的只读表格模型，单元格只在显示时才转换为文本
+    
+    禁用的行通过ForegroundRole显示为灰色，不再逐个单元格设置画刷
+    """
+    DISABLED_BRUSH = QBrush(QColor(128, 128, 128))
+    # 计算列宽时采样的行数
+    WIDTH_SAMPLE_ROWS = 100
+    # 列宽上限（像素）
+    MAX_COLUMN_WIDTH = 400
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._columns = []
+        self._table = None  # ColumnarTable或行元组序列
+        self._rows = []  # 流式加载时追加的行元组
+        self.disabled_rows = set()
+    
+    def set_table(self, columns, table, disabled_rows=None):
+        """替换模型数据"""
+        self.beginResetModel()
+        self._columns = list(columns or [])
+        self._table = table
+        self._rows = []
+        self.disabled_rows = disabled_rows if disabled_rows is not None else set()
+        self.endResetModel()
+    
+    def set_dataframe(self, df):
+        """以pandas DataFrame为数据，缺失值显示为空"""
+        if df is None:
+            self.set_table([], None)
+            return
+        columns = [str(col) for col in df.columns]
+        self.set_table(columns, ColumnarTable.from_objects({
+            name: df[col].to_numpy(dtype=object, na_value=None) for name, col in zip(columns, df.columns)
+        }))
+    
+    def append_rows(self, columns, rows):
+        """追加行元组（流式加载时使用）"""
+        if not rows:
+            return
+        if list(columns) != self._columns:
+            self.set_table(columns, None)
+        start = self.rowCount()
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+    
+    def adopt_table(self, columns, table, disabled_rows=None):
+        """流式加载完成后把追加的行替换为内容相同的列存数据
+        
+        列和行数与当前显示的一致时只切换数据后端，不重置模型，视图无需重绘；否则等同set_table
+        """
+        if list(columns or []) != self._columns or len(table) != self.rowCount():
+            self.set_table(columns, table, disabled_rows)
+            return
+        self._table, self._rows = table, []
+        self.disabled_rows = disabled_rows if disabled_rows is not None else set()
+    
+    def _table_length(self):
+        return len(self._table) if self._table is not None else 0
+    
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._table_length() + len(self._rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._columns)
+    
+    def cell_text(self, row, col):
+        """单元格显示文本"""
+        table_length = self._table_length()
+        if row >= table_length:
+            value = self._rows[row - table_length][col]
+        elif isinstance(self._table, ColumnarTable):
+            value = self._table.value(self._columns[col], row)
+        else:
+            value = self._table[row][col]
+        return str(value) if value is not None else ""
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.cell_text(index.row(), index.column())
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        if role == Qt.ForegroundRole and index.row() in self.disabled_rows:
+            return self.DISABLED_BRUSH
+        return None
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._columns[section] if section < len(self._columns) else None
+        return str(section + 1)
+    
+    def flags(self, index):
+        # 只读：可选择，不可编辑
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+    
+    def update_table(self, table, first):
+        """替换为只有第first行之后有变化的新数据：行数变化时只在末尾插入/删除行，保留滚动位置"""
+        old_count = self.rowCount()
+        new_count = len(table)
+        if new_count > old_count:
+            self.beginInsertRows(QModelIndex(), old_count, new_count - 1)
+            self._table, self._rows = table, []
+            self.endInsertRows()
+        elif new_count < old_count:
+            self.beginRemoveRows(QModelIndex(), new_count, old_count - 1)
+            self._table, self._rows = table, []
+            self.endRemoveRows()
+        else:
+            self._table, self._rows = table, []
+        if first < min(old_count, new_count):
+            self.rows_changed(first, min(old_count, new_count) - 1)
+    
+    def rows_changed(self, first, last=None):
+        """通知视图重绘行区间[first, last]"""
+        if not self._columns:
+            return
+        last = first if last is None else last
+        self.dataChanged.emit(self.index(first, 0), self.index(last, len(self._columns) - 1))
+    
+    def resize_columns(self, view):
+        """按表头和采样行的文本宽度设置列宽，代替逐行测量的resizeColumnsToContents"""
+        metrics = view.fontMetrics()
+        row_count = self.rowCount()
+        step = max(1, row_count // self.WIDTH_SAMPLE_ROWS)
+        sample = range(0, min(row_count, step * self.WIDTH_SAMPLE_ROWS), step)
+        for col, name in enumerate(self._columns):
+            width = metrics.horizontalAdvance(name)
+            for row in sample:
+                width = max(width, metrics.horizontalAdvance(self.cell_text(row, col)))
+            view.setColumnWidth(col, min(width + 24, self.MAX_COLUMN_WIDTH))
+
+def create_table_view(model):
+    """创建使用固定行高的只读表格视图，行数很多时不逐行计算行高"""
+    view = QTableView()
+    view.setModel(model)
+    view.setAlternatingRowColors(True)
+    view.setSelectionBehavior(QTableView.SelectRows)
+    view.setWordWrap(False)
+    view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+    view.verticalHeader().setDefaultSectionSize(view.fontMetrics().height() + 8)
+    return view
+
 class AIDeviceMatcher(QMainWindow):
     """AI设备数据匹配主窗口"""
+    # 导出文件类型 -> 扩展名
+    EXPORT_FILTERS = {
+        "CSV Files (*.csv)": ".csv",
+        "CSV gzip压缩 (*.csv.gz)": ".csv.gz",
+        "CSV zstd压缩 (*.csv.zst)": ".csv.zst",
+        "Parquet (*.parquet)": ".parquet",
+        "Arrow IPC (*.arrow)": ".arrow"
+    }
+    # 流式加载时表格中最多预览的行数，之后的块不再保存为行元组，加载完成后整体换成列存数据
+    STREAM_PREVIEW_ROWS = 10000
+    
     def __init__(self):
         super().__init__()
         
@@ -162,14 +361,27 @@ class AIDeviceMatcher(QMainWindow):
         # 数据缓存
         self.db_manager = DBManager(self.config)
         self.local_csv_data = None
+        self.csv_header = []
         self.matched_data = None
         
         # 记录禁用状态
         self.disabled_rows = set()  # 存储被禁用的行索引
+        self.row_index = None  # 启用行的树状数组索引，用于增量更新匹配结果
+        self.match_source = None  # 当前匹配结果对应的 (数据库数据, CSV数据)
+        
+        # 当前后台任务
+        self.worker = None
+        self.saved_button_states = []
+        self.streaming_first_chunk = False
+        self.progress_text = ""
         
         # 初始化界面
         self.initUI()
         
+        # 先显示本地快照，再在后台增量刷新
+        if self.config.get("database"):
+            self.load_snapshot()
+        
     def initUI(self):
         """初始化用户界面"""
         self.setWindowTitle("AI设备数据匹配工具")
@@ -208,6 +420,21 @@ class AIDeviceMatcher(QMainWindow):
         self.export_btn.clicked.connect(self.export_data)
         self.export_btn.setEnabled(False)
         
+        # 写回数据库按钮
+        self.write_back_btn = QPushButton("写回数据库")
+        self.write_back_btn.clicked.connect(self.write_back_data)
+        self.write_back_btn.setEnabled(False)
+        
+        # 后台任务进度和取消按钮
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setMaximumWidth(150)
+        self.progress_bar.hide()
+        self.progress_label = QLabel("")
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.clicked.connect(self.cancel_task)
+        self.cancel_btn.hide()
+        
         # 刷新时间显示
         self.refresh_time_label = QLabel("最后刷新: 未刷新")
         
@@ -216,6 +443,10 @@ class AIDeviceMatcher(QMainWindow):
         control_layout.addWidget(self.select_csv_btn)
         control_layout.addWidget(self.match_btn)
         control_layout.addWidget(self.export_btn)
+        control_layout.addWidget(self.write_back_btn)
+        control_layout.addWidget(self.progress_bar)
+        control_layout.addWidget(self.progress_label)
+        control_layout.addWidget(self.cancel_btn)
         control_layout.addStretch()
         control_layout.addWidget(self.refresh_time_label)
         
@@ -269,11 +500,26 @@ class AIDeviceMatcher(QMainWindow):
         filter_group.setLayout(filter_layout)
         layout.addWidget(filter_group)
         
+        # 按条件批量启用/禁用
+        row_filter_layout = QHBoxLayout()
+        self.row_filter_edit = QLineEdit(self.config.get("row_filter", ""))
+        self.row_filter_edit.setPlaceholderText("筛选条件，例如 board == 'esp32s3' and app_version < '1.6'")
+        self.disable_filtered_btn = QPushButton("禁用匹配行")
+        self.disable_filtered_btn.clicked.connect(lambda: self.apply_row_filter(False))
+        self.enable_filtered_btn = QPushButton("启用匹配行")
+        self.enable_filtered_btn.clicked.connect(lambda: self.apply_row_filter(True))
+        
+        row_filter_layout.addWidget(QLabel("筛选:"))
+        row_filter_layout.addWidget(self.row_filter_edit)
+        row_filter_layout.addWidget(self.disable_filtered_btn)
+        row_filter_layout.addWidget(self.enable_filtered_btn)
+        layout.addLayout(row_filter_layout)
+        
         # 数据库数据表格
-        self.db_table = QTableWidget()
-        self.db_table.setAlternatingRowColors(True)
-        self.db_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.db_table.cellClicked.connect(self.toggle_row_status)  # 点击单元格触发行状态切换
+        self.db_model = ColumnarTableModel(self)
+        self.db_table = create_table_view(self.db_model)
+        # 点击单元格触发行状态切换
+        self.db_table.clicked.connect(lambda index: self.toggle_row_status(index.row(), index.column()))
         layout.addWidget(self.db_table)
         
     def init_csv_tab(self):
@@ -287,9 +533,8 @@ class AIDeviceMatcher(QMainWindow):
         layout.addWidget(self.csv_path_label)
         
         # CSV数据表格
-        self.csv_table = QTableWidget()
-        self.csv_table.setAlternatingRowColors(True)
-        self.csv_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.csv_model = ColumnarTableModel(self)
+        self.csv_table = create_table_view(self.csv_model)
         layout.addWidget(self.csv_table)
         
     def init_result_tab(self):
@@ -303,8 +548,24 @@ class AIDeviceMatcher(QMainWindow):
         self.select_columns_btn.clicked.connect(self.show_column_selection)
         self.select_columns_btn.setEnabled(False)
         
+        # 匹配方式：按顺序，或按数据库列与CSV列的值匹配
+        self.match_mode_combo = QComboBox()
+        self.match_mode_combo.addItem("按顺序匹配", "position")
+        self.match_mode_combo.addItem("按键匹配", "key")
+        self.match_mode_combo.setCurrentIndex(1 if self.config.get("match_mode") == "key" else 0)
+        self.match_mode_combo.currentIndexChanged.connect(self.on_match_mode_changed)
+        self.db_key_combo = QComboBox()
+        self.csv_key_combo = QComboBox()
+        
+        result_control_layout.addWidget(QLabel("匹配方式:"))
+        result_control_layout.addWidget(self.match_mode_combo)
+        result_control_layout.addWidget(QLabel("数据库列:"))
+        result_control_layout.addWidget(self.db_key_combo)
+        result_control_layout.addWidget(QLabel("CSV列:"))
+        result_control_layout.addWidget(self.csv_key_combo)
         result_control_layout.addWidget(self.select_columns_btn)
         result_control_layout.addStretch()
+        self.on_match_mode_changed()
         
         # 结果信息
         self.result_info_label = QLabel("请先完成数据匹配")
@@ -313,100 +574,292 @@ class AIDeviceMatcher(QMainWindow):
         layout.addLayout(result_control_layout)
         
         # 结果表格
-        self.result_table = QTableWidget()
-        self.result_table.setAlternatingRowColors(True)
-        self.result_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.result_model = ColumnarTableModel(self)
+        self.result_table = create_table_view(self.result_model)
         layout.addWidget(self.result_table)
+    
+    def on_match_mode_changed(self, index=None):
+        """按顺序匹配时不需要选择匹配键"""
+        key_mode = self.match_mode_combo.currentData() == "key"
+        self.db_key_combo.setEnabled(key_mode)
+        self.csv_key_combo.setEnabled(key_mode)
+    
+    def update_key_choices(self):
+        """根据当前数据库列和CSV列更新匹配键的候选项，尽量保持原来的选择"""
+        cache = self.db_manager.get_cached_data()
+        for combo, columns, config_key in (
+            (self.db_key_combo, cache["columns"] or [], "match_db_key"),
+            (self.csv_key_combo, self.csv_header, "match_csv_key")
+        ):
+            current = combo.currentText() or self.config.get(config_key, "")
+            combo.blockSignals(True)
+            combo.clear()
+            combo.addItems([str(col) for col in columns])
+            if current in columns:
+                combo.setCurrentText(current)
+            elif "mac_address" in columns:
+                combo.setCurrentText("mac_address")
+            combo.blockSignals(False)
         
     def toggle_row_status(self, row, col):
-        """切换行的启用/禁用状态"""
-        if row < 0 or row >= self.db_table.rowCount():
+        """切换行的启用/禁用状态，后台任务执行期间（数据可能正在加载或被读取）不允许切换"""
+        if row < 0 or row >= self.db_model.rowCount():
+            return
+        if self.worker is not None:
+            self.statusBar().showMessage("任务执行中，完成后才能切换行状态", 3000)
             return
             
-        # 切换行状态
+        # 切换行状态，颜色由模型按禁用状态给出
         if row in self.disabled_rows:
             self.disabled_rows.remove(row)
-            # 恢复正常颜色
-            for c in range(self.db_table.columnCount()):
-                item = self.db_table.item(row, c)
-                if item:
-                    item.setForeground(QBrush(QColor(0, 0, 0)))
         else:
             self.disabled_rows.add(row)
-            # 设置为灰色
-            for c in range(self.db_table.columnCount()):
-                item = self.db_table.item(row, c)
-                if item:
-                    item.setForeground(QBrush(QColor(128, 128, 128)))
+        self.db_model.rows_changed(row)
+    
+        if self.row_index is not None and row < len(self.row_index):
+            self.row_index.set_enabled(row, row not in self.disabled_rows)
+            self.update_match_preview(row)
+    
+    def apply_row_filter(self, enabled):
+        """按筛选条件批量启用/禁用数据库行，只做一次模型更新"""
+        data = self.db_manager.get_cached_data()["data"]
+        if data is None or self.row_index is None:
+            QMessageBox.warning(self, "警告", "请先加载数据库数据")
+            return
+        expression = self.row_filter_edit.text().strip()
+        if not expression:
+            return
+        
+        try:
+            rows = DataProcessor.filter_rows(data, expression)
+        except ValueError as e:
+            QMessageBox.warning(self, "警告", str(e))
+            return
+        
+        changed = self.row_index.set_rows(rows, enabled)
+        if len(changed):
+            if enabled:
+                self.disabled_rows.difference_update(changed.tolist())
+            else:
+                self.disabled_rows.update(changed.tolist())
+            first = int(changed.min())
+            self.db_model.rows_changed(first, int(changed.max()))
+            self.update_match_preview(first)
+        
+        self.config["row_filter"] = expression
+        DBConfig.save_config(self.config)
+        self.statusBar().showMessage(
+            f"筛选出 {len(rows)} 行，{'启用' if enabled else '禁用'}了 {len(changed)} 行", 5000
+        )
+    
+    def update_match_preview(self, row):
+        """按顺序匹配时，启用状态变化后只更新受影响行之后的匹配结果（row为变化的最小行号）"""
+        if not self.matched_data or self.match_source is None:
+            return
+        db_data, csv_data = self.match_source
+        if db_data is not self.db_manager.get_cached_data()["data"] or csv_data is not self.local_csv_data:
+            # 数据已重新加载，结果需要重新匹配
+            return
+        if self.matched_data["mode"] != "position":
+            self.statusBar().showMessage("启用状态已变化，按键匹配的结果需要重新匹配", 5000)
+            return
+        
+        first = DataProcessor.update_position_match(self.matched_data, db_data, csv_data, self.row_index, row)
+        self.result_model.update_table(self.matched_data["data"], first)
+        self.update_result_info()
     
     def show_db_config(self):
         """显示数据库配置对话框"""
         dialog = DBConfigDialog(self, self.config)
         if dialog.exec_():
             self.config = dialog.get_config()
+            # 关闭旧的连接池，使用新配置重建
+            self.db_manager.close()
             self.db_manager = DBManager(self.config)
             self.refresh_btn.setEnabled(True)
             DBConfig.save_config(self.config)
             QMessageBox.information(self, "成功", "数据库配置已保存")
             
-    def refresh_db_data(self):
-        """刷新数据库数据"""
+    def start_task(self, func, on_success, busy_text, cancellable=True, error_prefix="",
+                   progress_text="已加载 {rows} 行（约 {mb:.1f} MB）"):
+        """在后台线程启动任务，期间禁用相关按钮并显示进度"""
+        if self.worker is not None:
+            QMessageBox.warning(self, "警告", "已有任务正在执行，请等待完成或取消")
+            return None
+        
+        self.progress_text = progress_text
+        worker = TaskWorker(func, self)
+        worker.progress.connect(self.on_task_progress)
+        worker.succeeded.connect(lambda result: (self.end_task(), on_success(result)))
+        worker.failed.connect(lambda error_msg: self.on_task_failed(error_prefix + error_msg))
+        worker.finished.connect(worker.deleteLater)
+        self.worker = worker
+        
+        self.set_busy(True, busy_text, cancellable)
+        return worker
+    
+    def set_busy(self, busy, text="", cancellable=True):
+        """切换忙碌状态，忙碌时禁用操作按钮，结束后恢复原来的可用状态"""
+        buttons = (self.db_connect_btn, self.refresh_btn, self.select_csv_btn, self.match_btn, self.export_btn,
+                   self.write_back_btn, self.disable_filtered_btn, self.enable_filtered_btn)
+        if busy:
+            self.saved_button_states = [btn.isEnabled() for btn in buttons]
+            for btn in buttons:
+                btn.setEnabled(False)
+        else:
+            for btn, enabled in zip(buttons, self.saved_button_states):
+                btn.setEnabled(enabled)
+        self.progress_bar.setVisible(busy)
+        self.cancel_btn.setVisible(busy and cancellable)
+        self.cancel_btn.setEnabled(True)
+        self.progress_label.setText(text)
+    
+    def end_task(self):
+        """后台任务结束，恢复界面状态"""
+        self.worker = None
+        self.set_busy(False)
+    
+    def on_task_progress(self, rows, size):
+        """更新进度显示"""
+        self.progress_label.setText(self.progress_text.format(rows=rows, mb=size / 1024 / 1024))
+    
+    def on_task_failed(self, error_msg):
+        """后台任务异常"""
+        self.end_task()
+        QMessageBox.critical(self, "错误", error_msg)
+    
+    def cancel_task(self):
+        """取消当前后台任务，数据库查询在服务器端通过KILL QUERY终止"""
+        if self.worker is None:
+            return
+        self.worker.cancel()
+        self.cancel_btn.setEnabled(False)
+        self.progress_label.setText("正在取消...")
+        threading.Thread(target=self.db_manager.kill_running_queries, daemon=True).start()
+    
+    def closeEvent(self, event):
+        """关闭窗口时终止后台任务并释放连接池"""
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                self.db_manager.kill_running_queries()
+            except Exception:
+                pass
+            self.worker.wait(5000)
+        self.db_manager.close()
+        super().closeEvent(event)
+    
+    def load_snapshot(self):
+        """启动时加载上次保存的本地快照并立即显示，随后在后台做一次增量刷新"""
+        success, msg, cache = self.db_manager.load_snapshot()
+        if not success:
+            return
+        
+        # 恢复快照对应的日期范围，后台刷新才能命中增量状态
+        self.date_from_edit.setDate(QDate.fromString(cache["date_from"], "yyyy-MM-dd"))
+        self.date_to_edit.setDate(QDate.fromString(cache["date_to"], "yyyy-MM-dd"))
+        self.update_db_table(cache["columns"], cache["data"])
+        self.update_key_choices()
+        self.refresh_time_label.setText(f"最后刷新: {cache['last_refresh']}（本地快照）")
+        self.statusBar().showMessage(msg, 5000)
+        QTimer.singleShot(0, lambda: self.refresh_db_data(quiet=True))
+    
+    def refresh_db_data(self, quiet=False):
+        """刷新数据库数据（后台线程执行，界面不阻塞）
+        
+        quiet为True时（启动后的后台刷新）结果只显示在状态栏，不弹出对话框
+        """
         if not self.config.get("database"):
             QMessageBox.warning(self, "警告", "请先配置数据库连接")
             return
             
-        try:
-            # 显示加载中提示
-            QMessageBox.information(self, "提示", "正在从数据库加载数据...")
+        date_from = self.date_from_edit.date()
+        date_to = self.date_to_edit.date()
+        db_manager = self.db_manager
             
-            # 刷新数据
-            success, msg, cache = self.db_manager.refresh_data(
-                self.date_from_edit.date(), 
-                self.date_to_edit.date(), 
-                self
+        def task(worker):
+            return db_manager.refresh_data(
+                date_from,
+                date_to,
+                stream=True,
+                progress_callback=worker.progress.emit,
+                chunk_callback=worker.chunk_ready.emit,
+                cancel_event=worker.cancel_event
             )
             
-            if success:
-                # 重置禁用状态
-                self.disabled_rows = set()
+        worker = self.start_task(
+            task, lambda result: self.on_refresh_done(result, quiet),
+            "正在从数据库加载数据..."
+        )
+        if worker:
+            self.streaming_first_chunk = True
+            worker.chunk_ready.connect(self.append_db_rows)
+            worker.start()
                 
-                # 更新表格显示
-                self.update_db_table(cache["columns"], cache["data"])
+    def on_refresh_done(self, result, quiet=False):
+        """刷新完成后更新界面"""
+        success, msg, cache = result
+        if not success:
+            # 恢复显示刷新前的缓存数据
+            old_cache = self.db_manager.get_cached_data()
+            self.update_db_table(old_cache["columns"], old_cache["data"])
+            if quiet:
+                self.statusBar().showMessage(msg, 10000)
+            elif msg == "数据加载已取消":
+                QMessageBox.information(self, "提示", msg)
+            else:
+                QMessageBox.critical(self, "错误", msg)
+            return
                 
-                # 更新刷新时间
-                self.refresh_time_label.setText(f"最后刷新: {cache['last_refresh']}")
+        # 重置禁用状态
+        self.disabled_rows = set()
                 
-                QMessageBox.information(self, "成功", msg)
+        # 更新表格显示；流式预览已包含全部行时只切换为缓存的列存数据，不重新绘制
+        self.update_db_table(cache["columns"], cache["data"], streamed=not self.streaming_first_chunk)
+        self.update_key_choices()
                 
-                # 如果已经加载了CSV数据，启用匹配按钮
-                if self.local_csv_data is not None:
-                    self.match_btn.setEnabled(True)
+        # 更新刷新时间，悬停显示连接池复用情况
+        self.refresh_time_label.setText(f"最后刷新: {cache['last_refresh']}")
+        stats = self.db_manager.get_pool_stats()
+        self.refresh_time_label.setToolTip(
+            f"连接池: 复用 {stats['hits']} 次，新建 {stats['misses']} 次，等待 {stats['waits']} 次"
+        )
                 
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"加载数据失败：{str(e)}")
+        if quiet:
+            self.statusBar().showMessage(msg, 10000)
+        else:
+            QMessageBox.information(self, "成功", msg)
+        
+        # 如果已经加载了CSV数据，启用匹配按钮
+        if self.local_csv_data is not None:
+            self.match_btn.setEnabled(True)
+    
+    def append_db_rows(self, columns, rows):
+        """流式加载时逐块追加行到数据库表格，只保留前STREAM_PREVIEW_ROWS行作为预览"""
+        if self.streaming_first_chunk:
+            self.streaming_first_chunk = False
+            self.row_index = None
+            self.db_model.set_table(columns, None)
+        room = self.STREAM_PREVIEW_ROWS - self.db_model.rowCount()
+        if room > 0:
+            self.db_model.append_rows(columns, rows[:room])
             
-    def update_db_table(self, columns, data):
-        """更新数据库表格显示"""
+    def update_db_table(self, columns, data, streamed=False):
+        """更新数据库表格显示，streamed为True时表格中是流式追加的预览行"""
         if not data:
-            self.db_table.setRowCount(0)
-            self.db_table.setColumnCount(0)
+            self.row_index = None
+            self.db_model.set_table([], None)
             return
             
-        # 设置表格列数和表头
-        self.db_table.setColumnCount(len(columns))
-        self.db_table.setHorizontalHeaderLabels(columns)
-        
-        # 设置表格行数和数据
-        self.db_table.setRowCount(len(data))
-        for row_idx, row_data in enumerate(data):
-            for col_idx, cell_data in enumerate(row_data):
-                item = QTableWidgetItem(str(cell_data) if cell_data is not None else "")
-                item.setTextAlignment(Qt.AlignCenter)
-                item.setFlags(item.flags() & ~Qt.ItemIsEditable)  # 禁止编辑
-                self.db_table.setItem(row_idx, col_idx, item)
-                
-        # 调整列宽
-        self.db_table.resizeColumnsToContents()
+        # 模型直接使用缓存的列存数据，单元格在显示时才生成文本
+        if streamed:
+            self.db_model.adopt_table(columns, data, self.disabled_rows)
+        else:
+            self.db_model.set_table(columns, data, self.disabled_rows)
+        self.row_index = EnabledRowIndex(len(data), self.disabled_rows)
+        
+        # 按采样行调整列宽
+        self.db_model.resize_columns(self.db_table)
         
     def select_local_csv(self):
         """选择本地CSV文件"""
@@ -415,58 +868,82 @@ class AIDeviceMatcher(QMainWindow):
             self, "选择本地CSV文件", initial_dir, "CSV Files (*.csv)"
         )
         
-        if path:
-            try:
-                # 读取CSV文件
-                self.local_csv_data = pd.read_csv(path)
-                
-                # 验证CSV格式
-                required_columns = ["password", "device_code"]
-                if not all(col in self.local_csv_data.columns for col in required_columns):
-                    raise ValueError("CSV文件必须包含 'password' 和 'device_code' 列")
+        if not path:
+            return
                 
-                # 更新界面显示
-                self.csv_path_label.setText(f"已选择: {path}")
-                self.update_csv_table()
+        # 只读取必需列和按键匹配时选择的CSV列
+        csv_key = self.csv_key_combo.currentText() or self.config.get("match_csv_key") or "mac_address"
+        password_pattern = self.config.get("password_pattern")
+        
+        def task(worker):
+            # 分块读取CSV，编码和密码按字符串读取
+            header = DataProcessor.read_csv_header(path)
+            csv_data = DataProcessor.load_csv(
+                path,
+                extra_columns=[csv_key] if csv_key else None,
+                progress_callback=worker.progress.emit,
+                cancel_event=worker.cancel_event
+            )
+            report = DataProcessor.validate_csv(csv_data, password_pattern)
+            return path, csv_data, header, report
                 
-                # 保存最后使用的CSV路径
-                self.config["last_csv_path"] = path
-                DBConfig.save_config(self.config)
+        worker = self.start_task(task, self.on_csv_loaded, "正在读取CSV文件...",
+                                 error_prefix="加载CSV文件失败：",
+                                 progress_text="已读取 {rows} 行（{mb:.1f} MB）")
+        if worker:
+            worker.start()
                 
-                # 如果已经加载了数据库数据，启用匹配按钮
-                cache = self.db_manager.get_cached_data()
-                if cache["data"] is not None:
-                    self.match_btn.setEnabled(True)
+    def on_csv_loaded(self, result):
+        """CSV读取完成后更新界面"""
+        path, self.local_csv_data, self.csv_header, report = result
                     
-                QMessageBox.information(self, "成功", f"成功加载CSV文件，共 {len(self.local_csv_data)} 条记录")
+        # 更新界面显示
+        self.csv_path_label.setText(f"已选择: {path}")
+        self.update_csv_table()
+        self.update_key_choices()
                 
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"加载CSV文件失败：{str(e)}")
-                self.local_csv_data = None
+        # 保存最后使用的CSV路径
+        self.config["last_csv_path"] = path
+        DBConfig.save_config(self.config)
+        
+        # 如果已经加载了数据库数据，启用匹配按钮
+        cache = self.db_manager.get_cached_data()
+        if cache["data"] is not None:
+            self.match_btn.setEnabled(True)
+        
+        msg = f"成功加载CSV文件，共 {len(self.local_csv_data)} 条记录"
+        problems = self.format_csv_report(report)
+        if problems:
+            QMessageBox.warning(self, "数据检查", msg + "\n\n" + problems)
+        else:
+            QMessageBox.information(self, "成功", msg)
+    
+    def format_csv_report(self, report):
+        """把CSV检查结果整理为提示文字，没有问题时返回空字符串"""
+        codes = self.local_csv_data["device_code"]
+        lines = []
+        for key, title, show_values in (
+            ("duplicate_codes", "device_code重复", True),
+            ("missing_codes", "device_code为空", False),
+            ("bad_passwords", "password格式不正确", False)
+        ):
+            rows = report[key]
+            if not len(rows):
+                continue
+            # CSV文件中的行号（含表头）
+            row_numbers = ", ".join(str(i + 2) for i in rows[:10]) + (" ..." if len(rows) > 10 else "")
+            line = f"{title}: {len(rows)} 行（第 {row_numbers} 行）"
+            if show_values:
+                values = codes.iloc[rows].unique()
+                line += f"，重复值: {', '.join(values[:10])}{' ...' if len(values) > 10 else ''}"
+            lines.append(line)
+        return "\n".join(lines)
                 
     def update_csv_table(self):
         """更新CSV表格显示"""
-        if self.local_csv_data is None:
-            self.csv_table.setRowCount(0)
-            self.csv_table.setColumnCount(0)
-            return
-            
-        # 设置表格列数和表头
-        columns = self.local_csv_data.columns.tolist()
-        self.csv_table.setColumnCount(len(columns))
-        self.csv_table.setHorizontalHeaderLabels(columns)
-        
-        # 设置表格行数和数据
-        self.csv_table.setRowCount(len(self.local_csv_data))
-        for row_idx, row_data in self.local_csv_data.iterrows():
-            for col_idx, col_name in enumerate(columns):
-                item = QTableWidgetItem(str(row_data[col_name]) if pd.notna(row_data[col_name]) else "")
-                item.setTextAlignment(Qt.AlignCenter)
-                item.setFlags(item.flags() & ~Qt.ItemIsEditable)  # 禁止编辑
-                self.csv_table.setItem(row_idx, col_idx, item)
-                
-        # 调整列宽
-        self.csv_table.resizeColumnsToContents()
+        self.csv_model.set_dataframe(self.local_csv_data)
+        if self.local_csv_data is not None:
+            self.csv_model.resize_columns(self.csv_table)
         
     def match_data(self):
         """匹配数据并预览结果"""
@@ -476,58 +953,85 @@ class AIDeviceMatcher(QMainWindow):
             QMessageBox.warning(self, "警告", "请先加载数据库数据和本地CSV数据")
             return
             
-        try:
-            # 匹配数据
-            self.matched_data = DataProcessor.match_data(
+        csv_data = self.local_csv_data
+        disabled_rows = set(self.disabled_rows)
+        mode = self.match_mode_combo.currentData()
+        db_key = self.db_key_combo.currentText()
+        csv_key = self.csv_key_combo.currentText()
+        if mode == "key" and (not db_key or not csv_key):
+            QMessageBox.warning(self, "警告", "按键匹配需要选择数据库列和CSV列")
+            return
+        if mode == "key" and csv_key not in csv_data.columns:
+            # 读取CSV时只读取了当时选择的匹配列
+            QMessageBox.warning(self, "警告", f"CSV列 {csv_key} 未读取，请重新选择CSV文件")
+            return
+        
+        # 保存匹配设置
+        self.config["match_mode"] = mode
+        self.config["match_db_key"] = db_key
+        self.config["match_csv_key"] = csv_key
+        DBConfig.save_config(self.config)
+        
+        self.match_source = (cache["data"], csv_data)
+        
+        def task(worker):
+            return DataProcessor.match_data(
                 cache["data"], 
                 cache["columns"], 
-                self.local_csv_data, 
-                self.disabled_rows
+                csv_data, 
+                disabled_rows,
+                mode=mode,
+                db_key=db_key,
+                csv_key=csv_key
             )
             
-            if not self.matched_data:
-                QMessageBox.warning(self, "警告", "数据匹配失败，请重试")
-                return
+        worker = self.start_task(task, self.on_match_done, "正在匹配数据...",
+                                 cancellable=False, error_prefix="数据匹配失败：")
+        if worker:
+            worker.start()
                 
-            # 更新结果表格
-            self.update_result_table()
+    def on_match_done(self, matched_data):
+        """匹配完成后更新结果表格"""
+        self.matched_data = matched_data
+        if not self.matched_data:
+            QMessageBox.warning(self, "警告", "数据匹配失败，请重试")
+            return
             
-            # 启用导出和列选择按钮
-            self.export_btn.setEnabled(True)
-            self.select_columns_btn.setEnabled(True)
+        # 更新结果表格
+        self.update_result_table()
             
-            # 切换到结果标签页
-            self.tabs.setCurrentIndex(2)
+        # 启用导出、写回和列选择按钮
+        self.export_btn.setEnabled(True)
+        self.write_back_btn.setEnabled(True)
+        self.select_columns_btn.setEnabled(True)
             
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"数据匹配失败：{str(e)}")
+        # 切换到结果标签页
+        self.tabs.setCurrentIndex(2)
             
     def update_result_table(self):
         """更新结果表格显示"""
         if not self.matched_data:
             return
             
-        columns = self.matched_data["columns"]
-        data = self.matched_data["data"]
+        # 模型直接使用匹配结果的列存数据
+        self.result_model.set_table(self.matched_data["columns"], self.matched_data["data"])
+        self.update_result_info()
         
-        # 更新信息标签
-        self.result_info_label.setText(f"匹配成功，共 {len(data)} 条记录")
-        
-        # 设置表格列数和表头
-        self.result_table.setColumnCount(len(columns))
-        self.result_table.setHorizontalHeaderLabels(columns)
-        
-        # 设置表格行数和数据
-        self.result_table.setRowCount(len(data))
-        for row_idx, row_data in enumerate(data):
-            for col_idx, col_name in enumerate(columns):
-                item = QTableWidgetItem(str(row_data[col_name]) if row_data[col_name] is not None else "")
-                item.setTextAlignment(Qt.AlignCenter)
-                item.setFlags(item.flags() & ~Qt.ItemIsEditable)  # 禁止编辑
-                self.result_table.setItem(row_idx, col_idx, item)
-                
-        # 调整列宽
-        self.result_table.resizeColumnsToContents()
+        # 按采样行调整列宽
+        self.result_model.resize_columns(self.result_table)
+    
+    def update_result_info(self):
+        """更新信息标签，显示两侧未匹配的行数"""
+        data = self.matched_data["data"]
+        unmatched_db = self.matched_data["unmatched_db"]
+        unmatched_csv = self.matched_data["unmatched_csv"]
+        self.result_info_label.setText(
+            f"匹配成功，共 {len(data)} 条记录；数据库未匹配 {len(unmatched_db)} 条，CSV未匹配 {len(unmatched_csv)} 条"
+        )
+        self.result_info_label.setToolTip(
+            f"数据库未匹配行号: {', '.join(str(i + 1) for i in unmatched_db[:20])}{' ...' if len(unmatched_db) > 20 else ''}\n"
+            f"CSV未匹配行号: {', '.join(str(i + 1) for i in unmatched_csv[:20])}{' ...' if len(unmatched_csv) > 20 else ''}"
+        )
         
     def show_column_selection(self):
         """显示列选择对话框"""
@@ -550,7 +1054,7 @@ class AIDeviceMatcher(QMainWindow):
             DBConfig.save_config(self.config)
             
     def export_data(self):
-        """导出匹配结果为CSV"""
+        """导出匹配结果（CSV、压缩CSV、Parquet或Arrow IPC）"""
         if not self.matched_data:
             return
             
@@ -563,29 +1067,113 @@ class AIDeviceMatcher(QMainWindow):
             self.show_column_selection()
             return
             
-        # 获取保存路径
+        # 获取保存路径，按所选类型决定压缩方式
         default_filename = f"device_matched_result_{time.strftime('%Y%m%d_%H%M%S')}.csv"
         initial_dir = os.path.dirname(self.config.get("last_csv_path", "")) if self.config.get("last_csv_path") else ""
         
-        save_path, _ = QFileDialog.getSaveFileName(
+        save_path, selected_filter = QFileDialog.getSaveFileName(
             self, "保存匹配结果", 
             os.path.join(initial_dir, default_filename), 
-            "CSV Files (*.csv)"
+            ";;".join(self.EXPORT_FILTERS)
         )
         
-        if save_path:
-            # 执行导出
-            success, msg = DataProcessor.export_to_csv(
-                self.matched_data["data"],
-                self.matched_data["columns"],
-                save_path,
-                selected_columns
+        if not save_path:
+            return
+        suffix = self.EXPORT_FILTERS.get(selected_filter, "")
+        if suffix and not save_path.lower().endswith(suffix):
+            base = save_path[:-len(".csv")] if save_path.lower().endswith(".csv") else save_path
+            save_path = base + suffix
+        
+        data = self.matched_data["data"]
+        columns = self.matched_data["columns"]
+        
+        def task(worker):
+            # 按扩展名选择格式，分块写入
+            return DataProcessor.export_file(
+                data, columns, save_path, selected_columns,
+                progress_callback=worker.progress.emit
             )
             
-            if success:
-                QMessageBox.information(self, "成功", msg)
-            else:
-                QMessageBox.critical(self, "错误", msg)
+        worker = self.start_task(task, self.on_export_done, "正在导出...", cancellable=False,
+                                 progress_text="已写入 {rows} 行（{mb:.1f} MB）")
+        if worker:
+            worker.start()
+    
+    def on_export_done(self, result):
+        """导出完成"""
+        success, msg = result
+        if success:
+            QMessageBox.information(self, "成功", msg)
+        else:
+            QMessageBox.critical(self, "错误", msg)
+
+    def write_back_data(self):
+        """把匹配得到的device_code/password写回数据库：先预览差异，确认后再写入"""
+        if not self.matched_data:
+            return
+        try:
+            assignments, skipped = DataProcessor.write_back_rows(self.matched_data)
+        except ValueError as e:
+            QMessageBox.warning(self, "警告", str(e))
+            return
+        if not assignments:
+            QMessageBox.warning(self, "警告", "没有可写回的数据")
+            return
+        
+        db_manager = self.db_manager
+        
+        def task(worker):
+            return db_manager.write_back(assignments, dry_run=True, cancel_event=worker.cancel_event)
+        
+        worker = self.start_task(task, lambda result: self.on_write_back_preview(result, assignments, skipped),
+                                 "正在预览写回差异...")
+        if worker:
+            worker.start()
+    
+    def on_write_back_preview(self, result, assignments, skipped):
+        """显示写回差异，确认后执行写入"""
+        success, msg, diff = result
+        if not success:
+            QMessageBox.critical(self, "错误", msg)
+            return
+        if skipped:
+            msg += f"\n另有 {skipped} 条因主键、device_code或password为空而跳过"
+        if not diff["changed"]:
+            QMessageBox.information(self, "提示", msg)
+            return
+        
+        samples = "\n".join(
+            f"id {key}: device_code {old_code} → {new_code}，password {old_password} → {new_password}"
+            for key, old_code, new_code, old_password, new_password in diff["samples"]
+        )
+        reply = QMessageBox.question(
+            self, "确认写回", f"{msg}\n\n示例：\n{samples}\n\n确定写入数据库吗？",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+        
+        db_manager = self.db_manager
+        
+        def task(worker):
+            return db_manager.write_back(
+                assignments, dry_run=False,
+                progress_callback=lambda done, total: worker.progress.emit(done, 0),
+                cancel_event=worker.cancel_event
+            )
+        
+        worker = self.start_task(task, self.on_write_back_done, "正在写回数据库...",
+                                 progress_text=f"已更新 {{rows}} / {len(assignments)} 行")
+        if worker:
+            worker.start()
+    
+    def on_write_back_done(self, result):
+        """写回完成"""
+        success, msg, _ = result
+        if success:
+            QMessageBox.information(self, "成功", msg)
+        else:
+            QMessageBox.critical(self, "错误", msg)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -1,9 +1,17 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, filedialog
 import pymysql
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import os
-from collections import defaultdict
+from query_stats import query_stats, traced, InstrumentedCursor, InstrumentedSSCursor
+from mac_summary import MacSummary
+from mac_search import MacSearchIndex, SEARCH_DELAY_MS
+from tk_widgets import VirtualListbox
+
+# 每次从数据库读取的聊天记录条数（同一天内按 created_at, id 翻页）
+CHAT_PAGE_SIZE = 200
+# created_at为NULL的记录归入"未知日期"，排在所有日期之后
+UNKNOWN_DAY = date.min
 
 class MacChatViewer:
     def __init__(self, root):
@@ -24,10 +32,16 @@ class MacChatViewer:
         
         self.conn = None
         self.current_mac = None
-        self.chat_records = []  # 所有记录
-        self.date_grouped_records = defaultdict(list)  # 按日期分组的记录
+        self.day_counts = []  # [(日期, 记录数)]，最新的日期在前
+        self.day_records = {}  # 日期 -> 已加载的记录 [(id, content, created_at)]
+        self.day_cursors = {}  # 日期 -> 下一页的起点 (created_at, id)，已全部加载时为None
+        self.current_day = None  # 当前显示的日期
+        self._load_pending = False  # 已排队等待读取下一页
         self.all_macs = []  # 存储所有mac地址
-        self.date_positions = {}  # 存储每个日期在文本框中的位置
+        self.mac_info = {}  # MAC地址 -> 汇总信息（消息数、首条/末条时间、最大id）
+        self.mac_summary = MacSummary(self.db_config)
+        self.mac_index = MacSearchIndex()  # MAC搜索索引，刷新列表时重建
+        self._search_job = None  # 等待执行的搜索（输入防抖）
         
         # 创建界面
         self._create_widgets()
@@ -54,22 +68,14 @@ class MacChatViewer:
         # MAC列表
         ttk.Label(left_frame, text="MAC地址列表", font=("Arial", 10, "bold")).pack(anchor=tk.W, padx=5, pady=5)
         
-        self.mac_frame = ttk.Frame(left_frame)
-        self.mac_frame.pack(fill=tk.BOTH, expand=True, padx=5)
-        
-        # MAC列表滚动条
-        self.mac_scrollbar = ttk.Scrollbar(self.mac_frame)
-        self.mac_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        # MAC列表框
-        self.mac_listbox = tk.Listbox(
-            self.mac_frame, 
-            yscrollcommand=self.mac_scrollbar.set,
+        # MAC列表框（只绘制可见行，每行是all_macs中的下标）
+        self.mac_listbox = VirtualListbox(
+            left_frame,
+            formatter=lambda row: self.all_macs[row],
             selectmode=tk.SINGLE,
             font=("SimHei", 10)
         )
-        self.mac_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        self.mac_scrollbar.config(command=self.mac_listbox.yview)
+        self.mac_listbox.pack(fill=tk.BOTH, expand=True, padx=5)
         
         # 绑定列表点击事件
         self.mac_listbox.bind('<<ListboxSelect>>', self.on_mac_selected)
@@ -79,6 +85,7 @@ class MacChatViewer:
         left_bottom_frame.pack(fill=tk.X)
         
         ttk.Button(left_bottom_frame, text="刷新列表", command=self.refresh_mac_list).pack(fill=tk.X)
+        ttk.Button(left_bottom_frame, text="重建MAC汇总", command=self.rebuild_mac_summary).pack(fill=tk.X, pady=(5, 0))
         
         # 右侧聊天区域
         right_frame = ttk.Frame(main_container)
@@ -109,6 +116,13 @@ class MacChatViewer:
         self.chat_area = scrolledtext.ScrolledText(chat_frame, wrap=tk.WORD, font=("SimHei", 10))
         self.chat_area.pack(fill=tk.BOTH, expand=True)
         self.chat_area.config(state=tk.DISABLED)  # 初始为只读
+        # 滚动到底部时加载当天的下一页
+        self.chat_area.config(yscrollcommand=self._on_chat_scrolled)
+        self.chat_area.tag_config("date", foreground="#FFFFFF", background="#3498db", 
+                                 font=("SimHei", 10, "bold"), justify=tk.CENTER)
+        self.chat_area.tag_config("time", foreground="#666666", font=("SimHei", 9))
+        self.chat_area.tag_config("content", font=("SimHei", 10))
+        self.chat_area.tag_config("more", foreground="#999999", justify=tk.CENTER)
         
         # 状态栏
         self.status_var = tk.StringVar(value="未连接数据库")
@@ -124,8 +138,11 @@ class MacChatViewer:
                 user=self.db_config["user"],
                 password=self.db_config["password"],
                 database=self.db_config["database"],
-                charset="utf8mb4"
+                charset="utf8mb4",
+                cursorclass=InstrumentedCursor
             )
+            # 定期在控制台输出SQL耗时统计
+            query_stats.start_periodic_log(60)
             
             self.refresh_mac_list()
             self.status_var.set(f"已连接到 {self.db_config['database']}")
@@ -141,183 +158,265 @@ class MacChatViewer:
             
         try:
             # 清空现有列表
-            self.mac_listbox.delete(0, tk.END)
+            self.mac_listbox.set_items(())
             self.all_macs = []
             
-            # 查询所有不重复的MAC地址
-            with self.conn.cursor() as cursor:
-                cursor.execute(f"SELECT DISTINCT mac_address FROM {self.db_config['table']} WHERE mac_address IS NOT NULL ORDER BY mac_address")
-                macs = cursor.fetchall()
+            # 只统计上次刷新后新增的记录，MAC列表从本地汇总读取
+            new_rows = self.mac_summary.refresh(self.conn)
+            self.mac_info = self.mac_summary.load()
+            self.all_macs = list(self.mac_info)
+            self.mac_index = MacSearchIndex(self.all_macs)
                 
-                # 提取MAC地址列表
-                self.all_macs = [mac[0] for mac in macs if mac[0]]
-                
-                # 添加到列表框
-                for mac in self.all_macs:
-                    self.mac_listbox.insert(tk.END, mac)
-                
-                self.status_var.set(f"找到 {len(self.all_macs)} 个MAC地址")
+            # 按当前搜索条件显示
+            self._apply_search()
+            self.status_var.set(f"找到 {len(self.all_macs)} 个MAC地址（新增 {new_rows} 条记录）")
                 
         except Exception as e:
             messagebox.showerror("错误", f"获取MAC列表失败: {str(e)}")
     
+    def rebuild_mac_summary(self):
+        """清空本地MAC汇总后重新统计全部记录（已有聊天记录被删除或修改后使用）"""
+        if not self.conn:
+            return
+        if not messagebox.askyesno("确认", "将重新统计全部聊天记录，数据量大时需要较长时间，是否继续？"):
+            return
+        self.mac_summary.clear()
+        self.refresh_mac_list()
+    
     def _on_search_changed(self, *args):
-        """处理搜索框内容变化，实现模糊搜索"""
-        search_text = self.search_var.get().lower()
-        
-        # 清空列表
-        self.mac_listbox.delete(0, tk.END)
-        
-        # 过滤并显示匹配的MAC地址
-        if search_text:
-            filtered_macs = [mac for mac in self.all_macs if search_text in mac.lower()]
-            for mac in filtered_macs:
-                self.mac_listbox.insert(tk.END, mac)
-            self.status_var.set(f"搜索到 {len(filtered_macs)} 个匹配的MAC地址")
+        """处理搜索框内容变化，输入停顿后才执行搜索"""
+        if self._search_job:
+            self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(SEARCH_DELAY_MS, self._apply_search)
+        
+    def _apply_search(self):
+        """按搜索框内容查询索引，列表只保存匹配的下标，绘制时才取MAC地址"""
+        self._search_job = None
+        search_text = self.search_var.get()
+        rows, total = self.mac_index.search(search_text)
+        self.mac_listbox.set_items(rows)
+        
+        if search_text.strip():
+            self.status_var.set(f"搜索到 {total} 个匹配的MAC地址")
         else:
-            # 搜索为空时显示所有MAC
-            for mac in self.all_macs:
-                self.mac_listbox.insert(tk.END, mac)
-            self.status_var.set(f"找到 {len(self.all_macs)} 个MAC地址")
+            self.status_var.set(f"找到 {total} 个MAC地址")
     
+    @traced("MacChatViewer.on_mac_selected")
     def on_mac_selected(self, event=None):
-        """当选择MAC地址时加载对应的聊天记录"""
+        """当选择MAC地址时加载日期列表，只读取最新一天的第一页记录"""
         selection = self.mac_listbox.curselection()
         if not selection:
             return
             
-        self.current_mac = self.mac_listbox.get(selection[0])
+        self.current_mac = self.all_macs[self.mac_listbox.get(selection[0])]
         if not self.current_mac:
             return
             
-        self.chat_title.config(text=f"MAC地址: {self.current_mac} 的聊天记录")
+        info = self.mac_info.get(self.current_mac)
+        if info:
+            self.chat_title.config(
+                text=f"MAC地址: {self.current_mac} 的聊天记录（{info['count']} 条，{info['first_at']} 至 {info['last_at']}）"
+            )
+        else:
+            self.chat_title.config(text=f"MAC地址: {self.current_mac} 的聊天记录")
+        self.day_records = {}
+        self.day_cursors = {}
+        self.current_day = None
         
-        # 加载聊天记录
+        # 按天汇总记录数，不读取记录内容
         try:
             with self.conn.cursor() as cursor:
-                # 按时间升序查询该MAC的所有聊天记录
                 cursor.execute(
-                    f"SELECT content, created_at FROM {self.db_config['table']} "
-                    f"WHERE mac_address = %s ORDER BY created_at ASC",
+                    f"SELECT DATE(created_at) AS day, COUNT(*) FROM {self.db_config['table']} "
+                    f"WHERE mac_address = %s GROUP BY day ORDER BY day DESC",
                     (self.current_mac,)
                 )
-                self.chat_records = cursor.fetchall()
-                
-                # 按日期分组
-                self.date_grouped_records = defaultdict(list)
-                for content, created_at in self.chat_records:
-                    if isinstance(created_at, datetime):
-                        record_date = created_at.date()
-                    else:
-                        try:
-                            # 尝试解析字符串格式的时间
-                            dt = datetime.strptime(str(created_at), "%Y-%m-%d %H:%M:%S.%f")
-                            record_date = dt.date()
-                        except:
-                            record_date = date.today()
-                            
-                    self.date_grouped_records[record_date].append((content, created_at))
-                
-                # 更新日期选择下拉框
-                self._update_date_combobox()
-                
-                # 显示聊天记录
-                self._display_chat_records()
-                
-                self.status_var.set(f"已加载 {len(self.chat_records)} 条聊天记录，分布在 {len(self.date_grouped_records)} 天")
-                
+                self.day_counts = [(self._to_date(day), count) for day, count in cursor.fetchall()]
         except Exception as e:
             messagebox.showerror("错误", f"加载聊天记录失败: {str(e)}")
+            return
+        
+        # 更新日期选择下拉框
+        self._update_date_combobox()
+        
+        if not self.day_counts:
+            self._show_day(None)
+            self.status_var.set("该MAC地址没有聊天记录")
+            return
+        
+        # 默认显示最新的一天
+        self._show_day(self.day_counts[0][0])
+        total = sum(count for _, count in self.day_counts)
+        self.status_var.set(f"共 {total} 条聊天记录，分布在 {len(self.day_counts)} 天")
+    
+    @staticmethod
+    def _to_date(value):
+        """把DATE()结果转换为date对象，NULL对应UNKNOWN_DAY"""
+        if value is None:
+            return UNKNOWN_DAY
+        if isinstance(value, date):
+            return value
+        return datetime.strptime(str(value), "%Y-%m-%d").date()
+    
+    @staticmethod
+    def _day_label(day):
+        """日期的显示文字"""
+        return "未知日期" if day == UNKNOWN_DAY else day.strftime('%Y-%m-%d')
+    
+    @staticmethod
+    def _format_time(created_at):
+        """格式化记录时间"""
+        if isinstance(created_at, datetime):
+            return created_at.strftime("%H:%M:%S")
+        try:
+            return datetime.strptime(str(created_at), "%Y-%m-%d %H:%M:%S.%f").strftime("%H:%M:%S")
+        except ValueError:
+            return "未知时间"
+    
+    @traced("MacChatViewer._fetch_day_page")
+    def _fetch_day_page(self, day):
+        """读取某天的下一页记录，按 (created_at, id) 键集翻页，返回本页记录"""
+        if day in self.day_cursors and self.day_cursors[day] is None:
+            return []
+        
+        position = self.day_cursors.get(day)
+        if day == UNKNOWN_DAY:
+            # 没有时间的记录只按id翻页
+            sql = (
+                f"SELECT id, content, created_at FROM {self.db_config['table']} "
+                f"WHERE mac_address = %s AND created_at IS NULL"
+            )
+            params = [self.current_mac]
+            if position is not None:
+                sql += " AND id > %s"
+                params.append(position[1])
+            sql += " ORDER BY id ASC LIMIT %s"
+        else:
+            day_start = datetime.combine(day, datetime.min.time())
+            sql = (
+                f"SELECT id, content, created_at FROM {self.db_config['table']} "
+                f"WHERE mac_address = %s AND created_at >= %s AND created_at < %s"
+            )
+            params = [self.current_mac, day_start, day_start + timedelta(days=1)]
+            if position is not None:
+                sql += " AND (created_at > %s OR (created_at = %s AND id > %s))"
+                params += [position[0], position[0], position[1]]
+            sql += " ORDER BY created_at ASC, id ASC LIMIT %s"
+        params.append(CHAT_PAGE_SIZE)
+        
+        with self.conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            records = cursor.fetchall()
+        
+        self.day_records.setdefault(day, []).extend(records)
+        if len(records) < CHAT_PAGE_SIZE:
+            self.day_cursors[day] = None
+        else:
+            self.day_cursors[day] = (records[-1][2], records[-1][0])
+        return records
     
     def _update_date_combobox(self):
-        """更新日期选择下拉框"""
+        """更新日期选择下拉框，显示每天的记录数"""
         # 清空现有选项
         self.date_combobox['values'] = []
         
-        # 添加日期选项
-        dates = sorted(self.date_grouped_records.keys(), reverse=True)  # 最新的日期在前面
-        date_strings = [d.strftime("%Y-%m-%d") for d in dates]
+        date_strings = [f"{self._day_label(day)}（{count}条）" for day, count in self.day_counts]
         
         if date_strings:
             self.date_combobox['values'] = date_strings
             # 默认选中第一个（最新的日期）
             self.date_combobox.current(0)
+        else:
+            self.date_combobox.set("")
     
     def on_date_selected(self, event=None):
-        """跳转到选中日期的记录"""
-        selected_date_str = self.date_combobox.get()
-        if not selected_date_str:
+        """显示选中日期的记录，未加载过时才从数据库读取"""
+        index = self.date_combobox.current()
+        if index < 0 or index >= len(self.day_counts):
             return
+        self._show_day(self.day_counts[index][0])
             
-        # 查找该日期在文本框中的位置并滚动过去
-        if selected_date_str in self.date_positions:
-            position = self.date_positions[selected_date_str]
-            self.chat_area.see(position)
-            # 高亮显示日期行
-            self.chat_area.tag_remove("highlight", 1.0, tk.END)
-            self.chat_area.tag_add("highlight", position, f"{position}+1l")
-    
-    def _display_chat_records(self):
-        """在聊天区域显示记录，按日期分割"""
+    def _show_day(self, day):
+        """在聊天区域显示某一天的记录，先显示第一页，滚动到底部时再加载后续页"""
+        self.current_day = day
         self.chat_area.config(state=tk.NORMAL)
         self.chat_area.delete(1.0, tk.END)
-        self.date_positions = {}  # 重置日期位置记录
         
-        # 清除之前的标签配置
-        self.chat_area.tag_remove("date", 1.0, tk.END)
-        self.chat_area.tag_remove("time", 1.0, tk.END)
-        self.chat_area.tag_remove("content", 1.0, tk.END)
-        self.chat_area.tag_remove("highlight", 1.0, tk.END)
-        
-        if not self.date_grouped_records:
+        if day is None:
             self.chat_area.insert(tk.END, "该MAC地址没有聊天记录")
             self.chat_area.config(state=tk.DISABLED)
             return
         
-        # 按日期降序显示（最新的日期在前面）
-        for record_date in sorted(self.date_grouped_records.keys(), reverse=True):
-            date_str = record_date.strftime("%Y-%m-%d")
+        try:
+            if day not in self.day_records:
+                self._fetch_day_page(day)
+        except Exception as e:
+            self.chat_area.config(state=tk.DISABLED)
+            messagebox.showerror("错误", f"加载聊天记录失败: {str(e)}")
+            return
             
-            # 记录当前插入位置（日期行的位置）
-            current_position = self.chat_area.index(tk.END)
-            self.date_positions[date_str] = current_position
+        # 添加日期分割线
+        self.chat_area.insert(tk.END, f"==================== {self._day_label(day)} ====================\n", "date")
+        self._append_records(self.day_records[day])
+        self.chat_area.see(1.0)
             
-            # 添加日期分割线
-            self.chat_area.insert(tk.END, f"==================== {date_str} ====================\n", "date")
+    def _append_records(self, records):
+        """把记录追加到聊天区域末尾，还有后续页时在末尾显示提示"""
+        self.chat_area.config(state=tk.NORMAL)
+        if self.chat_area.tag_ranges("more"):
+            self.chat_area.delete("more.first", "more.last")
+        
+        # 整页拼成一个字符串插入，时间和内容的标签范围按行号预先算好后批量添加
+        parts = []
+        time_ranges = []
+        content_ranges = []
+        line = int(self.chat_area.index("end-1c").split(".")[0])
+        for _, content, created_at in records:
+            header = f"[{self._format_time(created_at)}]  "
+            content = f"{content}\n"
+            parts.append(header)
+            parts.append(content)
+            time_ranges += [f"{line}.0", f"{line}.{len(header)}"]
+            content_ranges.append(f"{line}.{len(header)}")
+            line += content.count("\n")
+            content_ranges.append(f"{line}.0")
+        if parts:
+            self.chat_area.insert(tk.END, "".join(parts))
+            self.chat_area.tag_add("time", *time_ranges)
+            self.chat_area.tag_add("content", *content_ranges)
+        
+        if self.day_cursors.get(self.current_day) is not None:
+            self.chat_area.insert(tk.END, "滚动到底部加载更多...\n", "more")
+        self.chat_area.config(state=tk.DISABLED)
             
-            # 添加当天的记录
-            for content, created_at in self.date_grouped_records[record_date]:
-                # 格式化时间
-                if isinstance(created_at, datetime):
-                    time_str = created_at.strftime("%H:%M:%S")
-                else:
-                    try:
-                        dt = datetime.strptime(str(created_at), "%Y-%m-%d %H:%M:%S.%f")
-                        time_str = dt.strftime("%H:%M:%S")
-                    except:
-                        time_str = "未知时间"
+    def _on_chat_scrolled(self, first, last):
+        """聊天区域滚动时更新滚动条；滚动到底部且当天还有未加载的记录时读取下一页"""
+        self.chat_area.vbar.set(first, last)
+        day = self.current_day
+        if self._load_pending:
+            return
+        if day is not None and float(last) >= 1.0 and self.day_cursors.get(day) is not None:
+            self._load_pending = True
+            self.root.after_idle(self._load_more, day)
                 
-                # 聊天记录样式（时间 + 内容）
-                self.chat_area.insert(tk.END, f"[{time_str}]  ", "time")
-                self.chat_area.insert(tk.END, f"{content}\n", "content")
-            
-            # 每天的记录之间添加空行
-            self.chat_area.insert(tk.END, "\n")
-        
-        # 设置文本样式
-        self.chat_area.tag_config("date", foreground="#FFFFFF", background="#3498db", 
-                                 font=("SimHei", 10, "bold"), justify=tk.CENTER)
-        self.chat_area.tag_config("time", foreground="#666666", font=("SimHei", 9))
-        self.chat_area.tag_config("content", font=("SimHei", 10))
-        self.chat_area.tag_config("highlight", background="#ffffcc")  # 日期选中高亮
-        
-        # 滚动到底部
-        self.chat_area.see(tk.END)
-        self.chat_area.config(state=tk.DISABLED)
+    def _load_more(self, day):
+        """读取并追加当天的下一页记录"""
+        self._load_pending = False
+        if day != self.current_day or self.day_cursors.get(day) is None:
+            return
+        try:
+            records = self._fetch_day_page(day)
+        except Exception as e:
+            self.day_cursors[day] = None
+            messagebox.showerror("错误", f"加载聊天记录失败: {str(e)}")
+            return
+        self._append_records(records)
+        self.status_var.set(f"{self._day_label(day)} 已加载 {len(self.day_records[day])} 条")
     
+    @traced("MacChatViewer.export_to_txt")
     def export_to_txt(self):
         """将当前MAC地址的聊天记录导出为TXT文件"""
-        if not self.current_mac or not self.chat_records:
+        if not self.current_mac or not self.day_counts:
             messagebox.showwarning("提示", "请先选择一个有聊天记录的MAC地址")
             return
             
@@ -333,26 +432,34 @@ class MacChatViewer:
             return
             
         try:
-            with open(file_path, "w", encoding="utf-8") as f:
+            with open(file_path, "w", encoding="utf-8") as f, self.conn.cursor(InstrumentedSSCursor) as cursor:
                 f.write(f"MAC地址: {self.current_mac} 的聊天记录\n")
                 f.write(f"导出时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"记录总数: {len(self.chat_records)}\n")
-                f.write(f"日期范围: {min(self.date_grouped_records.keys()).strftime('%Y-%m-%d')} 至 {max(self.date_grouped_records.keys()).strftime('%Y-%m-%d')}\n")
+                f.write(f"记录总数: {sum(count for _, count in self.day_counts)}\n")
+                known_days = [day for day, _ in self.day_counts if day != UNKNOWN_DAY]
+                if known_days:
+                    f.write(f"日期范围: {self._day_label(known_days[-1])} 至 {self._day_label(known_days[0])}\n")
                 f.write("=" * 80 + "\n\n")
                 
-                # 按日期导出
-                for record_date in sorted(self.date_grouped_records.keys(), reverse=True):
-                    date_str = record_date.strftime("%Y-%m-%d")
-                    f.write(f"==================== {date_str} ====================\n\n")
-                    
-                    for content, created_at in self.date_grouped_records[record_date]:
-                        if isinstance(created_at, datetime):
-                            time_str = created_at.strftime("%H:%M:%S")
-                        else:
-                            time_str = "未知时间"
-                            
-                        f.write(f"[{time_str}]  {content}\n")
-                    
+                # 按日期降序、当天按时间升序流式导出，不在内存中保存全部记录
+                cursor.execute(
+                    f"SELECT DATE(created_at) AS day, content, created_at FROM {self.db_config['table']} "
+                    f"WHERE mac_address = %s "
+                    f"ORDER BY day DESC, created_at ASC, id ASC",
+                    (self.current_mac,)
+                )
+                # 没有时间的记录(day为NULL)排在最后
+                current_day = None
+                started = False
+                for day, content, created_at in cursor:
+                    if not started or day != current_day:
+                        if started:
+                            f.write("\n")
+                        started = True
+                        current_day = day
+                        f.write(f"==================== {self._day_label(self._to_date(day))} ====================\n\n")
+                    f.write(f"[{self._format_time(created_at)}]  {content}\n")
+                if started:
                     f.write("\n")
             
             messagebox.showinfo("导出成功", f"聊天记录已成功导出到:\n{file_path}")
@@ -0,0 +1,223 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+import numpy as np
+from columnar import ColumnarTable
+from db_utils import DBConfig, DBManager, DataProcessor
+
+def bench_partitions(args):
+    """对比不同分区数下全量刷新的耗时"""
+    config = DBConfig.load_config()
+    if not config.get("database"):
+        print("请先在 db_config.json 中配置数据库连接")
+        return
+    counts = [int(value) for value in args.partitions.split(",")]
+    
+    # 连接池至少容纳最大分区数，避免子查询排队等待连接
+    config = dict(config, pool_size=max(counts + [config.get("pool_size", 4)]), snapshot_path="")
+    manager = DBManager(config)
+    try:
+        baseline = None
+        print(f"{'分区数':>6} {'方式':>6} {'行数':>10} {'最短(秒)':>10} {'平均(秒)':>10} {'加速比':>8}")
+        for count in counts:
+            timings = []
+            rows = 0
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                success, msg, cache = manager.refresh_data(
+                    args.date_from, args.date_to, incremental=False,
+                    partitions=count, partition_by=args.by
+                )
+                timings.append(time.perf_counter() - start)
+                if not success:
+                    print(msg)
+                    return
+                rows = cache["record_count"]
+            best = min(timings)
+            if baseline is None:
+                baseline = best
+            print(
+                f"{count:>6} {args.by:>6} {rows:>10} {best:>10.3f} "
+                f"{sum(timings) / len(timings):>10.3f} {baseline / best:>8.2f}"
+            )
+        stats = manager.get_pool_stats()
+        print(f"连接池: 复用 {stats['hits']} 次，新建 {stats['misses']} 次，等待 {stats['waits']} 次")
+    finally:
+        manager.close()
+
+# 100万行匹配的目标耗时（秒）
+MATCH_TARGETS = {"position": 1.0, "key": 3.0}
+
+def make_match_inputs(rows, disabled_ratio=0.01, seed=0):
+    """生成匹配测试数据：数据库列存表、CSV数据框和禁用行集合"""
+    import pandas as pd
+    
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, rows + 1, dtype=np.int64)
+    macs = np.array([f"AA:BB:{i >> 16 & 0xFF:02X}:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}:00" for i in range(rows)], dtype=object)
+    boards = np.array(["esp32-s3", "esp32-c3", "esp32"], dtype=object)
+    versions = np.array([f"1.{i}.0" for i in range(20)], dtype=object)
+    create_date = np.datetime64("2026-01-01T00:00:00", "us") + rng.integers(0, 86400 * 10**6 * 30, rows).astype("timedelta64[us]")
+    db_data = ColumnarTable(
+        ["id", "mac_address", "board", "app_version", "create_date"],
+        {"id": "int", "mac_address": "object", "board": "dict", "app_version": "dict", "create_date": "datetime"},
+        {
+            "id": ids,
+            "mac_address": macs,
+            "board": rng.integers(0, len(boards), rows).astype(np.int32),
+            "app_version": rng.integers(0, len(versions), rows).astype(np.int32),
+            "create_date": create_date
+        },
+        categories={"board": boards, "app_version": versions}
+    )
+    csv_data = pd.DataFrame({
+        "password": [f"p{i:07d}" for i in range(rows)],
+        "device_code": [f"{i:07d}" for i in range(rows)],
+        "mac_address": macs[rng.permutation(rows)]
+    })
+    disabled_rows = set(rng.choice(rows, int(rows * disabled_ratio), replace=False).tolist())
+    return db_data, csv_data, disabled_rows
+
+def bench_match(args):
+    """测试DataProcessor.match_data的耗时"""
+    print(f"生成 {args.rows} 行测试数据...")
+    db_data, csv_data, disabled_rows = make_match_inputs(args.rows)
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = DataProcessor.match_data(
+            db_data, db_data.columns, csv_data, disabled_rows,
+            mode=args.mode, db_key="mac_address", csv_key="mac_address"
+        )
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(
+        f"[{args.mode}] 匹配 {result['count']} 行，数据库未匹配 {len(result['unmatched_db'])} 行，"
+        f"CSV未匹配 {len(result['unmatched_csv'])} 行：最短 {best:.3f} 秒，平均 {sum(timings) / len(timings):.3f} 秒，"
+        f"{result['count'] / best / 1e6:.1f} 百万行/秒"
+    )
+    target = MATCH_TARGETS[args.mode] if args.target is None else args.target
+    if target and best > target:
+        print(f"未达到目标：{target} 秒")
+        raise SystemExit(1)
+
+# 启动导入耗时上限（秒）
+STARTUP_IMPORT_TARGET = 0.5
+# 启动时不应导入的模块（首次使用时才导入）
+STARTUP_DEFERRED_MODULES = ("pandas", "pyarrow")
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# 在子进程中计时：导入主窗口模块、创建并显示窗口
+_STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {path!r})
+import ai_device_matcher
+imported = time.perf_counter()
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv)
+window = ai_device_matcher.AIDeviceMatcher()
+window.show()
+app.processEvents()
+shown = time.perf_counter()
+deferred = sorted({{name.split(".")[0] for name in sys.modules}} & set({deferred!r}))
+print(imported - start, shown - start, ",".join(deferred) or "-")
+"""
+
+def measure_startup():
+    """在干净的子进程中测量启动耗时
+    
+    返回 (导入耗时, 窗口显示耗时, 启动时已导入的延迟模块列表, 按顶层模块汇总的导入耗时)；
+    子进程在临时目录中运行，不读取本地配置和快照
+    """
+    path = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    if not env.get("DISPLAY") and not env.get("QT_QPA_PLATFORM"):
+        env["QT_QPA_PLATFORM"] = "offscreen"
+    with tempfile.TemporaryDirectory() as workdir:
+        script = _STARTUP_SCRIPT.format(path=path, deferred=STARTUP_DEFERRED_MODULES)
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            cwd=workdir, env=env, capture_output=True, text=True, check=True
+        )
+    
+    # importtime中子模块先于父模块输出：ai_device_matcher之前、缩进深一层的是它的直接导入，
+    # 之后缩进最小的是创建窗口时才导入的模块；按顶层包汇总
+    breakdown = {}
+    entries = [match.groups() for match in map(_IMPORTTIME_RE.match, result.stderr.splitlines()) if match]
+    names = [name for _, _, _, name in entries]
+    if "ai_device_matcher" in names:
+        position = names.index("ai_device_matcher")
+        level = len(entries[position][2])
+        children = []
+        for _, cumulative, indent, name in reversed(entries[:position]):
+            if len(indent) <= level:
+                break
+            if len(indent) == level + 2:
+                children.append((cumulative, name))
+        children += [(cumulative, name) for _, cumulative, indent, name in entries[position + 1:] if len(indent) <= level]
+        for cumulative, name in children:
+            package = name.split(".")[0]
+            breakdown[package] = breakdown.get(package, 0) + int(cumulative) / 1e6
+    
+    # 最后一行为子进程输出的计时结果
+    import_time, shown_time, deferred = result.stdout.strip().splitlines()[-1].split()
+    return float(import_time), float(shown_time), [name for name in deferred.split(",") if name != "-"], breakdown
+
+def bench_startup(args):
+    """测试ai_device_matcher的冷启动耗时，超过目标或提前导入延迟模块时以非零状态退出"""
+    runs = [measure_startup() for _ in range(args.repeat)]
+    import_time, shown_time, deferred, breakdown = min(runs, key=lambda run: run[1])
+    
+    print(f"{'模块':<24} {'导入(毫秒)':>10}")
+    for package, seconds in sorted(breakdown.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{package:<24} {seconds * 1000:>10.1f}")
+    print(f"导入 ai_device_matcher: {import_time:.3f} 秒，显示窗口: {shown_time:.3f} 秒（{args.repeat} 次取最短）")
+    
+    failed = False
+    if deferred:
+        print(f"启动时导入了应延迟导入的模块: {', '.join(deferred)}")
+        failed = True
+    if args.target and import_time > args.target:
+        print(f"未达到目标：导入耗时应不超过 {args.target} 秒")
+        failed = True
+    if failed:
+        raise SystemExit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="数据访问层性能测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    parser_partitions = subparsers.add_parser("partitions", help="分区并发读取加速比")
+    parser_partitions.add_argument("--from", dest="date_from", default=(date.today() - timedelta(days=30)).isoformat())
+    parser_partitions.add_argument("--to", dest="date_to", default=date.today().isoformat())
+    parser_partitions.add_argument("--partitions", default="1,2,4,8", help="逗号分隔的分区数列表")
+    parser_partitions.add_argument("--by", choices=("date", "id"), default="date")
+    parser_partitions.add_argument("--repeat", type=int, default=3)
+    parser_partitions.set_defaults(func=bench_partitions)
+    
+    parser_match = subparsers.add_parser("match", help="数据匹配耗时")
+    parser_match.add_argument("--rows", type=int, default=1000000)
+    parser_match.add_argument("--repeat", type=int, default=5)
+    parser_match.add_argument("--mode", choices=("position", "key"), default="position",
+                              help="key为按mac_address哈希连接（CSV行顺序被打乱）")
+    parser_match.add_argument("--target", type=float, default=None, help="最短耗时超过该秒数时以非零状态退出，默认见MATCH_TARGETS")
+    parser_match.set_defaults(func=bench_match)
+    
+    parser_startup = subparsers.add_parser("startup", help="主窗口冷启动耗时及导入耗时分解")
+    parser_startup.add_argument("--repeat", type=int, default=3)
+    parser_startup.add_argument("--top", type=int, default=15, help="显示导入耗时最多的前N个模块")
+    parser_startup.add_argument("--target", type=float, default=STARTUP_IMPORT_TARGET,
+                                help="导入耗时超过该秒数时以非零状态退出，0为不检查")
+    parser_startup.set_defaults(func=bench_startup)
+    
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
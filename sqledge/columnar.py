@@ -0,0 +1,424 @@
+import datetime
+import numpy as np
+
+# 默认做字典编码的低基数字段
+DICT_ENCODE_COLUMNS = ("board", "app_version")
+# 字符串列中不同值占比低于该比例时自动做字典编码
+DICT_ENCODE_RATIO = 0.5
+# 行迭代时每次转换的行数
+ITER_BLOCK_SIZE = 10000
+
+class ColumnarTable:
+    """按列存储的表格数据，替代逐行的Python元组
+    
+    每列保存为NumPy数组：
+    - int: int64数组，NULL记录在null掩码中
+    - float: float64数组，NULL存为NaN
+    - datetime: datetime64[us]数组，NULL存为NaT
+    - dict: 低基数字符串，int32编码数组 + 取值表，NULL编码为-1
+    - object: 其他类型（高基数字符串、Decimal等）保持Python对象
+    
+    支持len()、按下标取行、逐行迭代（行为元组），因此可以直接替代原来的行元组序列使用
+    """
+    def __init__(self, columns, kinds, data, masks=None, categories=None):
+        self.columns = list(columns)
+        self.kinds = dict(kinds)  # 列名 -> 存储类型
+        self._data = data  # 列名 -> ndarray（字典编码列存编码）
+        self._masks = masks or {}  # 列名 -> bool ndarray，True表示NULL
+        self._categories = categories or {}  # 列名 -> object ndarray 取值表
+        self._length = len(data[self.columns[0]]) if self.columns else 0
+    
+    @classmethod
+    def from_rows(cls, columns, rows, dict_columns=DICT_ENCODE_COLUMNS, kinds=None):
+        """由行元组序列构建，kinds可按列指定存储类型"""
+        builder = ColumnarBuilder(columns, dict_columns, kinds)
+        builder.append(rows)
+        return builder.finish()
+    
+    @classmethod
+    def from_chunks(cls, columns, chunks, dict_columns=DICT_ENCODE_COLUMNS, kinds=None):
+        """由分块的行数据构建，每块转换后即可释放原始行对象"""
+        builder = ColumnarBuilder(columns, dict_columns, kinds)
+        for chunk in chunks:
+            builder.append(chunk)
+        return builder.finish()
+    
+    def __len__(self):
+        return self._length
+    
+    def __iter__(self):
+        for start in range(0, self._length, ITER_BLOCK_SIZE):
+            stop = min(start + ITER_BLOCK_SIZE, self._length)
+            lists = [self._column_list(name, start, stop) for name in self.columns]
+            yield from zip(*lists)
+    
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += self._length
+            if not 0 <= index < self._length:
+                raise IndexError("行下标越界")
+            return tuple(self.value(name, index) for name in self.columns)
+        if isinstance(index, slice):
+            return self.take(np.arange(self._length)[index])
+        return self.take(index)
+    
+    def value(self, name, row):
+        """获取单个单元格的Python值"""
+        kind = self.kinds[name]
+        arr = self._data[name]
+        if kind == "dict":
+            code = arr[row]
+            return None if code < 0 else self._categories[name][code]
+        if kind == "int":
+            mask = self._masks.get(name)
+            return None if mask is not None and mask[row] else int(arr[row])
+        if kind == "float":
+            value = float(arr[row])
+            return None if value != value else value
+        if kind == "datetime":
+            return arr[row].item()
+        return arr[row]
+    
+    def _column_list(self, name, start, stop):
+        """把一段列数据转换为Python值列表"""
+        kind = self.kinds[name]
+        arr = self._data[name][start:stop]
+        if kind == "dict":
+            lookup = np.append(self._categories[name], None)
+            # 编码-1正好取到末尾的None
+            return lookup[arr].tolist()
+        values = arr.tolist()
+        if kind == "int":
+            mask = self._masks.get(name)
+            if mask is not None:
+                values = [None if null else value for value, null in zip(values, mask[start:stop].tolist())]
+        elif kind == "float":
+            values = [None if value != value else value for value in values]
+        return values
+    
+    def column(self, name):
+        """获取列的值数组
+        
+        int/float/datetime列（int列无NULL时）直接返回底层数组，不复制；
+        字典编码列和含NULL的int列返回object数组
+        """
+        kind = self.kinds[name]
+        if kind == "dict":
+            return np.append(self._categories[name], None)[self._data[name]]
+        if kind == "int" and self._masks.get(name) is not None:
+            values = self._data[name].astype(object)
+            values[self._masks[name]] = None
+            return values
+        return self._data[name]
+    
+    def raw(self, name):
+        """获取列的底层存储（数组, NULL掩码, 取值表），不做任何复制"""
+        return self._data[name], self._masks.get(name), self._categories.get(name)
+    
+    def null_mask(self, name):
+        """获取列的NULL掩码（True表示NULL）"""
+        kind = self.kinds[name]
+        arr = self._data[name]
+        if kind == "dict":
+            return arr < 0
+        if kind == "int":
+            mask = self._masks.get(name)
+            return mask if mask is not None else np.zeros(self._length, dtype=bool)
+        if kind == "float":
+            return np.isnan(arr)
+        if kind == "datetime":
+            return np.isnat(arr)
+        return np.fromiter((value is None for value in arr), dtype=bool, count=self._length)
+    
+    def take(self, indices):
+        """按行下标（或布尔掩码）取子表"""
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        data = {name: self._data[name][indices] for name in self.columns}
+        masks = {name: mask[indices] for name, mask in self._masks.items()}
+        return ColumnarTable(self.columns, self.kinds, data, masks, self._categories)
+    
+    def view(self, start, stop):
+        """行区间[start, stop)的子表，列数据为原数组的视图，不复制"""
+        data = {name: self._data[name][start:stop] for name in self.columns}
+        masks = {name: mask[start:stop] for name, mask in self._masks.items()}
+        return ColumnarTable(self.columns, self.kinds, data, masks, self._categories)
+    
+    def put_rows(self, start, table):
+        """用table的行原地覆盖从start开始的行
+        
+        table的列需为本表的列且存储类型相同，字典编码列的取值表需相同（如同一个表take出的子表）
+        """
+        stop = start + len(table)
+        if stop > self._length:
+            raise ValueError("写入的行超出表的范围")
+        for name in table.columns:
+            if table.kinds[name] != self.kinds[name] or (
+                self.kinds[name] == "dict" and table._categories[name] is not self._categories[name]
+            ):
+                raise ValueError(f"列 {name} 的存储类型不一致")
+            self._data[name][start:stop] = table._data[name]
+            if name in self._masks or name in table._masks:
+                if name not in self._masks:
+                    self._masks[name] = np.zeros(self._length, dtype=bool)
+                self._masks[name][start:stop] = table.null_mask(name)
+    
+    def select(self, names):
+        """按列名投影，不复制列数据"""
+        data = {name: self._data[name] for name in names}
+        kinds = {name: self.kinds[name] for name in names}
+        masks = {name: self._masks[name] for name in names if name in self._masks}
+        categories = {name: self._categories[name] for name in names if name in self._categories}
+        return ColumnarTable(names, kinds, data, masks, categories)
+    
+    @classmethod
+    def concat_columns(cls, *tables):
+        """横向拼接行数相同的多个表，列名不能重复，不复制列数据"""
+        columns = []
+        kinds = {}
+        data = {}
+        masks = {}
+        categories = {}
+        for table in tables:
+            if columns and len(table) != len(data[columns[0]]):
+                raise ValueError("拼接的表行数不一致")
+            for name in table.columns:
+                if name in kinds:
+                    raise ValueError(f"列名重复: {name}")
+                columns.append(name)
+                kinds[name] = table.kinds[name]
+                data[name] = table._data[name]
+                if name in table._masks:
+                    masks[name] = table._masks[name]
+                if name in table._categories:
+                    categories[name] = table._categories[name]
+        return cls(columns, kinds, data, masks, categories)
+    
+    @classmethod
+    def concat_rows(cls, *tables):
+        """纵向拼接列相同的多个表；字典编码列的取值表不一致时转为object列"""
+        tables = [table for table in tables if len(table)] or tables[:1]
+        if len(tables) == 1:
+            return tables[0]
+        first = tables[0]
+        kinds = {}
+        data = {}
+        masks = {}
+        categories = {}
+        for name in first.columns:
+            kind = first.kinds[name]
+            same_kind = all(table.kinds[name] == kind for table in tables)
+            if kind == "dict" and same_kind and all(
+                table._categories[name] is first._categories[name]
+                or np.array_equal(table._categories[name], first._categories[name])
+                for table in tables
+            ):
+                categories[name] = first._categories[name]
+            elif not same_kind or kind == "dict":
+                kinds[name] = "object"
+                data[name] = np.concatenate([table.column(name).astype(object) for table in tables])
+                continue
+            kinds[name] = kind
+            data[name] = np.concatenate([table._data[name] for table in tables])
+            if any(name in table._masks for table in tables):
+                masks[name] = np.concatenate([table.null_mask(name) for table in tables])
+        return cls(first.columns, kinds, data, masks, categories)
+    
+    @classmethod
+    def from_objects(cls, arrays):
+        """由 列名 -> object数组 的有序字典构建，各列按object存储"""
+        return cls(list(arrays), {name: "object" for name in arrays}, dict(arrays))
+    
+    def to_pandas(self):
+        """转换为pandas DataFrame，数值/时间列与字典编码列尽量不复制数据"""
+        import pandas as pd
+        
+        series = {}
+        for name in self.columns:
+            kind = self.kinds[name]
+            arr = self._data[name]
+            if kind == "dict":
+                series[name] = pd.Categorical.from_codes(arr, categories=self._categories[name])
+            elif kind == "int" and self._masks.get(name) is not None:
+                series[name] = pd.arrays.IntegerArray(arr, self._masks[name])
+            else:
+                series[name] = arr
+        return pd.DataFrame(series, columns=self.columns, copy=False)
+    
+    def to_arrow(self):
+        """转换为pyarrow Table：字典编码列转为DictionaryArray，NULL转为Arrow的null"""
+        import pyarrow as pa
+        
+        arrays = []
+        for name in self.columns:
+            kind = self.kinds[name]
+            arr = self._data[name]
+            if kind == "dict":
+                arrays.append(pa.DictionaryArray.from_arrays(
+                    pa.array(arr, mask=arr < 0), pa.array(self._categories[name], type=pa.string())
+                ))
+            elif kind == "int":
+                arrays.append(pa.array(arr, mask=self._masks.get(name)))
+            elif kind in ("float", "datetime"):
+                arrays.append(pa.array(arr, from_pandas=True))
+            else:
+                try:
+                    arrays.append(pa.array(arr, from_pandas=True))
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    # 混合类型的列按字符串保存
+                    arrays.append(pa.array([None if value is None else str(value) for value in arr], type=pa.string()))
+        return pa.Table.from_arrays(arrays, names=self.columns)
+    
+    @property
+    def nbytes(self):
+        """估算占用内存字节数（object列按元素引用计）"""
+        total = 0
+        for name in self.columns:
+            total += self._data[name].nbytes
+            if name in self._masks:
+                total += self._masks[name].nbytes
+        return total
+
+class ColumnarBuilder:
+    """逐块追加行数据并构建ColumnarTable
+    
+    每列的存储类型优先使用kinds中给出的类型（如由表结构得出），否则由第一块数据推断
+    """
+    def __init__(self, columns, dict_columns=DICT_ENCODE_COLUMNS, kinds=None):
+        self.columns = list(columns)
+        self.dict_columns = set(dict_columns or ())
+        self.kinds = {name: kind for name, kind in (kinds or {}).items() if name in self.columns}
+        self._parts = {name: [] for name in self.columns}
+        self._mask_parts = {name: [] for name in self.columns}
+        self._mappings = {}
+        self._length = 0
+    
+    @staticmethod
+    def _infer_kind(values):
+        """根据非NULL值的Python类型推断列存储类型"""
+        types = {type(value) for value in values if value is not None}
+        if not types:
+            return "object"
+        if types <= {int, bool}:
+            return "int"
+        if types == {float}:
+            return "float"
+        if types == {datetime.datetime}:
+            return "datetime"
+        if types == {str}:
+            return "str"
+        return "object"
+    
+    def append(self, rows):
+        """追加一块行数据"""
+        if not rows:
+            return
+        count = len(rows)
+        col_values = list(zip(*rows))
+        for idx, name in enumerate(self.columns):
+            values = col_values[idx]
+            if name not in self.kinds:
+                kind = self._infer_kind(values)
+                if kind == "str":
+                    distinct = len(set(values))
+                    if name in self.dict_columns or (count >= 16 and distinct <= count * DICT_ENCODE_RATIO):
+                        kind = "dict"
+                        self._mappings[name] = {}
+                    else:
+                        kind = "object"
+                self.kinds[name] = kind
+            try:
+                arr, mask = self._encode(name, values)
+            except (TypeError, ValueError, OverflowError, AttributeError):
+                # 后续数据与推断类型不符，退化为object列
+                self._demote(name)
+                arr, mask = self._encode(name, values)
+            self._parts[name].append(arr)
+            self._mask_parts[name].append(mask)
+        self._length += count
+    
+    def _encode(self, name, values):
+        kind = self.kinds[name]
+        count = len(values)
+        if kind == "int":
+            has_null = any(value is None for value in values)
+            if has_null:
+                arr = np.array([0 if value is None else value for value in values], dtype=np.int64)
+                mask = np.fromiter((value is None for value in values), dtype=bool, count=count)
+                return arr, mask
+            return np.array(values, dtype=np.int64), None
+        if kind == "float":
+            if any(value is not None and not isinstance(value, float) for value in values):
+                raise TypeError("非浮点值")
+            return np.array([np.nan if value is None else value for value in values], dtype=np.float64), None
+        if kind == "datetime":
+            if any(value is not None and (not isinstance(value, datetime.datetime) or value.tzinfo) for value in values):
+                raise TypeError("非日期时间值")
+            return np.array(values, dtype="datetime64[us]"), None
+        if kind == "dict":
+            mapping = self._mappings[name]
+            if any(value is not None and not isinstance(value, str) for value in values):
+                raise TypeError("非字符串值")
+            codes = np.fromiter(
+                (-1 if value is None else mapping.setdefault(value, len(mapping)) for value in values),
+                dtype=np.int32, count=count
+            )
+            return codes, None
+        arr = np.empty(count, dtype=object)
+        arr[:] = list(values)
+        return arr, None
+    
+    def _demote(self, name):
+        """把已写入的数据转换为object存储"""
+        kind = self.kinds[name]
+        if kind == "object":
+            raise TypeError(f"列 {name} 无法编码")
+        if self._parts[name]:
+            table = ColumnarTable(
+                [name], {name: kind},
+                {name: np.concatenate(self._parts[name])},
+                {name: self._concat_masks(name)} if any(m is not None for m in self._mask_parts[name]) else {},
+                {name: self._categories_of(name)} if kind == "dict" else {}
+            )
+            arr = np.empty(self._length, dtype=object)
+            arr[:] = table._column_list(name, 0, self._length)
+            self._parts[name] = [arr]
+            self._mask_parts[name] = [None]
+        self.kinds[name] = "object"
+        self._mappings.pop(name, None)
+    
+    def _concat_masks(self, name):
+        masks = [
+            mask if mask is not None else np.zeros(len(arr), dtype=bool)
+            for arr, mask in zip(self._parts[name], self._mask_parts[name])
+        ]
+        return np.concatenate(masks)
+    
+    def _categories_of(self, name):
+        categories = np.empty(len(self._mappings[name]), dtype=object)
+        categories[:] = list(self._mappings[name])
+        return categories
+    
+    def finish(self):
+        """生成ColumnarTable"""
+        data = {}
+        masks = {}
+        categories = {}
+        kinds = {}
+        for name in self.columns:
+            kind = self.kinds.get(name, "object")
+            kinds[name] = kind
+            parts = self._parts[name]
+            if not parts:
+                data[name] = np.empty(0, dtype=np.int32 if kind == "dict" else object)
+            elif len(parts) == 1:
+                data[name] = parts[0]
+            else:
+                data[name] = np.concatenate(parts)
+            if any(mask is not None for mask in self._mask_parts[name]):
+                masks[name] = self._concat_masks(name)
+            if kind == "dict":
+                categories[name] = self._categories_of(name)
+        return ColumnarTable(self.columns, kinds, data, masks, categories)
@@ -1,9 +1,19 @@
 import pymysql
 import json
 import os
+import hashlib
+import heapq
 import time
-from PyQt5.QtWidgets import QMessageBox
-from PyQt5.QtCore import QDateTime, QDate
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+from columnar import ColumnarTable, ColumnarBuilder, DICT_ENCODE_COLUMNS
+from schema_cache import schema_cache, column_kinds
+from snapshot_store import SnapshotStore
+from query_stats import query_stats, traced, InstrumentedCursor, InstrumentedSSCursor
 
 class DBConfig:
     """数据库配置管理类，负责配置的保存和加载"""
@@ -26,7 +36,13 @@ class DBConfig:
             "database": "",
             "table": "ai_device",
             "last_csv_path": "",
-            "export_columns": []
+            "export_columns": [],
+            "pool_size": 4,
+            "pool_idle_timeout": 300,
+            "snapshot_path": "db_snapshot.sqlite",
+            "fetch_partitions": 1,
+            "partition_by": "date",
+            "query_log_interval": 60
         }
     
     @staticmethod
@@ -40,83 +56,830 @@ class DBConfig:
             print(f"保存配置失败: {e}")
             return False
 
+class ConnectionPool:
+    """MySQL连接池，复用已建立的连接，避免每次操作都重新握手认证
+    
+    - 取用前对空闲较久的连接做ping健康检查，失效则自动重连
+    - 空闲超过 idle_timeout 秒的连接会被回收
+    - 统计命中(hits)、新建(misses)、等待(waits)次数，便于观察复用效果
+    """
+    def __init__(self, connect_kwargs, size=4, idle_timeout=300, ping_interval=5, wait_timeout=30):
+        self.connect_kwargs = dict(connect_kwargs)
+        # 连接池内的连接统一使用自动提交，避免长期持有的事务快照读到旧数据
+        self.connect_kwargs.setdefault("autocommit", True)
+        # 所有语句经过带统计的游标执行
+        self.connect_kwargs.setdefault("cursorclass", InstrumentedCursor)
+        self.size = max(1, int(size))
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self.wait_timeout = wait_timeout
+        
+        self._idle = deque()  # 空闲连接：(conn, 最后使用时间)
+        self._created = 0  # 当前已创建（含借出）的连接数
+        self._cond = threading.Condition()
+        self._closed = False
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "reconnects": 0,
+            "evictions": 0
+        }
+    
+    def _new_connection(self):
+        return pymysql.connect(**self.connect_kwargs)
+    
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _evict_idle_locked(self):
+        """回收空闲超时的连接（调用方需持有锁）"""
+        if not self.idle_timeout:
+            return
+        now = time.monotonic()
+        # 最久未用的连接在队列左侧
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._created -= 1
+            self.stats["evictions"] += 1
+            self._close_quietly(conn)
+    
+    def acquire(self, timeout=None):
+        """借出一个可用连接，池满时等待其他连接归还"""
+        timeout = self.wait_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        conn = None
+        last_used = None
+        
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("连接池已关闭")
+            waited = False
+            wait_start = time.monotonic()
+            while True:
+                self._evict_idle_locked()
+                if self._idle:
+                    # 后进先出，优先使用最“热”的连接
+                    conn, last_used = self._idle.pop()
+                    self.stats["hits"] += 1
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    self.stats["misses"] += 1
+                    break
+                
+                if not waited:
+                    waited = True
+                    self.stats["waits"] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"等待数据库连接超时（{timeout}秒）")
+                self._cond.wait(remaining)
+            if waited:
+                self.stats["wait_time"] += time.monotonic() - wait_start
+        
+        try:
+            if conn is None:
+                return self._new_connection()
+            
+            # 空闲较久的连接先ping一下，失效则重连
+            if time.monotonic() - last_used >= self.ping_interval:
+                try:
+                    conn.ping(reconnect=False)
+                except Exception:
+                    self._close_quietly(conn)
+                    conn = self._new_connection()
+                    with self._cond:
+                        self.stats["reconnects"] += 1
+            return conn
+        except Exception:
+            # 建立连接失败，归还名额
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+    
+    def release(self, conn, broken=False):
+        """归还连接，broken为True或连接已断开时直接关闭"""
+        with self._cond:
+            if broken or self._closed or not conn.open:
+                self._created -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    @contextmanager
+    def connection(self, timeout=None):
+        """以上下文管理器方式借用连接，出现连接级错误时丢弃该连接"""
+        conn = self.acquire(timeout)
+        broken = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.release(conn, broken)
+    
+    def get_stats(self):
+        """获取连接池统计信息"""
+        with self._cond:
+            stats = dict(self.stats)
+            stats["size"] = self.size
+            stats["created"] = self._created
+            stats["idle"] = len(self._idle)
+            total = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
+    
+    def close_all(self):
+        """关闭连接池中的所有空闲连接，借出的连接归还时关闭"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._created -= 1
+                self._close_quietly(conn)
+            self._cond.notify_all()
+
+class RefreshCancelled(Exception):
+    """数据刷新被用户取消"""
+
+def to_date_str(value):
+    """把日期参数转换为yyyy-MM-dd字符串，支持QDate、date/datetime和字符串"""
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            raise ValueError(f"日期格式无效: {value}，应为yyyy-MM-dd")
+    if hasattr(value, "toString"):
+        return value.toString("yyyy-MM-dd")
+    return value.strftime("%Y-%m-%d")
+
+def _create_date_key(create_idx):
+    """行按create_date排序的键，配合reverse=True时NULL排在最后（与MySQL的DESC一致）"""
+    return lambda row: (row[create_idx] is not None, row[create_idx])
+
 class DBManager:
     """数据库管理类，负责数据库连接和操作"""
+    # 增量刷新按主键补取漏掉的行时，每条IN查询的主键数
+    DELTA_ID_BATCH = 1000
+    
     def __init__(self, config):
         self.config = config
+        self.pool = ConnectionPool(
+            {
+                "host": config["host"],
+                "port": config["port"],
+                "user": config["user"],
+                "password": config["password"],
+                "database": config["database"]
+            },
+            size=config.get("pool_size", 4),
+            idle_timeout=config.get("pool_idle_timeout", 300)
+        )
         self.cache = {
             "data": None,
             "columns": None,
             "last_refresh": None,
             "record_count": 0
         }
+        # 增量刷新状态：查询条件、水位线、每行内容摘要
+        self._delta_state = None
+        # 正在执行查询的连接线程ID，用于KILL QUERY
+        self._active_queries = set()
+        self._active_lock = threading.Lock()
+        # 本地快照，启动时先显示上次的数据；snapshot_path为空时不保存
+        snapshot_path = config.get("snapshot_path", "db_snapshot.sqlite")
+        self.snapshots = SnapshotStore(snapshot_path) if snapshot_path else None
+        self._saved_snapshot_key = None
+        # 定期输出SQL耗时统计，query_stats.snapshot()可获取完整数据
+        query_stats.start_periodic_log(config.get("query_log_interval", 60))
     
     def test_connection(self):
         """测试数据库连接"""
         try:
-            conn = pymysql.connect(
-                host=self.config["host"],
-                port=self.config["port"],
-                user=self.config["user"],
-                password=self.config["password"],
-                database=self.config["database"]
-            )
-            conn.close()
+            with self.pool.connection() as conn:
+                conn.ping(reconnect=False)
             return True, "连接成功"
         except Exception as e:
             return False, str(e)
     
-    def refresh_data(self, date_from, date_to, parent=None):
-        """刷新数据库数据，带缓存机制"""
+    def get_pool_stats(self):
+        """获取连接池命中/新建/等待统计"""
+        return self.pool.get_stats()
+    
+    def close(self):
+        """关闭连接池"""
+        self.pool.close_all()
+    
+    @traced("DBManager.refresh_data")
+    def refresh_data(self, date_from, date_to, incremental=True,
+                     stream=False, chunk_size=5000, progress_callback=None, cancel_event=None,
+                     chunk_callback=None, partitions=None, partition_by=None):
+        """刷新数据库数据，带缓存机制，date_from/date_to可以是QDate、date或yyyy-MM-dd字符串
+        
+        incremental为True且查询条件与上次相同时，只拉取上次刷新后新增或修改的行并合并到缓存；
+        stream为True时全量查询使用服务器端游标分块读取，可通过progress_callback(行数, 字节数)
+        获取进度，通过chunk_callback(列名, 行块)逐块拿到数据，通过cancel_event（threading.Event）
+        中途取消
+        
+        partitions大于1（或为"auto"，按服务器空闲连接数决定）时，全量查询按partition_by
+        （"date"按时间等分，"id"按主键区间等分）拆成多个子查询，通过连接池并发执行后按
+        create_date DESC合并；未指定时使用配置中的fetch_partitions/partition_by
+        """
         try:
-            # 连接数据库
-            conn = pymysql.connect(
-                host=self.config["host"],
-                port=self.config["port"],
-                user=self.config["user"],
-                password=self.config["password"],
-                database=self.config["database"]
-            )
-            
             # 构建查询SQL
             table_name = self.config["table"]
-            date_from_str = date_from.toString("yyyy-MM-dd")
-            date_to_str = date_to.toString("yyyy-MM-dd")
+            date_from_str = to_date_str(date_from)
+            date_to_str = to_date_str(date_to)
+            query_sql = f"SELECT * FROM {table_name} WHERE create_date BETWEEN '{date_from_str}' AND '{date_to_str}' ORDER BY create_date DESC"
+            data = None
+            delta = None
+            plan = None
+            if partitions is None:
+                partitions = self.config.get("fetch_partitions", 1)
+            if partition_by is None:
+                partition_by = self.config.get("partition_by", "date")
             
-            # 查询表结构获取字段名
-            cursor = conn.cursor()
-            cursor.execute(f"DESCRIBE {table_name}")
-            columns = [column[0] for column in cursor.fetchall()]
+            # 从连接池借用连接
+            with self.pool.connection() as conn, self._track_query(conn):
+                # 表结构走共享缓存，结构未变时不再每次DESCRIBE
+                schema = schema_cache.get(conn, table_name)
+                columns = list(schema["columns"])
+                kinds = column_kinds(schema)
+                
+                with conn.cursor() as cursor:
+                    range_key = (table_name, date_from_str, date_to_str, tuple(columns))
+                    if incremental and self._delta_state and self._delta_state["range_key"] == range_key:
+                        rows, delta = self._fetch_delta(cursor, table_name, columns, date_from_str, date_to_str)
+                        data = ColumnarTable.from_rows(columns, rows, kinds=kinds)
+                    elif partitions != 1 and "create_date" in columns:
+                        if partitions == "auto":
+                            partitions = self._auto_partitions(cursor)
+                        if partitions > 1:
+                            plan = self._plan_partitions(
+                                cursor, table_name, date_from_str, date_to_str, partitions, partition_by
+                            )
+                    if data is None and plan is None and not stream:
+                        # 查询数据，按create_date排序（最新的在前）
+                        cursor.execute(query_sql)
+                        rows = cursor.fetchall()
+                        state = self._new_delta_state(range_key, columns)
+                        self._track_rows(state, rows)
+                        data = ColumnarTable.from_rows(columns, rows, kinds=kinds)
+                        del rows
             
-            # 查询数据，按create_date排序（最新的在前）
-            query_sql = f"SELECT * FROM {table_name} WHERE create_date BETWEEN '{date_from_str}' AND '{date_to_str}' ORDER BY create_date DESC"
-            cursor.execute(query_sql)
-            data = cursor.fetchall()
+            if data is None and plan is not None:
+                # 分区并发读取，子查询各自借用连接池中的连接
+                rows = self._fetch_partitions(
+                    table_name, plan, columns.index("create_date"),
+                    progress_callback=progress_callback, cancel_event=cancel_event
+                )
+                state = self._new_delta_state(range_key, columns)
+                self._track_rows(state, rows)
+                data = ColumnarTable.from_rows(columns, rows, kinds=kinds)
+                del rows
+            
+            if data is None:
+                # 流式读取，结果集不在客户端整体缓冲，每块转换为列存后即释放
+                state = self._new_delta_state(range_key, columns)
+                builder = ColumnarBuilder(columns, kinds=kinds)
+                for chunk in self.iter_query(query_sql, chunk_size=chunk_size,
+                                             progress_callback=progress_callback,
+                                             cancel_event=cancel_event):
+                    builder.append(chunk)
+                    self._track_rows(state, chunk)
+                    if chunk_callback:
+                        chunk_callback(columns, chunk)
+                data = builder.finish()
+            
+            if delta is None:
+                # 全量刷新，替换增量状态；结果整体替换缓存，不统计删除的行
+                delta = {"inserted": len(data), "updated": 0, "deleted": 0}
+                self._delta_state = state
             
-            # 计算更新的数据量
-            old_count = self.cache["record_count"]
             new_count = len(data)
-            changed_count = abs(new_count - old_count)
             
             # 更新缓存
             self.cache = {
                 "data": data,
                 "columns": columns,
-                "last_refresh": QDateTime.currentDateTime().toString("yyyy-MM-dd HH:mm:ss"),
-                "record_count": new_count
+                "column_types": schema["types"],
+                "last_refresh": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "record_count": new_count,
+                "delta": delta
             }
+            self.save_snapshot(date_from_str, date_to_str)
             
-            # 关闭连接
-            cursor.close()
+            return True, (
+                f"成功加载 {new_count} 条数据，新增 {delta['inserted']} 条，"
+                f"更新 {delta['updated']} 条，删除 {delta['deleted']} 条"
+            ), self.cache
+        
+        except RefreshCancelled:
+            return False, "数据加载已取消", None
+        except Exception as e:
+            if cancel_event is not None and cancel_event.is_set():
+                # 查询被KILL QUERY中断
+                return False, "数据加载已取消", None
+            # 出错后下次强制全量刷新
+            self._delta_state = None
+            return False, f"加载数据失败：{str(e)}", None
+    
+    def load_snapshot(self, date_from=None, date_to=None):
+        """加载本地快照到缓存，并恢复增量刷新状态，之后的刷新只需拉取变化的行
+        
+        不指定日期范围时加载该表最近保存的快照，缓存中的date_from/date_to给出其日期范围
+        """
+        if self.snapshots is None:
+            return False, "未启用本地快照", None
+        if date_from is None or date_to is None:
+            latest = self.snapshots.latest_range(self.config)
+            if latest is None:
+                return False, "没有可用的本地快照", None
+            date_from_str, date_to_str = latest
+        else:
+            date_from_str = to_date_str(date_from)
+            date_to_str = to_date_str(date_to)
+        key = SnapshotStore.make_key(self.config, date_from_str, date_to_str)
+        try:
+            cache, delta_state = self.snapshots.load(key)
+        except Exception as e:
+            print(f"加载本地快照失败: {e}")
+            return False, f"加载本地快照失败：{str(e)}", None
+        if cache is None:
+            return False, "没有可用的本地快照", None
+        
+        cache["date_from"] = date_from_str
+        cache["date_to"] = date_to_str
+        self.cache = cache
+        self._delta_state = delta_state
+        self._saved_snapshot_key = key
+        return True, f"已加载本地快照 {cache['record_count']} 条数据（{cache['last_refresh']}）", self.cache
+    
+    def save_snapshot(self, date_from_str, date_to_str):
+        """把当前缓存保存为本地快照，数据没有变化时跳过"""
+        if self.snapshots is None or self.cache["data"] is None:
+            return
+        key = SnapshotStore.make_key(self.config, date_from_str, date_to_str)
+        delta = self.cache.get("delta") or {}
+        if key == self._saved_snapshot_key and not any(delta.values()):
+            return
+        try:
+            self.snapshots.save(key, self.cache, self._delta_state)
+            self._saved_snapshot_key = key
+        except Exception as e:
+            # 快照只是加速启动，保存失败不影响本次刷新
+            print(f"保存本地快照失败: {e}")
+    
+    def _auto_partitions(self, cursor):
+        """按服务器的空闲连接余量决定分区数，不超过连接池大小
+        
+        只使用 max_connections - Threads_connected 的一半，并扣除正在执行的线程数，
+        避免并发读取挤占其他客户端
+        """
+        cursor.execute("SHOW VARIABLES LIKE 'max_connections'")
+        max_connections = int(cursor.fetchone()[1])
+        cursor.execute("SHOW GLOBAL STATUS WHERE Variable_name IN ('Threads_connected', 'Threads_running')")
+        status = {name: int(value) for name, value in cursor.fetchall()}
+        spare = (max_connections - status.get("Threads_connected", 0)) // 2 - status.get("Threads_running", 0)
+        return max(1, min(self.pool.size, spare))
+    
+    def _plan_partitions(self, cursor, table_name, date_from_str, date_to_str, partitions, partition_by="date"):
+        """把 create_date BETWEEN 起止日期 的查询拆成若干互不重叠的子查询条件 (where, params)"""
+        if partition_by == "id":
+            # id是varchar，分界点按服务器端的排序（列的排序规则）取第k行，比较也在服务器端进行
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {table_name} WHERE create_date BETWEEN %s AND %s",
+                (date_from_str, date_to_str)
+            )
+            total = int(cursor.fetchone()[0])
+            if not total:
+                return []
+            bounds = []
+            for i in range(1, partitions):
+                cursor.execute(
+                    f"SELECT id FROM {table_name} WHERE create_date BETWEEN %s AND %s "
+                    f"ORDER BY id LIMIT 1 OFFSET %s",
+                    (date_from_str, date_to_str, total * i // partitions)
+                )
+                row = cursor.fetchone()
+                if row is not None and (not bounds or row[0] != bounds[-1]):
+                    bounds.append(row[0])
+            plan = []
+            for i in range(len(bounds) + 1):
+                where = "create_date BETWEEN %s AND %s"
+                params = [date_from_str, date_to_str]
+                if i > 0:
+                    where += " AND id >= %s"
+                    params.append(bounds[i - 1])
+                if i < len(bounds):
+                    where += " AND id < %s"
+                    params.append(bounds[i])
+                plan.append((where, tuple(params)))
+            return plan
+        
+        # 按时间等分；与BETWEEN一致，结束日期取当天0点且包含在内
+        start = datetime.strptime(date_from_str, "%Y-%m-%d")
+        end = datetime.strptime(date_to_str, "%Y-%m-%d")
+        if end <= start:
+            return [("create_date BETWEEN %s AND %s", (date_from_str, date_to_str))]
+        step = (end - start) / partitions
+        bounds = [start + step * i for i in range(partitions)] + [end]
+        plan = []
+        for i in range(partitions):
+            upper_op = "<=" if i == partitions - 1 else "<"
+            plan.append((
+                f"create_date >= %s AND create_date {upper_op} %s",
+                (bounds[i], bounds[i + 1])
+            ))
+        return plan
+    
+    def _fetch_partitions(self, table_name, plan, create_idx, progress_callback=None, cancel_event=None):
+        """并发执行分区子查询，按 create_date DESC 归并为一个行列表"""
+        operation = query_stats.current_operation()
+        
+        def fetch(where, params):
+            if cancel_event is not None and cancel_event.is_set():
+                raise RefreshCancelled("查询已取消")
+            with query_stats.operation(operation), self.pool.connection() as conn, self._track_query(conn):
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        f"SELECT * FROM {table_name} WHERE {where} ORDER BY create_date DESC", params
+                    )
+                    return cursor.fetchall()
+        
+        if not plan:
+            return []
+        results = []
+        rows_done = 0
+        bytes_done = 0
+        with ThreadPoolExecutor(max_workers=min(len(plan), self.pool.size)) as executor:
+            futures = [executor.submit(fetch, where, params) for where, params in plan]
+            try:
+                for future in as_completed(futures):
+                    rows = future.result()
+                    results.append(rows)
+                    if rows:
+                        rows_done += len(rows)
+                        bytes_done += self._estimate_row_bytes(rows[0]) * len(rows)
+                    if progress_callback:
+                        progress_callback(rows_done, bytes_done)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        
+        # 每个分区已按create_date降序，多路归并即得到整体顺序
+        return list(heapq.merge(*results, key=_create_date_key(create_idx), reverse=True))
+    
+    def iter_query(self, sql, params=None, chunk_size=5000, progress_callback=None, cancel_event=None):
+        """使用服务器端游标(SSCursor)流式执行查询，按chunk_size分块产出行
+        
+        每读完一块调用progress_callback(累计行数, 估算字节数)；cancel_event被设置后抛出
+        RefreshCancelled。未读完的结果集无法复用，取消或中途停止时该连接会被直接丢弃
+        """
+        conn = self.pool.acquire()
+        broken = True
+        try:
+            with self._track_query(conn):
+                cursor = conn.cursor(InstrumentedSSCursor)
+                cursor.execute(sql, params)
+                rows_done = 0
+                bytes_done = 0
+                while True:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise RefreshCancelled("查询已取消")
+                    chunk = cursor.fetchmany(chunk_size)
+                    if not chunk:
+                        break
+                    rows_done += len(chunk)
+                    bytes_done += self._estimate_row_bytes(chunk[0]) * len(chunk)
+                    if progress_callback:
+                        progress_callback(rows_done, bytes_done)
+                    yield chunk
+                cursor.close()
+            broken = False
+        except pymysql.err.Error:
+            if cancel_event is not None and cancel_event.is_set():
+                # 查询被KILL QUERY中断
+                raise RefreshCancelled("查询已取消")
+            raise
+        finally:
+            self.pool.release(conn, broken)
+    
+    @contextmanager
+    def _track_query(self, conn):
+        """登记正在执行查询的连接线程ID，供kill_running_queries终止"""
+        thread_id = conn.thread_id()
+        with self._active_lock:
+            self._active_queries.add(thread_id)
+        try:
+            yield
+        finally:
+            with self._active_lock:
+                self._active_queries.discard(thread_id)
+    
+    def kill_running_queries(self):
+        """在服务器端终止本管理器正在执行的查询（KILL QUERY），返回终止的数量
+        
+        使用独立的新连接发送KILL，不受连接池占满的影响
+        """
+        with self._active_lock:
+            thread_ids = list(self._active_queries)
+        if not thread_ids:
+            return 0
+        
+        conn = pymysql.connect(**self.pool.connect_kwargs)
+        try:
+            with conn.cursor() as cursor:
+                for thread_id in thread_ids:
+                    try:
+                        cursor.execute("KILL QUERY %s", (thread_id,))
+                    except pymysql.err.Error:
+                        # 查询已结束或线程已不存在
+                        pass
+        finally:
             conn.close()
-            
-            return True, f"成功加载 {new_count} 条数据，更新了 {changed_count} 条", self.cache
+        return len(thread_ids)
+    
+    @staticmethod
+    def _estimate_row_bytes(row):
+        """按一行的字段内容粗略估算传输字节数"""
+        size = 0
+        for value in row:
+            if value is None:
+                size += 1
+            elif isinstance(value, (str, bytes)):
+                size += len(value)
+            else:
+                size += 8
+        return size
+    
+    @staticmethod
+    def _row_hash(row):
+        """计算行内容摘要，用于判断行是否真正发生变化"""
+        return hashlib.blake2b(repr(row).encode("utf-8"), digest_size=8).digest()
+    
+    @staticmethod
+    def _row_watermark(row, create_idx, update_idx):
+        """取行的create_date/update_date中较晚的一个作为水位"""
+        marks = [row[i] for i in (create_idx, update_idx) if i is not None and row[i] is not None]
+        return max(marks) if marks else None
+    
+    def _new_delta_state(self, range_key, columns):
+        """为全量刷新创建新的增量状态：水位线和每行摘要"""
+        if "id" not in columns or "create_date" not in columns:
+            # 没有主键或创建时间字段时无法增量刷新
+            return None
+        
+        return {
+            "range_key": range_key,
+            "id_idx": columns.index("id"),
+            "create_idx": columns.index("create_date"),
+            "update_idx": columns.index("update_date") if "update_date" in columns else None,
+            "watermark": None,
+            "hashes": {}
+        }
+    
+    def _track_rows(self, state, rows):
+        """记录一批行的摘要并推进水位线"""
+        if state is None:
+            return
+        id_idx = state["id_idx"]
+        create_idx = state["create_idx"]
+        update_idx = state["update_idx"]
+        hashes = state["hashes"]
+        watermark = state["watermark"]
+        for row in rows:
+            hashes[row[id_idx]] = self._row_hash(row)
+            mark = self._row_watermark(row, create_idx, update_idx)
+            if mark is not None and (watermark is None or mark > watermark):
+                watermark = mark
+        state["watermark"] = watermark
+    
+    def _fetch_delta(self, cursor, table_name, columns, date_from_str, date_to_str):
+        """增量拉取：只查询水位线之后新增/修改的行，再按主键合并到缓存"""
+        state = self._delta_state
+        id_idx = state["id_idx"]
+        create_idx = state["create_idx"]
+        update_idx = state["update_idx"]
+        hashes = state["hashes"]
+        watermark = state["watermark"]
+        
+        # 只取主键，用于识别已删除（或移出日期范围）的行
+        cursor.execute(
+            f"SELECT id FROM {table_name} WHERE create_date BETWEEN %s AND %s",
+            (date_from_str, date_to_str)
+        )
+        current_ids = {row[0] for row in cursor.fetchall()}
+        
+        # 水位线用>=，同一秒内写入的行不会漏掉，未变化的行通过摘要过滤
+        if watermark is None:
+            changed_rows = ()
+            if current_ids:
+                cursor.execute(
+                    f"SELECT * FROM {table_name} WHERE create_date BETWEEN %s AND %s",
+                    (date_from_str, date_to_str)
+                )
+                changed_rows = cursor.fetchall()
+        elif update_idx is not None:
+            cursor.execute(
+                f"SELECT * FROM {table_name} WHERE create_date BETWEEN %s AND %s "
+                f"AND (create_date >= %s OR update_date >= %s)",
+                (date_from_str, date_to_str, watermark, watermark)
+            )
+            changed_rows = cursor.fetchall()
+        else:
+            cursor.execute(
+                f"SELECT * FROM {table_name} WHERE create_date BETWEEN %s AND %s AND create_date >= %s",
+                (date_from_str, date_to_str, watermark)
+            )
+            changed_rows = cursor.fetchall()
+        
+        # 晚于上次刷新才提交、但时间早于水位线的行不会被上面的查询取到，
+        # 它们的主键已在current_ids中却没有摘要，按主键补取
+        fetched_ids = {row[id_idx] for row in changed_rows}
+        missing_ids = [row_id for row_id in current_ids if row_id not in hashes and row_id not in fetched_ids]
+        if missing_ids:
+            changed_rows = list(changed_rows)
+            for start in range(0, len(missing_ids), self.DELTA_ID_BATCH):
+                batch = missing_ids[start:start + self.DELTA_ID_BATCH]
+                cursor.execute(
+                    f"SELECT * FROM {table_name} WHERE id IN ({', '.join(['%s'] * len(batch))})",
+                    batch
+                )
+                changed_rows.extend(cursor.fetchall())
         
+        rows_by_id = {row[id_idx]: row for row in (self.cache["data"] or ())}
+        inserted = updated = 0
+        for row in changed_rows:
+            row_id = row[id_idx]
+            row_hash = self._row_hash(row)
+            old_hash = hashes.get(row_id)
+            if old_hash == row_hash:
+                continue
+            if old_hash is None:
+                inserted += 1
+            else:
+                updated += 1
+            hashes[row_id] = row_hash
+            rows_by_id[row_id] = row
+            mark = self._row_watermark(row, create_idx, update_idx)
+            if mark is not None and (watermark is None or mark > watermark):
+                watermark = mark
+        
+        deleted_ids = [row_id for row_id in rows_by_id if row_id not in current_ids]
+        for row_id in deleted_ids:
+            del rows_by_id[row_id]
+            hashes.pop(row_id, None)
+        state["watermark"] = watermark
+        
+        # 保持与全量查询一致的 create_date DESC 顺序
+        data = sorted(rows_by_id.values(), key=_create_date_key(create_idx), reverse=True)
+        return data, {"inserted": inserted, "updated": updated, "deleted": len(deleted_ids)}
+    
+    @traced("DBManager.write_back")
+    def write_back(self, assignments, key_column="id", dry_run=True, batch_size=10000,
+                   progress_callback=None, cancel_event=None):
+        """把匹配得到的 (主键, device_code, password) 批量写回数据表，返回 (成功, 消息, 差异)
+        
+        先把全部赋值批量插入临时表，再与数据表JOIN统计差异；dry_run为True时只统计差异，
+        不修改数据。写入时按临时表的插入序号(seq)分批执行 UPDATE ... JOIN，全部在一个
+        事务中，全部成功后一次提交，出错或取消时整体回滚。progress_callback(已更新行数, 总行数)
+        """
+        table_name = self.config["table"]
+        temp_table = "_write_back"
+        keys_table = "_write_back_keys"
+        try:
+            with self.pool.connection() as conn, self._track_query(conn):
+                with conn.cursor() as cursor:
+                    # 临时表的列类型与数据表一致
+                    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {temp_table}")
+                    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {keys_table}")
+                    # （ALTER TABLE会隐式提交，主键在建表时给出）
+                    # seq按插入顺序编号，分批更新按seq划分，不依赖主键列的排序规则
+                    cursor.execute(
+                        f"CREATE TEMPORARY TABLE {temp_table} ("
+                        f"seq BIGINT NOT NULL AUTO_INCREMENT, PRIMARY KEY ({key_column}), UNIQUE KEY (seq)) "
+                        f"SELECT {key_column}, device_code, password FROM {table_name} WHERE 1 = 0"
+                    )
+                    try:
+                        diff = self._load_write_back(cursor, table_name, temp_table, keys_table, key_column,
+                                                     assignments, batch_size, cancel_event)
+                        if dry_run or not diff["changed"]:
+                            return True, self._write_back_message(diff, dry_run), diff
+                        
+                        cursor.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {temp_table}")
+                        last_seq = int(cursor.fetchone()[0])
+                        total = len(assignments)
+                        updated = 0
+                        # 连接池的连接是自动提交的，显式关闭后所有UPDATE在同一事务中
+                        conn.autocommit(False)
+                        try:
+                            for start in range(0, last_seq, batch_size):
+                                if cancel_event is not None and cancel_event.is_set():
+                                    raise RefreshCancelled("写回已取消")
+                                updated += cursor.execute(
+                                    f"UPDATE {table_name} t JOIN {temp_table} w ON t.{key_column} = w.{key_column} "
+                                    f"SET t.device_code = w.device_code, t.password = w.password "
+                                    f"WHERE w.seq > %s AND w.seq <= %s",
+                                    (start, start + batch_size)
+                                )
+                                if progress_callback:
+                                    progress_callback(min(start + batch_size, total), total)
+                            conn.commit()
+                        except BaseException:
+                            conn.rollback()
+                            raise
+                        finally:
+                            # 归还连接池前恢复自动提交
+                            conn.autocommit(self.pool.connect_kwargs["autocommit"])
+                        diff["updated"] = updated
+                        return True, self._write_back_message(diff, dry_run=False), diff
+                    finally:
+                        # 连接会回到连接池，临时表必须删除
+                        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {temp_table}")
+                        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {keys_table}")
+        except RefreshCancelled:
+            return False, "写回已取消，数据未修改", None
         except Exception as e:
-            error_msg = f"加载数据失败：{str(e)}"
-            if parent:
-                QMessageBox.critical(parent, "错误", error_msg)
-            return False, error_msg, None
+            if cancel_event is not None and cancel_event.is_set():
+                # 语句被KILL QUERY中断
+                return False, "写回已取消，数据未修改", None
+            return False, f"写回数据库失败，数据未修改：{str(e)}", None
+    
+    def _load_write_back(self, cursor, table_name, temp_table, keys_table, key_column, assignments,
+                         batch_size, cancel_event):
+        """把赋值分批插入临时表并统计与数据表的差异"""
+        for start in range(0, len(assignments), batch_size):
+            if cancel_event is not None and cancel_event.is_set():
+                raise RefreshCancelled("写回已取消")
+            # executemany会合并为多行INSERT
+            cursor.executemany(
+                f"INSERT INTO {temp_table} ({key_column}, device_code, password) VALUES (%s, %s, %s)",
+                assignments[start:start + batch_size]
+            )
+        
+        cursor.execute(
+            f"SELECT COUNT(*), "
+            f"COALESCE(SUM(t.device_code <=> w.device_code AND t.password <=> w.password), 0), "
+            f"COALESCE(SUM(NOT (t.device_code <=> w.device_code AND t.password <=> w.password) "
+            f"AND (t.device_code IS NOT NULL OR t.password IS NOT NULL)), 0) "
+            f"FROM {temp_table} w JOIN {table_name} t ON t.{key_column} = w.{key_column}"
+        )
+        found, unchanged, overwrite = (int(value) for value in cursor.fetchone())
+        # 要写入的device_code在更新后仍被其他行使用：表中不在本次写回范围内的行，
+        # 或本次写回中的其他行（临时表不能在一条语句中引用两次，另建一张主键表）
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {keys_table} (PRIMARY KEY ({key_column})) "
+            f"SELECT {key_column} FROM {temp_table}"
+        )
+        cursor.execute(
+            f"SELECT COUNT(*) FROM {temp_table} w JOIN {table_name} t "
+            f"ON t.device_code = w.device_code AND t.{key_column} <> w.{key_column} "
+            f"LEFT JOIN {keys_table} k ON k.{key_column} = t.{key_column} WHERE k.{key_column} IS NULL"
+        )
+        conflicts = int(cursor.fetchone()[0])
+        code_counts = Counter(code for _, code, _ in assignments)
+        conflicts += sum(count for count in code_counts.values() if count > 1)
+        cursor.execute(
+            f"SELECT t.{key_column}, t.device_code, w.device_code, t.password, w.password "
+            f"FROM {temp_table} w JOIN {table_name} t ON t.{key_column} = w.{key_column} "
+            f"WHERE NOT (t.device_code <=> w.device_code AND t.password <=> w.password) "
+            f"ORDER BY w.{key_column} LIMIT 20"
+        )
+        return {
+            "total": len(assignments),
+            "found": found,
+            "missing": len(assignments) - found,
+            "unchanged": unchanged,
+            "changed": found - unchanged,
+            "overwrite": overwrite,
+            "conflicts": conflicts,
+            "samples": [tuple(row) for row in cursor.fetchall()],
+            "updated": 0
+        }
+    
+    @staticmethod
+    def _write_back_message(diff, dry_run):
+        summary = (
+            f"共 {diff['total']} 条：需更新 {diff['changed']} 条（其中覆盖已有值 {diff['overwrite']} 条），"
+            f"无变化 {diff['unchanged']} 条，表中不存在 {diff['missing']} 条，"
+            f"device_code与其他行重复 {diff['conflicts']} 条"
+        )
+        if dry_run:
+            return "预览（未修改数据）：" + summary
+        if not diff["changed"]:
+            return "没有需要更新的数据。" + summary
+        return f"已写回 {diff['updated']} 条。" + summary
     
     def get_cached_data(self):
         """获取缓存的数据"""
@@ -130,48 +893,216 @@ class DBManager:
             "last_refresh": None,
             "record_count": 0
         }
+        self._delta_state = None
+        self._saved_snapshot_key = None
 
 class DataProcessor:
     """数据处理类，负责数据匹配和转换"""
+    # CSV中参与匹配的列，放在结果的最前面
+    CSV_MATCH_COLUMNS = ["password", "device_code"]
+    # 合法密码的格式（与生成的随机密码一致：字母和数字）
+    PASSWORD_PATTERN = r"[A-Za-z0-9]{4,32}"
+    # 读取CSV时每块的字节数
+    CSV_BLOCK_SIZE = 4 * 1024 * 1024
+    
     @staticmethod
-    def match_data(db_data, db_columns, csv_data, disabled_rows):
-        """匹配数据库数据和CSV数据"""
+    def read_csv_header(path):
+        """读取CSV的表头列名"""
+        import csv
+        
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            return next(csv.reader(f), [])
+    
+    @staticmethod
+    def load_csv(path, extra_columns=None, progress_callback=None, cancel_event=None):
+        """读取本地CSV：只读取password、device_code和extra_columns中的列，全部按字符串读取
+        
+        编码类字段保持原样（如"0001"不会变成整数）。优先使用pyarrow的流式CSV读取器，
+        每读完一块调用progress_callback(行数, 字节数)；未安装pyarrow时用pandas分块读取
+        """
+        import pandas as pd
+        
+        header = DataProcessor.read_csv_header(path)
+        missing = [col for col in DataProcessor.CSV_MATCH_COLUMNS if col not in header]
+        if missing:
+            raise ValueError("CSV文件必须包含 'password' 和 'device_code' 列")
+        columns = list(DataProcessor.CSV_MATCH_COLUMNS)
+        columns += [col for col in (extra_columns or []) if col in header and col not in columns]
+        
+        rows_done = 0
+        bytes_done = 0
         try:
-            # 筛选启用的数据库记录
-            enabled_db_rows = [
-                row for idx, row in enumerate(db_data) 
-                if idx not in disabled_rows
-            ]
-            
-            # 按顺序匹配，有多少匹配多少
-            match_count = min(len(enabled_db_rows), len(csv_data))
+            import pyarrow as pa
+            import pyarrow.csv as pa_csv
+        except ImportError:
+            pa_csv = None
+        
+        if pa_csv is not None:
+            reader = pa_csv.open_csv(
+                path,
+                read_options=pa_csv.ReadOptions(block_size=DataProcessor.CSV_BLOCK_SIZE),
+                convert_options=pa_csv.ConvertOptions(
+                    include_columns=columns,
+                    column_types={col: pa.string() for col in columns},
+                    strings_can_be_null=True
+                )
+            )
+            batches = []
+            for batch in reader:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RefreshCancelled("读取已取消")
+                batches.append(batch)
+                rows_done += batch.num_rows
+                bytes_done += batch.nbytes
+                if progress_callback:
+                    progress_callback(rows_done, bytes_done)
+            table = pa.Table.from_batches(batches, schema=reader.schema)
+            return table.to_pandas()
+        
+        chunks = []
+        for chunk in pd.read_csv(path, usecols=columns, dtype=str, encoding="utf-8-sig",
+                                 chunksize=DataProcessor.CSV_BLOCK_SIZE // 64):
+            if cancel_event is not None and cancel_event.is_set():
+                raise RefreshCancelled("读取已取消")
+            chunks.append(chunk)
+            rows_done += len(chunk)
+            bytes_done += int(chunk.memory_usage(deep=True).sum())
+            if progress_callback:
+                progress_callback(rows_done, bytes_done)
+        if not chunks:
+            return pd.DataFrame({col: pd.Series(dtype=str) for col in columns})
+        return pd.concat(chunks, ignore_index=True)[columns]
+    
+    @staticmethod
+    def validate_csv(csv_data, password_pattern=None):
+        """一次性向量化检查CSV：重复或缺失的device_code、格式不正确的password
+        
+        返回字典，各项为出问题的行位置数组（从0开始）
+        """
+        codes = csv_data["device_code"]
+        passwords = csv_data["password"]
+        pattern = password_pattern or DataProcessor.PASSWORD_PATTERN
+        return {
+            "duplicate_codes": np.flatnonzero((codes.duplicated(keep=False) & codes.notna()).to_numpy()),
+            "missing_codes": np.flatnonzero(codes.isna().to_numpy()),
+            "bad_passwords": np.flatnonzero(~passwords.str.fullmatch(pattern).fillna(False).to_numpy(dtype=bool))
+        }
+    
+    @staticmethod
+    def enabled_mask(row_count, disabled_rows):
+        """由禁用行下标集合生成启用行的布尔掩码"""
+        mask = np.ones(row_count, dtype=bool)
+        if disabled_rows:
+            disabled = np.fromiter(disabled_rows, dtype=np.int64, count=len(disabled_rows))
+            mask[disabled[(disabled >= 0) & (disabled < row_count)]] = False
+        return mask
+    
+    @staticmethod
+    def _csv_columns(csv_data, indices):
+        """取CSV的password/device_code列的指定行，缺失值转为None"""
+        return ColumnarTable.from_objects({
+            name: csv_data[name].to_numpy(dtype=object, na_value=None)[indices]
+            for name in DataProcessor.CSV_MATCH_COLUMNS
+        })
+    
+    @staticmethod
+    def _join_keys(db_values, csv_values):
+        """把两侧的匹配键转换为可比较的对象数组，缺失值不参与匹配
+        
+        整数值的浮点列（CSV中含空值的整数列）按整数处理；两侧类型不同时统一按字符串比较
+        """
+        import pandas as pd
+        
+        keys = []
+        for values in (db_values, csv_values):
+            # object数组保持object类型，避免pandas再推断转换为字符串扩展类型
+            series = pd.Series(values, dtype=object if values.dtype == object else None, copy=False)
+            if series.dtype.kind == "f" and (series.dropna() % 1 == 0).all():
+                series = series.astype("Int64")
+            keys.append(series)
+        if pd.api.types.infer_dtype(keys[0], skipna=True) != pd.api.types.infer_dtype(keys[1], skipna=True):
+            keys = [series.astype("string") for series in keys]
+        return [series.to_numpy(dtype=object, na_value=None) for series in keys]
+    
+    @staticmethod
+    def hash_join(left_keys, right_keys):
+        """按键做一对一的哈希连接，返回配对的 (左侧下标数组, 右侧下标数组)，按左侧顺序排列
+        
+        在较小的一侧建立哈希索引，另一侧整体探测，总体O(n+m)。
+        缺失键不参与匹配；同一侧的重复键只有第一次出现的行参与匹配
+        """
+        import pandas as pd
+        
+        build_left = len(left_keys) <= len(right_keys)
+        build, probe = (left_keys, right_keys) if build_left else (right_keys, left_keys)
+        
+        # 建立索引的一侧去掉缺失键和重复键，保证索引唯一
+        build_valid = np.flatnonzero(pd.notna(build) & ~pd.Index(build, dtype=object).duplicated())
+        index = pd.Index(build[build_valid], dtype=object)
+        hit = index.get_indexer(probe)
+        probe_pos = np.flatnonzero(hit >= 0)
+        build_pos = build_valid[hit[probe_pos]]
+        
+        # 探测一侧的重复键会命中同一行，只保留第一次出现的
+        build_pos, first = np.unique(build_pos, return_index=True)
+        probe_pos = probe_pos[first]
+        
+        left_pos, right_pos = (build_pos, probe_pos) if build_left else (probe_pos, build_pos)
+        order = np.argsort(left_pos, kind="stable")
+        return left_pos[order], right_pos[order]
+    
+    @staticmethod
+    def match_data(db_data, db_columns, csv_data, disabled_rows, mode="position", db_key=None, csv_key=None):
+        """匹配数据库数据和CSV数据
+        
+        mode为"position"时按顺序把第N条启用的数据库记录与CSV第N行配对；
+        mode为"key"时按数据库列db_key与CSV列csv_key的值做哈希连接，与行顺序无关。
+        返回的data为ColumnarTable（password, device_code在前，然后是数据库列），
+        unmatched_db/unmatched_csv为两侧未匹配的行下标（数据库为原始行号，CSV为行位置）
+        """
+        try:
+            if not isinstance(db_data, ColumnarTable):
+                db_data = ColumnarTable.from_rows(db_columns, list(db_data))
             
-            # 构建结果数据 - 把password和device_code放在前面
-            result_data = []
+            # 筛选启用的数据库记录
+            enabled_idx = np.flatnonzero(DataProcessor.enabled_mask(len(db_data), disabled_rows))
+            csv_count = len(csv_data)
             
-            # 新的列顺序：password, device_code 在前，然后是数据库列
-            result_columns = ["password", "device_code"] + db_columns
+            if mode == "key":
+                if db_key not in db_columns or csv_key not in csv_data.columns:
+                    raise ValueError(f"匹配键不存在：数据库列 {db_key}，CSV列 {csv_key}")
+                db_keys, csv_keys = DataProcessor._join_keys(
+                    db_data.column(db_key)[enabled_idx], csv_data[csv_key]
+                )
+                db_pos, csv_idx = DataProcessor.hash_join(db_keys, csv_keys)
+                db_idx = enabled_idx[db_pos]
+                unmatched_db = np.setdiff1d(enabled_idx, db_idx, assume_unique=True)
+                unmatched_csv = np.setdiff1d(np.arange(csv_count), csv_idx, assume_unique=True)
+            else:
+                # 按顺序匹配，有多少匹配多少
+                match_count = min(len(enabled_idx), csv_count)
+                db_idx = enabled_idx[:match_count]
+                csv_idx = np.arange(match_count)
+                unmatched_db = enabled_idx[match_count:]
+                unmatched_csv = np.arange(match_count, csv_count)
             
-            for i in range(match_count):
-                db_row = enabled_db_rows[i]
-                csv_row = csv_data.iloc[i]
-                
-                # 转换数据库行数据为字典
-                db_dict = dict(zip(db_columns, db_row))
-                
-                # 构建结果行，确保password和device_code在前面
-                result_row = {
-                    "password": csv_row["password"],
-                    "device_code": csv_row["device_code"]
-                }
-                result_row.update(db_dict)
-                
-                result_data.append(result_row)
+            # CSV中的列优先，数据库中的同名列不再重复
+            db_result_columns = [col for col in db_columns if col not in DataProcessor.CSV_MATCH_COLUMNS]
+            result_columns = DataProcessor.CSV_MATCH_COLUMNS + db_result_columns
+            result = ColumnarTable.concat_columns(
+                DataProcessor._csv_columns(csv_data, csv_idx),
+                db_data.select(db_result_columns).take(db_idx)
+            )
                 
             return {
                 "columns": result_columns,
-                "data": result_data,
-                "count": match_count
+                "data": result,
+                "count": len(db_idx),
+                "mode": mode,
+                "unmatched_db": unmatched_db,
+                "unmatched_csv": unmatched_csv,
+                "db_rows": db_idx,
+                "csv_rows": csv_idx
             }
             
         except Exception as e:
@@ -179,20 +1110,280 @@ class DataProcessor:
             return None
     
     @staticmethod
-    def export_to_csv(data, columns, file_path, selected_columns=None):
-        """导出数据到CSV，支持选择列"""
+    def write_back_rows(matched, key_column="id"):
+        """由匹配结果生成写回数据库的 (主键, device_code, password) 列表
+        
+        主键、device_code或password为空的行不写回，返回 (赋值列表, 跳过的行数)
+        """
+        data = matched["data"]
+        if key_column not in data.columns:
+            raise ValueError(f"匹配结果中没有主键列 {key_column}")
+        keys = data.column(key_column)
+        codes = data.column("device_code")
+        passwords = data.column("password")
+        valid = ~(data.null_mask(key_column) | data.null_mask("device_code") | data.null_mask("password"))
+        # 转为Python值，pymysql不能直接转义NumPy标量
+        assignments = list(zip(keys[valid].tolist(), codes[valid].tolist(), passwords[valid].tolist()))
+        if len(set(key for key, _, _ in assignments)) != len(assignments):
+            raise ValueError(f"匹配结果中 {key_column} 有重复值，不能写回")
+        return assignments, int(len(valid) - valid.sum())
+    
+    @staticmethod
+    def _filter_frame(data, names):
+        """把筛选表达式用到的列转换为pandas DataFrame
+        
+        字符串列（含字典编码列）转换为可空字符串类型，NULL参与比较时结果为False；
+        字典编码列只转换取值表，再按编码取值
+        """
+        import pandas as pd
+        
+        frame = {}
+        for name in names:
+            kind = data.kinds[name]
+            arr, mask, categories = data.raw(name)
+            if kind == "dict":
+                lookup = pd.array(np.append(categories, None), dtype="string")
+                # 编码-1正好取到末尾的NULL
+                frame[name] = lookup[arr]
+            elif kind == "object":
+                frame[name] = pd.array(arr, dtype="string")
+            elif kind == "int" and mask is not None:
+                frame[name] = pd.arrays.IntegerArray(arr, mask)
+            else:
+                frame[name] = arr
+        return pd.DataFrame(frame, copy=False)
+    
+    @staticmethod
+    def filter_rows(data, expression):
+        """按筛选表达式选出数据行，返回满足条件的行下标数组
+        
+        表达式语法同pandas.eval，例如 board == 'esp32s3' and app_version < '1.6'；
+        只转换表达式中出现的列，比较在整列上向量化执行。表达式无效时抛出ValueError
+        """
+        if not isinstance(data, ColumnarTable):
+            raise ValueError("没有可筛选的数据")
+        names = [name for name in data.columns if name in expression]
+        frame = DataProcessor._filter_frame(data, names)
         try:
-            import pandas as pd
+            result = frame.eval(expression, engine="python")
+        except Exception as e:
+            raise ValueError(f"筛选表达式无效：{str(e)}")
+        if not hasattr(result, "dtype") or result.dtype.kind != "b" or len(result) != len(data):
+            raise ValueError("筛选表达式的结果不是逐行的条件")
+        # 可空布尔结果中的NULL视为不满足
+        return np.flatnonzero(np.asarray(result.fillna(False), dtype=bool))
+    
+    @staticmethod
+    def update_position_match(matched, db_data, csv_data, row_index, row):
+        """按顺序匹配的结果在数据库行row切换启用状态后增量更新
+        
+        row_index为已更新状态的EnabledRowIndex。row之前的启用行数（O(log n)）即为
+        受影响的第一条结果，只重新生成该位置之后的结果行；
+        结果在首次更新时按最多可能的行数（数据库行数与CSV行数的较小值）分配一次，
+        之后原地覆盖受影响的行，matched["data"]等为其前count行的视图。
+        返回受影响的第一条结果的下标，matched原地更新
+        """
+        first = row_index.rank(row)
+        csv_count = len(csv_data)
+        match_count = min(row_index.enabled_count, csv_count)
+        db_result_columns = matched["columns"][len(DataProcessor.CSV_MATCH_COLUMNS):]
+        
+        storage = matched.get("storage")
+        if storage is None:
+            # 按顺序匹配时第i条结果总是CSV第i行，CSV列分配时一次填好
+            capacity = min(len(row_index), csv_count)
+            storage_db_rows = np.zeros(capacity, dtype=np.int64)
+            storage_db_rows[:matched["count"]] = matched["db_rows"]
+            storage = ColumnarTable.concat_columns(
+                DataProcessor._csv_columns(csv_data, np.arange(capacity)),
+                db_data.select(db_result_columns).take(storage_db_rows)
+            )
+            matched["storage"] = storage
+            matched["storage_db_rows"] = storage_db_rows
+            matched["csv_positions"] = np.arange(csv_count)
+        
+        # 受影响位置之前的结果保持不变，只覆盖之后的行
+        suffix_rows = row_index.enabled_rows(first, match_count)
+        storage.put_rows(first, db_data.select(db_result_columns).take(suffix_rows))
+        matched["storage_db_rows"][first:match_count] = suffix_rows
+        
+        matched["data"] = storage.view(0, match_count)
+        matched["db_rows"] = matched["storage_db_rows"][:match_count]
+        matched["csv_rows"] = matched["csv_positions"][:match_count]
+        matched["count"] = match_count
+        matched["unmatched_db"] = row_index.enabled_rows(match_count)
+        matched["unmatched_csv"] = matched["csv_positions"][match_count:]
+        return first
+    
+    @staticmethod
+    def _iter_export_chunks(data, columns, chunk_size):
+        """按块产出待导出的DataFrame，列投影在转换之前完成"""
+        import pandas as pd
+        
+        if isinstance(data, ColumnarTable):
+            projected = data.select(columns)
+            for start in range(0, len(projected), chunk_size):
+                yield projected[start:start + chunk_size].to_pandas()
+            return
+        
+        # 行字典的列表或生成器
+        chunk = []
+        for row in data:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk, columns=columns)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns)
+    
+    @staticmethod
+    def _compressor(compression):
+        """返回在文件对象上包装压缩流的函数，不压缩时返回None；在打开文件前检查依赖"""
+        if compression is None:
+            return None
+        if compression == "gzip":
+            import gzip
+            return lambda raw: gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+        if compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise ValueError("导出zstd压缩文件需要安装zstandard库")
+            return lambda raw: zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+        raise ValueError(f"不支持的压缩方式: {compression}")
+    
+    @staticmethod
+    def export_to_csv(data, columns, file_path, selected_columns=None, compression="infer",
+                      chunk_size=50000, progress_callback=None):
+        """导出数据到CSV，支持选择列
+        
+        data可以是ColumnarTable、行字典列表或生成器，按chunk_size分块写入，不整体构建DataFrame。
+        compression为None/"gzip"/"zstd"，"infer"时按扩展名(.gz/.zst)判断；
+        每写完一块调用progress_callback(行数, 已写入字节数)
+        """
+        try:
+            import io
             
             # 如果指定了要导出的列，则筛选
             if selected_columns and all(col in columns for col in selected_columns):
-                df = pd.DataFrame(data)[selected_columns]
-            else:
-                df = pd.DataFrame(data)
+                columns = selected_columns
+            if compression == "infer":
+                lower_path = file_path.lower()
+                compression = "gzip" if lower_path.endswith(".gz") else "zstd" if lower_path.endswith(".zst") else None
+            
+            open_compressor = DataProcessor._compressor(compression)
+            
+            start_time = time.perf_counter()
+            row_count = 0
+            with open(file_path, "wb") as raw:
+                compressor = open_compressor(raw) if open_compressor else None
+                stream = io.TextIOWrapper(compressor or raw, encoding="utf-8-sig", newline="")
+                try:
+                    for chunk in DataProcessor._iter_export_chunks(data, columns, chunk_size):
+                        chunk.to_csv(stream, index=False, header=row_count == 0)
+                        row_count += len(chunk)
+                        if progress_callback:
+                            stream.flush()
+                            progress_callback(row_count, raw.tell())
+                    if row_count == 0:
+                        stream.write(",".join(columns) + "\n")
+                finally:
+                    # 文本流只刷新后分离，不随之关闭下层流；压缩流单独关闭以写入结尾，原始文件由with关闭
+                    stream.flush()
+                    stream.detach()
+                    if compressor is not None:
+                        compressor.close()
+            
+            return True, DataProcessor._export_message(row_count, file_path, start_time)
+        except Exception as e:
+            return False, f"导出失败：{str(e)}"
+
+    @staticmethod
+    def _to_arrow_table(data, columns):
+        """把待导出的数据转换为pyarrow Table（已做列投影）"""
+        import pyarrow as pa
+        
+        if isinstance(data, ColumnarTable):
+            return data.select(columns).to_arrow()
+        rows = list(data)
+        return pa.Table.from_pylist(rows).select(columns) if rows else pa.table({col: pa.array([], pa.null()) for col in columns})
+    
+    @staticmethod
+    def export_to_parquet(data, columns, file_path, selected_columns=None, row_group_size=100000,
+                          compression="zstd", progress_callback=None):
+        """导出数据到Parquet文件，保留列类型（日期时间、补零的编码字符串等）
+        
+        每row_group_size行写成一个行组；字典编码列及低基数的字符串列使用字典编码
+        """
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            return False, "导出Parquet需要安装pyarrow库"
+        try:
+            if selected_columns and all(col in columns for col in selected_columns):
+                columns = selected_columns
+            start_time = time.perf_counter()
+            table = DataProcessor._to_arrow_table(data, columns)
             
-            # 保存CSV
-            df.to_csv(file_path, index=False, encoding="utf-8-sig")
-            return True, f"成功导出 {len(data)} 条记录到 {file_path}"
+            with pq.ParquetWriter(file_path, table.schema, compression=compression,
+                                  use_dictionary=DataProcessor._dictionary_columns(data, columns)) as writer:
+                for start in range(0, max(table.num_rows, 1), row_group_size):
+                    writer.write_table(table.slice(start, row_group_size), row_group_size=row_group_size)
+                    if progress_callback:
+                        progress_callback(min(start + row_group_size, table.num_rows), os.path.getsize(file_path))
+            return True, DataProcessor._export_message(table.num_rows, file_path, start_time)
         except Exception as e:
             return False, f"导出失败：{str(e)}"
-    
\ No newline at end of file
+    
+    @staticmethod
+    def export_to_arrow(data, columns, file_path, selected_columns=None, batch_size=100000, progress_callback=None):
+        """导出数据到Arrow IPC文件（未压缩，读取时可直接内存映射）"""
+        try:
+            import pyarrow as pa
+        except ImportError:
+            return False, "导出Arrow需要安装pyarrow库"
+        try:
+            if selected_columns and all(col in columns for col in selected_columns):
+                columns = selected_columns
+            start_time = time.perf_counter()
+            table = DataProcessor._to_arrow_table(data, columns)
+            
+            rows_done = 0
+            with pa.OSFile(file_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                for batch in table.to_batches(max_chunksize=batch_size):
+                    writer.write_batch(batch)
+                    rows_done += batch.num_rows
+                    if progress_callback:
+                        progress_callback(rows_done, sink.tell())
+            return True, DataProcessor._export_message(table.num_rows, file_path, start_time)
+        except Exception as e:
+            return False, f"导出失败：{str(e)}"
+    
+    @staticmethod
+    def _dictionary_columns(data, columns):
+        """Parquet中使用字典编码的列：列存中已字典编码的列和默认的低基数字段"""
+        if isinstance(data, ColumnarTable):
+            return [col for col in columns if data.kinds.get(col) == "dict" or col in DICT_ENCODE_COLUMNS]
+        return [col for col in columns if col in DICT_ENCODE_COLUMNS]
+    
+    @staticmethod
+    def _export_message(row_count, file_path, start_time):
+        size = os.path.getsize(file_path)
+        elapsed = max(time.perf_counter() - start_time, 1e-6)
+        return (
+            f"成功导出 {row_count} 条记录到 {file_path}"
+            f"（{size / 1024 / 1024:.1f} MB，{size / 1024 / 1024 / elapsed:.1f} MB/秒）"
+        )
+    
+    @staticmethod
+    def export_file(data, columns, file_path, selected_columns=None, progress_callback=None):
+        """按扩展名选择导出格式：.parquet、.arrow/.feather，其余按CSV（.gz/.zst压缩）"""
+        lower_path = file_path.lower()
+        if lower_path.endswith(".parquet"):
+            return DataProcessor.export_to_parquet(data, columns, file_path, selected_columns,
+                                                   progress_callback=progress_callback)
+        if lower_path.endswith((".arrow", ".feather")):
+            return DataProcessor.export_to_arrow(data, columns, file_path, selected_columns,
+                                                 progress_callback=progress_callback)
+        return DataProcessor.export_to_csv(data, columns, file_path, selected_columns,
+                                           progress_callback=progress_callback)
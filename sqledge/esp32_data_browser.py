@@ -6,6 +6,8 @@ import pandas as pd
 import pymysql
 from matplotlib.figure import Figure
 import numpy as np
+from schema_cache import schema_cache
+from query_stats import query_stats, traced, InstrumentedCursor
 
 # 设置中文字体支持
 plt.rcParams["font.family"] = ["SimHei", "WenQuanYi Micro Hei", "Heiti TC"]
@@ -93,6 +95,7 @@ class ESP32DataBrowser:
         self.chart_placeholder = ttk.Label(self.chart_frame, text="选择表并点击生成图表")
         self.chart_placeholder.pack(fill=tk.BOTH, expand=True)
         
+    @traced("ESP32DataBrowser.connect_database")
     def connect_database(self):
         """连接数据库并加载表结构"""
         try:
@@ -102,8 +105,11 @@ class ESP32DataBrowser:
                 user=self.db_config["user"],
                 password=self.db_config["password"],
                 database=self.db_config["database"],
-                charset="utf8mb4"
+                charset="utf8mb4",
+                cursorclass=InstrumentedCursor
             )
+            # 定期在控制台输出SQL耗时统计
+            query_stats.start_periodic_log(60)
             
             # 清空树
             for item in self.tree.get_children():
@@ -156,6 +162,7 @@ class ESP32DataBrowser:
             self.table_name_var.set(table_name)
             self.load_table_data(table_name)
     
+    @traced("ESP32DataBrowser.load_table_data")
     def load_table_data(self, table_name):
         """加载指定表的数据"""
         try:
@@ -163,12 +170,10 @@ class ESP32DataBrowser:
             for item in self.data_tree.get_children():
                 self.data_tree.delete(item)
             
-            # 获取表结构
+            # 获取表结构（走共享缓存，结构未变时不重复DESCRIBE）
+            column_names = schema_cache.get_columns(self.conn, table_name)
+            
             with self.conn.cursor() as cursor:
-                cursor.execute(f"DESCRIBE {table_name}")
-                columns = cursor.fetchall()
-                column_names = [col[0] for col in columns]
-                
                 # 设置数据表格列
                 self.data_tree["columns"] = column_names
                 for col in column_names:
@@ -13,6 +13,10 @@ from wordcloud import WordCloud
 import jieba
 import time
 from collections import defaultdict
+from query_stats import query_stats, traced, InstrumentedCursor
+from mac_summary import MacSummary
+from mac_search import MacSearchIndex, SEARCH_DELAY_MS
+from tk_widgets import VirtualListbox, ChatTranscript
 
 # 设置中文字体
 plt.rcParams["font.family"] = ["SimHei", "WenQuanYi Micro Hei", "Heiti TC"]
@@ -43,6 +47,10 @@ class IncrementalAIAnalyzer:
         self.current_mac = None
         self.processed_ids = defaultdict(int)  # 记录每个MAC已处理的最后一条记录ID {mac: last_id}
         self.analysis_results = defaultdict(dict)  # 存储分析结果 {mac: {维度: 结果}}
+        self.mac_summary = MacSummary(self.db_config)  # 本地MAC汇总，刷新时只统计新增记录
+        self.mac_index = MacSearchIndex()  # MAC搜索索引，刷新列表时重建
+        self.analyzed = np.zeros(0, dtype=bool)  # 与all_macs对应的"已分析"标记
+        self._search_job = None  # 等待执行的搜索（输入防抖）
         
         # 界面组件
         self._create_widgets()
@@ -68,16 +76,11 @@ class IncrementalAIAnalyzer:
         
         # MAC列表
         ttk.Label(left_frame, text="MAC地址列表", font=("Arial", 10, "bold")).pack(anchor=tk.W, padx=5, pady=5)
-        self.mac_frame = ttk.Frame(left_frame)
-        self.mac_frame.pack(fill=tk.BOTH, expand=True, padx=5)
-        self.mac_scrollbar = ttk.Scrollbar(self.mac_frame)
-        self.mac_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.mac_listbox = tk.Listbox(
-            self.mac_frame, yscrollcommand=self.mac_scrollbar.set,
+        self.mac_listbox = VirtualListbox(
+            left_frame, formatter=self._mac_label,
             selectmode=tk.SINGLE, font=("SimHei", 10)
         )
-        self.mac_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        self.mac_scrollbar.config(command=self.mac_listbox.yview)
+        self.mac_listbox.pack(fill=tk.BOTH, expand=True, padx=5)
         self.mac_listbox.bind('<<ListboxSelect>>', self.on_mac_selected)
         
         # 操作按钮
@@ -85,6 +88,7 @@ class IncrementalAIAnalyzer:
         left_bottom_frame.pack(fill=tk.X)
         ttk.Button(left_bottom_frame, text="刷新列表", command=self.refresh_mac_list).pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
         ttk.Button(left_bottom_frame, text="分析新增记录", command=self.analyze_new_records).pack(side=tk.RIGHT, padx=5, fill=tk.X, expand=True)
+        ttk.Button(left_frame, text="重建MAC汇总", command=self.rebuild_mac_summary).pack(fill=tk.X, padx=5)
         ttk.Button(left_frame, text="设置OpenAI密钥", command=self.set_openai_key).pack(fill=tk.X, padx=5, pady=5)
         
         # 右侧分析结果区域
@@ -124,6 +128,8 @@ class IncrementalAIAnalyzer:
         self.chat_area = scrolledtext.ScrolledText(chat_frame, wrap=tk.WORD, font=("SimHei", 10))
         self.chat_area.pack(fill=tk.BOTH, expand=True)
         self.chat_area.config(state=tk.DISABLED)
+        self.transcript = ChatTranscript(self.chat_area, self._format_chat_record, empty_text="该MAC地址无聊天记录")
+        self._last_processed_id = 0  # 显示聊天记录时该MAC已处理到的id
     
     def _init_hotwords_tab(self):
         frame = ttk.Frame(self.hotwords_tab)
@@ -171,8 +177,11 @@ class IncrementalAIAnalyzer:
                 user=self.db_config["user"],
                 password=self.db_config["password"],
                 database=self.db_config["database"],
-                charset="utf8mb4"
+                charset="utf8mb4",
+                cursorclass=InstrumentedCursor
             )
+            # 定期在控制台输出SQL耗时统计
+            query_stats.start_periodic_log(60)
             self.refresh_mac_list()
             self.status_var.set(f"已连接到数据库，共{len(self.all_macs)}个MAC地址")
         except Exception as e:
@@ -183,37 +192,52 @@ class IncrementalAIAnalyzer:
         if not self.conn:
             return
         try:
-            self.mac_listbox.delete(0, tk.END)
-            with self.conn.cursor() as cursor:
-                cursor.execute(f"SELECT DISTINCT mac_address FROM {self.db_config['table']} WHERE mac_address IS NOT NULL ORDER BY mac_address")
-                self.all_macs = [mac[0] for mac in cursor.fetchall() if mac[0]]
-                for mac in self.all_macs:
-                    # 显示已处理状态
-                    status = "（已分析）" if self.processed_ids.get(mac, 0) > 0 else ""
-                    self.mac_listbox.insert(tk.END, f"{mac} {status}")
+            self.mac_summary.refresh(self.conn)
+            self.all_macs = list(self.mac_summary.load())
+            self.mac_index = MacSearchIndex(self.all_macs)
+            self.analyzed = np.fromiter(
+                (self.processed_ids.get(mac, 0) > 0 for mac in self.all_macs), dtype=bool, count=len(self.all_macs)
+            )
+            self._apply_search()
             self.status_var.set(f"MAC列表已刷新，共{len(self.all_macs)}个地址")
         except Exception as e:
             messagebox.showerror("错误", f"刷新MAC列表失败: {str(e)}")
     
+    def rebuild_mac_summary(self):
+        """清空本地MAC汇总后重新统计全部记录（已有聊天记录被删除或修改后使用）"""
+        if not self.conn:
+            return
+        if not messagebox.askyesno("确认", "将重新统计全部聊天记录，数据量大时需要较长时间，是否继续？"):
+            return
+        self.mac_summary.clear()
+        self.refresh_mac_list()
+    
     def _on_search_changed(self, *args):
-        search_text = self.search_var.get().lower()
-        self.mac_listbox.delete(0, tk.END)
-        filtered = [mac for mac in self.all_macs if search_text in mac.lower()]
-        for mac in filtered:
-            status = "（已分析）" if self.processed_ids.get(mac, 0) > 0 else ""
-            self.mac_listbox.insert(tk.END, f"{mac} {status}")
+        # 输入停顿后才执行搜索
+        if self._search_job:
+            self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(SEARCH_DELAY_MS, self._apply_search)
+    
+    def _apply_search(self):
+        self._search_job = None
+        rows, _ = self.mac_index.search(self.search_var.get())
+        self.mac_listbox.set_items(rows)
+    
+    def _mac_label(self, row):
+        # 显示已处理状态
+        status = "（已分析）" if self.analyzed[row] else ""
+        return f"{self.all_macs[row]} {status}"
     
     def on_mac_selected(self, event=None):
         selection = self.mac_listbox.curselection()
         if not selection:
             return
-        # 提取MAC地址（去除状态后缀）
-        selected_text = self.mac_listbox.get(selection[0])
-        self.current_mac = selected_text.split("（")[0].strip()
+        self.current_mac = self.all_macs[self.mac_listbox.get(selection[0])]
         self.chat_title.config(text=f"MAC地址: {self.current_mac} 的聊天记录")
         self._load_chat_records()
         self._display_analysis_results()
     
+    @traced("IncrementalAIAnalyzer._load_chat_records")
     def _load_chat_records(self):
         """加载该MAC的所有聊天记录（含已分析和未分析）"""
         try:
@@ -229,25 +253,15 @@ class IncrementalAIAnalyzer:
             messagebox.showerror("错误", f"加载聊天记录失败: {str(e)}")
     
     def _display_chat_records(self):
-        self.chat_area.config(state=tk.NORMAL)
-        self.chat_area.delete(1.0, tk.END)
-        if not self.chat_records:
-            self.chat_area.insert(tk.END, "该MAC地址无聊天记录")
-            self.chat_area.config(state=tk.DISABLED)
-            return
-        
-        last_processed_id = self.processed_ids.get(self.current_mac, 0)
-        for record_id, content, created_at in self.chat_records:
-            time_str = created_at.strftime("%Y-%m-%d %H:%M") if isinstance(created_at, datetime) else str(created_at)
-            # 标记已分析/未分析
-            status = "【已分析】" if record_id <= last_processed_id else "【未分析】"
-            self.chat_area.insert(tk.END, f"[{time_str}] {status}\n", "time")
-            self.chat_area.insert(tk.END, f"{content}\n\n", "content")
-        
-        self.chat_area.tag_config("time", foreground="#666666", font=("SimHei", 9))
-        self.chat_area.tag_config("content", font=("SimHei", 10))
-        self.chat_area.see(tk.END)
-        self.chat_area.config(state=tk.DISABLED)
+        self._last_processed_id = self.processed_ids.get(self.current_mac, 0)
+        self.transcript.show(self.chat_records)
+        
+    def _format_chat_record(self, record):
+        record_id, content, created_at = record
+        time_str = created_at.strftime("%Y-%m-%d %H:%M") if isinstance(created_at, datetime) else str(created_at)
+        # 标记已分析/未分析
+        status = "【已分析】" if record_id <= self._last_processed_id else "【未分析】"
+        return f"[{time_str}] {status}", content
     
     def analyze_new_records(self):
         """分析新增的聊天记录（递归分段发送）"""
@@ -276,7 +290,10 @@ class IncrementalAIAnalyzer:
             self.processed_ids[self.current_mac] = max(r[0] for r in new_records)
             self._save_processed_records()
             # 刷新显示
-            self.refresh_mac_list()
+            row = self.mac_index.find(self.current_mac)
+            if row >= 0:
+                self.analyzed[row] = True
+            self.mac_listbox.refresh()
             self._display_analysis_results()
             self.status_var.set(f"分析完成，已处理{len(new_records)}条新记录")
         except Exception as e:
@@ -17,6 +17,10 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 import queue
 import time
 import traceback
+from query_stats import query_stats, traced, InstrumentedCursor
+from mac_summary import MacSummary
+from mac_search import MacSearchIndex, SEARCH_DELAY_MS
+from tk_widgets import VirtualListbox, ChatTranscript
 
 # 解决字体警告
 plt.rcParams["font.family"] = ["SimHei", "Microsoft YaHei", "Arial Unicode MS", "sans-serif"]
@@ -61,6 +65,10 @@ class AdvancedZhipuAnalyzer:
         self.processed_ids = defaultdict(int)
         self.analysis_results = defaultdict(dict)
         self.all_macs = []
+        self.mac_summary = MacSummary(self.db_config)  # 本地MAC汇总，刷新时只统计新增记录
+        self.mac_index = MacSearchIndex()  # MAC搜索索引，刷新列表时重建
+        self.analyzed = np.zeros(0, dtype=bool)  # 与all_macs对应的"已分析"标记
+        self._search_job = None  # 等待执行的搜索（输入防抖）
         self.data_lock = threading.Lock()
         self.executor = None  # 线程池执行器
         
@@ -106,16 +114,11 @@ class AdvancedZhipuAnalyzer:
         
         # MAC列表
         ttk.Label(left_frame, text="MAC地址列表", font=("Arial", 10, "bold")).pack(anchor=tk.W, padx=5, pady=5)
-        self.mac_frame = ttk.Frame(left_frame)
-        self.mac_frame.pack(fill=tk.BOTH, expand=True, padx=5)
-        self.mac_scrollbar = ttk.Scrollbar(self.mac_frame)
-        self.mac_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.mac_listbox = tk.Listbox(
-            self.mac_frame, yscrollcommand=self.mac_scrollbar.set,
+        self.mac_listbox = VirtualListbox(
+            left_frame, formatter=self._mac_label,
             selectmode=tk.SINGLE, font=("SimHei", 10)
         )
-        self.mac_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        self.mac_scrollbar.config(command=self.mac_listbox.yview)
+        self.mac_listbox.pack(fill=tk.BOTH, expand=True, padx=5)
         self.mac_listbox.bind('<<ListboxSelect>>', self.on_mac_selected)
         
         # 操作按钮
@@ -124,6 +127,7 @@ class AdvancedZhipuAnalyzer:
         ttk.Button(left_bottom_frame, text="刷新列表", command=self.refresh_mac_list).pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
         self.analyze_btn = ttk.Button(left_bottom_frame, text="分析新增记录", command=self.start_analyze_thread)
         self.analyze_btn.pack(side=tk.RIGHT, padx=5, fill=tk.X, expand=True)
+        ttk.Button(left_frame, text="重建MAC汇总", command=self.rebuild_mac_summary).pack(fill=tk.X, padx=5)
         
         # 一键分析所有MAC按钮
         self.analyze_all_btn = ttk.Button(left_frame, text="一键分析所有MAC", command=self.start_analyze_all_thread)
@@ -192,6 +196,9 @@ class AdvancedZhipuAnalyzer:
         self.chat_area = scrolledtext.ScrolledText(chat_frame, wrap=tk.WORD, font=("SimHei", 10))
         self.chat_area.pack(fill=tk.BOTH, expand=True)
         self.chat_area.config(state=tk.DISABLED)
+        # 按天分段显示，只保留当前位置附近的段
+        self.transcript = ChatTranscript(self.chat_area, self._format_chat_record, empty_text="该MAC地址无聊天记录")
+        self._last_processed_id = 0  # 显示聊天记录时该MAC已处理到的id
     
     def _init_hotwords_tab(self):
         frame = ttk.Frame(self.hotwords_tab)
@@ -280,7 +287,8 @@ class AdvancedZhipuAnalyzer:
                     self.progress_var.set(message.get('value'))
                 elif msg_type == 'refresh_results':
                     self._display_analysis_results()
-                    self.refresh_mac_list()
+                    # 已分析标记在分析线程中已更新，只需重绘可见行
+                    self.mac_listbox.refresh()
                 elif msg_type == 'analysis_complete':
                     self.analysis_in_progress = False
                     self.analyze_btn.config(state=tk.NORMAL)
@@ -389,8 +397,11 @@ class AdvancedZhipuAnalyzer:
                 user=self.db_config["user"],
                 password=self.db_config["password"],
                 database=self.db_config["database"],
-                charset="utf8mb4"
+                charset="utf8mb4",
+                cursorclass=InstrumentedCursor
             )
+            # 定期把SQL耗时统计写入日志页
+            query_stats.start_periodic_log(60, log=lambda line: self._send_to_queue('log', content=line))
             self.refresh_mac_list()
             self.status_var.set(f"已连接到数据库，共{len(self.all_macs)}个MAC地址")
             self._log("数据库连接成功")
@@ -403,54 +414,61 @@ class AdvancedZhipuAnalyzer:
         if not self.conn:
             return
         try:
-            self.mac_listbox.delete(0, tk.END)
-            with self.conn.cursor() as cursor:
-                cursor.execute(f"SELECT DISTINCT mac_address FROM {self.db_config['table']} WHERE mac_address IS NOT NULL ORDER BY mac_address")
-                macs = [mac[0] for mac in cursor.fetchall() if mac[0]]
-                
-                with self.data_lock:
-                    self.all_macs = macs
+            new_rows = self.mac_summary.refresh(self.conn)
+            macs = list(self.mac_summary.load())
+            index = MacSearchIndex(macs)
                 
-                for mac in macs:
-                    with self.data_lock:
-                        status = "（已分析）" if self.processed_ids.get(mac, 0) > 0 else ""
-                    self.mac_listbox.insert(tk.END, f"{mac} {status}")
+            with self.data_lock:
+                analyzed = np.fromiter(
+                    (self.processed_ids.get(mac, 0) > 0 for mac in macs), dtype=bool, count=len(macs)
+                )
+                self.all_macs = macs
+                self.mac_index = index
+                self.analyzed = analyzed
+            
+            self._apply_search()
             
             with self.data_lock:
                 count = len(self.all_macs)
             self.status_var.set(f"MAC列表已刷新，共{count}个地址")
-            self._log(f"刷新MAC列表，共{count}个地址")
+            self._log(f"刷新MAC列表，共{count}个地址，汇总新增 {new_rows} 条记录")
         except Exception as e:
             messagebox.showerror("错误", f"刷新MAC列表失败: {str(e)}")
             self._log(f"刷新MAC列表失败: {str(e)}")
     
+    def rebuild_mac_summary(self):
+        """清空本地MAC汇总后重新统计全部记录（已有聊天记录被删除或修改后使用）"""
+        if not self.conn:
+            return
+        if not messagebox.askyesno("确认", "将重新统计全部聊天记录，数据量大时需要较长时间，是否继续？"):
+            return
+        self.mac_summary.clear()
+        self.refresh_mac_list()
+    
     # 搜索功能实现
     def _on_search_changed(self, *args):
-        search_text = self.search_var.get().lower()
-        self.mac_listbox.delete(0, tk.END)
-        
+        # 输入停顿后才执行搜索
+        if self._search_job:
+            self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(SEARCH_DELAY_MS, self._apply_search)
+    
+    def _apply_search(self):
+        self._search_job = None
         with self.data_lock:
-            macs = self.all_macs.copy()
+            rows, _ = self.mac_index.search(self.search_var.get())
+        self.mac_listbox.set_items(rows)
         
-        if not search_text:
-            for mac in macs:
-                with self.data_lock:
-                    status = "（已分析）" if self.processed_ids.get(mac, 0) > 0 else ""
-                self.mac_listbox.insert(tk.END, f"{mac} {status}")
-        else:
-            filtered = [mac for mac in macs if search_text in mac.lower()]
-            for mac in filtered:
-                with self.data_lock:
-                    status = "（已分析）" if self.processed_ids.get(mac, 0) > 0 else ""
-                self.mac_listbox.insert(tk.END, f"{mac} {status}")
+    def _mac_label(self, row):
+        # 绘制时才生成文字，状态取自已分析标记
+        status = "（已分析）" if self.analyzed[row] else ""
+        return f"{self.all_macs[row]} {status}"
     
     # 聊天记录处理
     def on_mac_selected(self, event=None):
         selection = self.mac_listbox.curselection()
         if not selection:
             return
-        selected_text = self.mac_listbox.get(selection[0])
-        self.current_mac = selected_text.split("（")[0].strip()
+        self.current_mac = self.all_macs[self.mac_listbox.get(selection[0])]
         self.chat_title.config(text=f"MAC地址: {self.current_mac} 的聊天记录")
         self._load_chat_records()
         self._display_analysis_results()
@@ -472,26 +490,15 @@ class AdvancedZhipuAnalyzer:
             self._log(f"加载MAC {self.current_mac} 聊天记录失败: {str(e)}")
     
     def _display_chat_records(self):
-        self.chat_area.config(state=tk.NORMAL)
-        self.chat_area.delete(1.0, tk.END)
-        if not self.chat_records:
-            self.chat_area.insert(tk.END, "该MAC地址无聊天记录")
-            self.chat_area.config(state=tk.DISABLED)
-            return
-        
         with self.data_lock:
-            last_processed_id = self.processed_ids.get(self.current_mac, 0)
+            self._last_processed_id = self.processed_ids.get(self.current_mac, 0)
+        self.transcript.show(self.chat_records)
         
-        for record_id, content, created_at in self.chat_records:
-            time_str = created_at.strftime("%Y-%m-%d %H:%M") if isinstance(created_at, datetime) else str(created_at)
-            status = "【已分析】" if record_id <= last_processed_id else "【未分析】"
-            self.chat_area.insert(tk.END, f"[{time_str}] {status}\n", "time")
-            self.chat_area.insert(tk.END, f"{content}\n\n", "content")
-        
-        self.chat_area.tag_config("time", foreground="#666666", font=("SimHei", 9))
-        self.chat_area.tag_config("content", font=("SimHei", 10))
-        self.chat_area.see(tk.END)
-        self.chat_area.config(state=tk.DISABLED)
+    def _format_chat_record(self, record):
+        record_id, content, created_at = record
+        time_str = created_at.strftime("%Y-%m-%d %H:%M") if isinstance(created_at, datetime) else str(created_at)
+        status = "【已分析】" if record_id <= self._last_processed_id else "【未分析】"
+        return f"[{time_str}] {status}", content
     
     # 启动分析线程
     def start_analyze_thread(self):
@@ -626,6 +633,7 @@ class AdvancedZhipuAnalyzer:
                 self.executor = None
     
     # 线程池任务：处理单个MAC
+    @traced("AdvancedZhipuAnalyzer._process_single_mac")
     def _process_single_mac(self, mac):
         try:
             self._send_to_queue('log', content=f"开始处理MAC: {mac}")
@@ -684,6 +692,9 @@ class AdvancedZhipuAnalyzer:
         max_record_id = max(r[0] for r in new_records)
         with self.data_lock:
             self.processed_ids[mac] = max_record_id
+            row = self.mac_index.find(mac)
+            if row >= 0:
+                self.analyzed[row] = True
         self._save_processed_records()
         self._save_persistent_results(mac)
     
@@ -0,0 +1,102 @@
+from bisect import bisect_left
+import numpy as np
+
+# 搜索时忽略的分隔符
+MAC_SEPARATORS = ":-. _"
+# 输入停顿多久后才执行搜索（毫秒）
+SEARCH_DELAY_MS = 150
+
+# 字节 -> 字母表编码：0-9a-z为0~35，其他字符共用36，MAC之间的分隔为37
+_OTHER = 36
+_BOUNDARY = 37
+_ALPHABET = 38
+_BYTE_CODES = np.full(256, _OTHER, dtype=np.int64)
+_BYTE_CODES[np.frombuffer(b"0123456789abcdefghijklmnopqrstuvwxyz", dtype=np.uint8)] = np.arange(36)
+_GRAM_SIZES = (1, 2, 3)
+_STRIP_SEPARATORS = str.maketrans("", "", MAC_SEPARATORS)
+
+def normalize_mac(text):
+    """去掉分隔符并转小写，"AA:BB-cc" -> "aabbcc" """
+    return text.lower().translate(_STRIP_SEPARATORS)
+
+class MacSearchIndex:
+    """MAC地址的n-gram倒排索引
+    
+    对规范化后的MAC（去分隔符、小写）按1/2/3字节的n-gram建立倒排表（numpy数组，
+    一次性向量化构建）。查询时取查询串的n-gram倒排表求交集，再对少量候选做子串校验，
+    结果按原列表顺序返回，与逐个 `in` 比较的结果一致
+    """
+    def __init__(self, macs=()):
+        self.macs = list(macs)
+        self.normalized = [normalize_mac(mac) for mac in self.macs]
+        self._postings = {}
+        self._build()
+    
+    def __len__(self):
+        return len(self.macs)
+    
+    def find(self, mac):
+        """MAC在列表中的下标，不存在时返回-1（macs需已排序，即MacSummary.load()的顺序）"""
+        row = bisect_left(self.macs, mac)
+        return row if row < len(self.macs) and self.macs[row] == mac else -1
+    
+    def _build(self):
+        # 所有MAC拼成一个字节串，MAC之间用分隔编码隔开，n-gram跨越分隔的丢弃
+        encoded = [mac.encode("utf-8") for mac in self.normalized]
+        if not encoded:
+            empty = (np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64))
+            self._postings = {size: empty for size in _GRAM_SIZES}
+            return
+        lengths = np.fromiter((len(mac) for mac in encoded), dtype=np.int64, count=len(encoded))
+        codes = _BYTE_CODES[np.frombuffer(b"\0".join(encoded) + b"\0", dtype=np.uint8)]
+        owners = np.repeat(np.arange(len(encoded), dtype=np.int64), lengths + 1)
+        codes[np.cumsum(lengths + 1) - 1] = _BOUNDARY
+        
+        for size in _GRAM_SIZES:
+            count = len(codes) - size + 1
+            grams = np.zeros(count, dtype=np.int64)
+            valid = np.ones(count, dtype=bool)
+            for offset in range(size):
+                part = codes[offset:offset + count]
+                grams = grams * _ALPHABET + part
+                valid &= part != _BOUNDARY
+            # 按(gram, 行号)排序去重，每个gram的倒排表是有序的行号数组
+            keys = np.sort(grams[valid] * len(encoded) + owners[:count][valid])
+            first = np.ones(len(keys), dtype=bool)
+            first[1:] = keys[1:] != keys[:-1]
+            keys = keys[first]
+            gram_keys, rows = np.divmod(keys, len(encoded))
+            offsets = np.searchsorted(gram_keys, np.arange(_ALPHABET ** size + 1))
+            self._postings[size] = (offsets, rows)
+    
+    def _posting(self, gram):
+        offsets, rows = self._postings[len(gram)]
+        code = 0
+        for value in _BYTE_CODES[np.frombuffer(gram, dtype=np.uint8)]:
+            code = code * _ALPHABET + int(value)
+        return rows[offsets[code]:offsets[code + 1]]
+    
+    def search(self, text, limit=None):
+        """返回 (前limit个匹配的下标序列, 匹配总数)，limit为None时不限数量，查询为空时匹配全部"""
+        query = normalize_mac(text)
+        if not query or not self.macs:
+            return range(len(self.macs))[:limit], len(self.macs)
+        
+        encoded = query.encode("utf-8")
+        size = min(len(encoded), _GRAM_SIZES[-1])
+        postings = sorted(
+            (self._posting(encoded[start:start + size]) for start in range(len(encoded) - size + 1)),
+            key=len
+        )
+        candidates = postings[0]
+        for posting in postings[1:]:
+            if not len(candidates):
+                break
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+        
+        # n-gram即查询本身且不含字母表外的字符时，倒排表就是精确结果
+        exact = len(encoded) == size and all(_BYTE_CODES[byte] != _OTHER for byte in encoded)
+        if exact:
+            return candidates[:limit].tolist(), len(candidates)
+        matches = [row for row in candidates.tolist() if query in self.normalized[row]]
+        return matches[:limit], len(matches)
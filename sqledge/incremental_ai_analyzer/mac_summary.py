@@ -0,0 +1,206 @@
+import os
+import sqlite3
+import time
+
+# 本地汇总文件（与db_snapshot.sqlite一样放在工作目录）
+MAC_SUMMARY_PATH = "mac_summary.sqlite"
+# 每次统计的id区间大小，首次建立汇总时分批扫描，避免单条语句过久
+SUMMARY_BATCH_IDS = 200000
+# created_at早于该秒数的行才计入水位线，较新的行每次刷新重新统计
+SUMMARY_SETTLE_SECONDS = 300
+
+_MERGE_SQL = """
+    INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (source_key, mac_address) DO UPDATE SET
+        message_count = message_count + excluded.message_count,
+        first_at = min(COALESCE(first_at, excluded.first_at), COALESCE(excluded.first_at, first_at)),
+        last_at = max(COALESCE(last_at, excluded.last_at), COALESCE(excluded.last_at, last_at)),
+        max_id = max(max_id, excluded.max_id)
+"""
+
+class MacSummary:
+    """按MAC地址汇总的聊天记录索引：消息数、首条/末条created_at、最大id
+    
+    汇总保存在本地SQLite文件中，按 主机/数据库/表 区分。每次刷新只统计id水位线之后
+    新增的行（按主键区间GROUP BY），MAC列表及其统计信息直接从本地读取，
+    不再对整张聊天表做SELECT DISTINCT。
+    
+    自增id按插入顺序分配而提交顺序不定，读取MAX(id)时较小id的行可能还未提交。
+    因此水位线只推进到created_at早于SUMMARY_SETTLE_SECONDS的行，水位线之后的行
+    每次刷新整体重新统计到mac_summary_tail中（替换上次的结果），不会重复计数。
+    只跟踪新增的行，已有记录被删除或修改时需调用rebuild()
+    """
+    def __init__(self, db_config, path=MAC_SUMMARY_PATH):
+        self.db_config = db_config
+        self.path = path
+        self.source_key = f"{db_config['host']}:{db_config['port']}/{db_config['database']}/{db_config['table']}"
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS mac_summary (
+                source_key TEXT NOT NULL,
+                mac_address TEXT NOT NULL,
+                message_count INTEGER NOT NULL,
+                first_at TEXT,
+                last_at TEXT,
+                max_id INTEGER NOT NULL,
+                PRIMARY KEY (source_key, mac_address)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS mac_summary_tail (
+                source_key TEXT NOT NULL,
+                mac_address TEXT NOT NULL,
+                message_count INTEGER NOT NULL,
+                first_at TEXT,
+                last_at TEXT,
+                max_id INTEGER NOT NULL,
+                PRIMARY KEY (source_key, mac_address)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS summary_state (
+                source_key TEXT PRIMARY KEY,
+                watermark INTEGER NOT NULL,
+                updated_at REAL
+            )
+        """)
+        return conn
+    
+    @staticmethod
+    def _values(row):
+        # 兼容字典游标
+        return tuple(row.values()) if isinstance(row, dict) else tuple(row)
+    
+    def watermark(self):
+        """已统计到的最大id"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT watermark FROM summary_state WHERE source_key = ?", (self.source_key,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0
+    
+    def _count(self, db_conn, start, end):
+        """按MAC统计 (start, end] 区间内的行，返回汇总表的参数列表"""
+        with db_conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT mac_address, COUNT(*), MIN(created_at), MAX(created_at), MAX(id) FROM {self.db_config['table']} "
+                f"WHERE id > %s AND id <= %s AND mac_address IS NOT NULL AND mac_address <> '' "
+                f"GROUP BY mac_address",
+                (start, end)
+            )
+            rows = [self._values(row) for row in cursor.fetchall()]
+        return [
+            (
+                self.source_key, mac, count,
+                str(first_at) if first_at is not None else None,
+                str(last_at) if last_at is not None else None,
+                max_id
+            )
+            for mac, count, first_at, last_at, max_id in rows
+        ]
+    
+    def refresh(self, db_conn, progress_callback=None):
+        """统计水位线之后新增的行并合并到汇总，返回汇总总条数的增加量
+        
+        progress_callback(已统计到的id, 最大id) 在每批完成后调用
+        """
+        table = self.db_config["table"]
+        with db_conn.cursor() as cursor:
+            cursor.execute(f"SELECT MAX(id) FROM {table}")
+            top = self._values(cursor.fetchone())[0] or 0
+        watermark = self.watermark()
+        if top < watermark:
+            # 表被清空或重建，重新统计
+            self.clear()
+            watermark = 0
+        
+        # 水位线推进到足够早的行为止，时间取数据库的NOW()，不受本机时钟影响
+        with db_conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT MAX(id) FROM {table} WHERE id > %s AND id <= %s "
+                f"AND created_at < NOW() - INTERVAL %s SECOND",
+                (watermark, top, SUMMARY_SETTLE_SECONDS)
+            )
+            settled = self._values(cursor.fetchone())[0] or watermark
+        
+        new_rows = 0
+        conn = self._connect()
+        try:
+            start = watermark
+            while start < settled:
+                end = min(start + SUMMARY_BATCH_IDS, settled)
+                params = self._count(db_conn, start, end)
+                # 汇总和水位线在同一事务中更新
+                with conn:
+                    conn.executemany(_MERGE_SQL.format(table="mac_summary"), params)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO summary_state VALUES (?, ?, ?)",
+                        (self.source_key, end, time.time())
+                    )
+                new_rows += sum(param[2] for param in params)
+                start = end
+                if progress_callback:
+                    progress_callback(end, top)
+            
+            # 水位线之后的行整体重新统计
+            tail = []
+            while start < top:
+                end = min(start + SUMMARY_BATCH_IDS, top)
+                tail.extend(self._count(db_conn, start, end))
+                start = end
+                if progress_callback:
+                    progress_callback(end, top)
+            with conn:
+                previous = conn.execute(
+                    "SELECT COALESCE(SUM(message_count), 0) FROM mac_summary_tail WHERE source_key = ?",
+                    (self.source_key,)
+                ).fetchone()[0]
+                conn.execute("DELETE FROM mac_summary_tail WHERE source_key = ?", (self.source_key,))
+                conn.executemany(_MERGE_SQL.format(table="mac_summary_tail"), tail)
+            new_rows += sum(param[2] for param in tail) - previous
+        finally:
+            conn.close()
+        return new_rows
+    
+    def load(self):
+        """读取汇总，返回按MAC地址排序的字典 {mac: {"count", "first_at", "last_at", "max_id"}}"""
+        if not os.path.exists(self.path):
+            return {}
+        conn = self._connect()
+        try:
+            # 合并已计入水位线的汇总和水位线之后的统计，MIN/MAX忽略NULL
+            rows = conn.execute(
+                "SELECT mac_address, SUM(message_count), MIN(first_at), MAX(last_at), MAX(max_id) FROM ("
+                "SELECT mac_address, message_count, first_at, last_at, max_id FROM mac_summary WHERE source_key = ? "
+                "UNION ALL "
+                "SELECT mac_address, message_count, first_at, last_at, max_id FROM mac_summary_tail WHERE source_key = ?"
+                ") GROUP BY mac_address ORDER BY mac_address",
+                (self.source_key, self.source_key)
+            ).fetchall()
+        finally:
+            conn.close()
+        return {
+            mac: {"count": count, "first_at": first_at, "last_at": last_at, "max_id": max_id}
+            for mac, count, first_at, last_at, max_id in rows
+        }
+    
+    def clear(self):
+        """删除本数据源的汇总"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM mac_summary WHERE source_key = ?", (self.source_key,))
+                conn.execute("DELETE FROM mac_summary_tail WHERE source_key = ?", (self.source_key,))
+                conn.execute("DELETE FROM summary_state WHERE source_key = ?", (self.source_key,))
+        finally:
+            conn.close()
+    
+    def rebuild(self, db_conn, progress_callback=None):
+        """清空后重新统计全部记录"""
+        self.clear()
+        return self.refresh(db_conn, progress_callback)
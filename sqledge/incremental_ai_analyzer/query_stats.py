@@ -0,0 +1,279 @@
+import functools
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+import pymysql.cursors
+
+# 延迟直方图的桶按1.1倍递增（以微秒计），分位数相对误差约5%
+HISTOGRAM_GROWTH = 1.1
+# 日志和报告中SQL的最大显示长度
+SQL_DISPLAY_LENGTH = 120
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"%\(\w+\)s|%s")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+def normalize_sql(sql):
+    """把SQL归一化为语句模板：字面量和占位符替换为?，IN列表折叠，空白压缩"""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    sql = _STRING_RE.sub("?", sql)
+    sql = _PLACEHOLDER_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(?...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+def estimate_rows_bytes(rows):
+    """按首行的字段内容粗略估算结果集字节数"""
+    if not rows:
+        return 0
+    row = rows[0]
+    values = row.values() if isinstance(row, dict) else row
+    size = 0
+    for value in values:
+        if value is None:
+            size += 1
+        elif isinstance(value, (str, bytes)):
+            size += len(value)
+        else:
+            size += 8
+    return size * len(rows)
+
+class LatencyHistogram:
+    """指数分桶的延迟直方图，内存占用固定，可估算任意分位数"""
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.max = 0.0
+    
+    def add(self, seconds):
+        micros = max(seconds * 1e6, 1.0)
+        index = int(math.log(micros, HISTOGRAM_GROWTH))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.max = max(self.max, seconds)
+    
+    def percentile(self, q):
+        """估算分位数（秒），q取0~1"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                # 取桶的几何中点，且不超过实际最大值
+                return min(HISTOGRAM_GROWTH ** (index + 0.5) / 1e6, self.max)
+        return self.max
+
+class QueryStats:
+    """进程内的SQL执行统计：按 操作名 + 归一化SQL 汇总次数、耗时分布、行数和字节数"""
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._log_thread = None
+        self._log_stop = threading.Event()
+        self._logged_count = 0
+        self._logged_time = 0.0
+    
+    def current_operation(self):
+        """当前线程正在执行的操作名"""
+        return getattr(self._local, "operation", "")
+    
+    @contextmanager
+    def operation(self, name):
+        """标记代码块所属的操作，其中执行的SQL按该操作名分组统计"""
+        previous = self.current_operation()
+        self._local.operation = name
+        try:
+            yield
+        finally:
+            self._local.operation = previous
+    
+    def record(self, sql, elapsed, rows=0, nbytes=0, operation=None):
+        """记录一条语句的执行情况"""
+        template = normalize_sql(sql)
+        key = (self.current_operation() if operation is None else operation, template)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {
+                    "operation": key[0],
+                    "sql": template,
+                    "count": 0,
+                    "total_time": 0.0,
+                    "rows": 0,
+                    "bytes": 0,
+                    "histogram": LatencyHistogram()
+                }
+            entry["count"] += 1
+            entry["total_time"] += elapsed
+            entry["rows"] += rows
+            entry["bytes"] += nbytes
+            entry["histogram"].add(elapsed)
+    
+    def snapshot(self):
+        """获取统计结果列表，按总耗时降序；时间单位为秒"""
+        with self._lock:
+            result = []
+            for entry in self._entries.values():
+                histogram = entry["histogram"]
+                result.append({
+                    "operation": entry["operation"],
+                    "sql": entry["sql"],
+                    "count": entry["count"],
+                    "total_time": entry["total_time"],
+                    "rows": entry["rows"],
+                    "bytes": entry["bytes"],
+                    "p50": histogram.percentile(0.50),
+                    "p95": histogram.percentile(0.95),
+                    "p99": histogram.percentile(0.99),
+                    "max": histogram.max
+                })
+        result.sort(key=lambda item: item["total_time"], reverse=True)
+        return result
+    
+    def reset(self):
+        """清空统计"""
+        with self._lock:
+            self._entries.clear()
+            self._logged_count = 0
+            self._logged_time = 0.0
+    
+    @staticmethod
+    def format_entry(item):
+        sql = item["sql"]
+        if len(sql) > SQL_DISPLAY_LENGTH:
+            sql = sql[:SQL_DISPLAY_LENGTH] + "..."
+        operation = f"[{item['operation']}] " if item["operation"] else ""
+        return (
+            f"{operation}{sql} | 次数 {item['count']}，p50 {item['p50'] * 1000:.1f}ms，"
+            f"p95 {item['p95'] * 1000:.1f}ms，p99 {item['p99'] * 1000:.1f}ms，"
+            f"行 {item['rows']}，约 {item['bytes'] / 1024:.1f}KB"
+        )
+    
+    def report(self, top=10):
+        """生成按总耗时排序的文本报告"""
+        items = self.snapshot()[:top]
+        if not items:
+            return "暂无SQL执行记录"
+        return "\n".join(self.format_entry(item) for item in items)
+    
+    def log_line(self):
+        """生成一行摘要：上次输出以来的语句数与耗时，以及累计最耗时的语句；无新语句时返回None"""
+        items = self.snapshot()
+        count = sum(item["count"] for item in items)
+        total_time = sum(item["total_time"] for item in items)
+        if count == self._logged_count:
+            return None
+        line = (
+            f"[SQL统计] 新增 {count - self._logged_count} 条语句，耗时 {total_time - self._logged_time:.2f}s；"
+            f"最耗时: {self.format_entry(items[0])}"
+        )
+        self._logged_count = count
+        self._logged_time = total_time
+        return line
+    
+    def start_periodic_log(self, interval=60, log=print):
+        """启动后台线程，每interval秒输出一行统计摘要（期间没有新语句时不输出）"""
+        if self._log_thread is not None or not interval:
+            return
+        self._log_stop.clear()
+        
+        def run():
+            while not self._log_stop.wait(interval):
+                line = self.log_line()
+                if line:
+                    log(line)
+        
+        self._log_thread = threading.Thread(target=run, name="query-stats-log", daemon=True)
+        self._log_thread.start()
+    
+    def stop_periodic_log(self):
+        """停止周期日志线程"""
+        self._log_stop.set()
+        self._log_thread = None
+
+# 进程内共享的统计实例
+query_stats = QueryStats()
+
+def traced(name):
+    """装饰器：函数执行期间的SQL归入操作name统计"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with query_stats.operation(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class InstrumentedCursorMixin:
+    """在execute前后计时并记录到query_stats
+    
+    缓冲游标在execute返回时记录；流式游标(SSCursor)在关闭时记录，耗时包含读取结果集的时间
+    """
+    _streaming = False
+    
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        self._finish_stats()
+        operation = query_stats.current_operation()
+        try:
+            result = super().execute(query, args)
+        except Exception:
+            query_stats.record(query, time.perf_counter() - start, operation=operation)
+            raise
+        if self._streaming:
+            self._pending_stats = [query, start, 0, 0, operation]
+        else:
+            rows = self._rows or ()
+            query_stats.record(
+                query, time.perf_counter() - start,
+                len(rows) if rows else max(self.rowcount, 0),
+                estimate_rows_bytes(rows), operation
+            )
+        return result
+    
+    def _count_fetched(self, rows):
+        pending = getattr(self, "_pending_stats", None)
+        if pending is not None and rows:
+            pending[2] += len(rows)
+            pending[3] += estimate_rows_bytes(rows)
+        return rows
+    
+    def _finish_stats(self):
+        pending = getattr(self, "_pending_stats", None)
+        if pending is not None:
+            self._pending_stats = None
+            query, start, rows, nbytes, operation = pending
+            query_stats.record(query, time.perf_counter() - start, rows, nbytes, operation)
+    
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._finish_stats()
+
+class InstrumentedCursor(InstrumentedCursorMixin, pymysql.cursors.Cursor):
+    """带统计的默认游标"""
+
+class InstrumentedDictCursor(InstrumentedCursorMixin, pymysql.cursors.DictCursor):
+    """带统计的字典游标"""
+
+class InstrumentedSSCursor(InstrumentedCursorMixin, pymysql.cursors.SSCursor):
+    """带统计的服务器端流式游标（fetchall逐行调用fetchone，无需单独统计）"""
+    _streaming = True
+    
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self._count_fetched((row,))
+        return row
+    
+    def fetchmany(self, size=None):
+        return self._count_fetched(super().fetchmany(size))
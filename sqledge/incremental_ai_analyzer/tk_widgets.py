@@ -0,0 +1,269 @@
+import tkinter as tk
+import tkinter.font as tkfont
+from tkinter import ttk
+
+# 鼠标滚轮每格滚动的行数
+WHEEL_ROWS = 3
+
+class VirtualListbox(ttk.Frame):
+    """只绘制可见行的列表框
+    
+    数据保存在items序列中（list、range、numpy数组均可），内部的tk.Listbox只放当前
+    窗口能显示的几十行，滚动、改变大小时按位置重新填充，每行文字在绘制时由
+    formatter(item)生成。curselection()返回items中的下标，get(index)返回items[index]，
+    选中变化时在本控件上触发<<ListboxSelect>>
+    """
+    def __init__(self, master, formatter=str, **listbox_options):
+        super().__init__(master)
+        self.items = ()
+        self.formatter = formatter
+        self.top = 0  # 第一条可见行在items中的下标
+        self.selected = None  # 选中行在items中的下标
+        
+        self.scrollbar = ttk.Scrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox = tk.Listbox(self, exportselection=False, **listbox_options)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        font = tkfont.Font(font=self.listbox.cget("font"))
+        self.row_height = font.metrics("linespace") + 2 * int(self.listbox.cget("selectborderwidth"))
+        
+        self.listbox.bind("<Configure>", lambda event: self.refresh())
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        self.listbox.bind("<MouseWheel>", self._on_wheel)
+        self.listbox.bind("<Button-4>", self._on_wheel)
+        self.listbox.bind("<Button-5>", self._on_wheel)
+        for key in ("<Up>", "<Down>", "<Prior>", "<Next>", "<Home>", "<End>"):
+            self.listbox.bind(key, self._on_key)
+    
+    def set_items(self, items, formatter=None):
+        """替换全部数据，回到顶部并清除选中"""
+        self.items = items
+        if formatter:
+            self.formatter = formatter
+        self.top = 0
+        self.selected = None
+        self.refresh()
+    
+    def size(self):
+        return len(self.items)
+    
+    def get(self, index):
+        return self.items[index]
+    
+    def curselection(self):
+        return () if self.selected is None else (self.selected,)
+    
+    def visible_rows(self):
+        """窗口能完整显示的行数"""
+        padding = 2 * (int(self.listbox.cget("borderwidth")) + int(self.listbox.cget("highlightthickness")))
+        return max(1, (self.listbox.winfo_height() - padding) // self.row_height)
+    
+    def see(self, index):
+        """滚动到使index可见"""
+        visible = self.visible_rows()
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + visible:
+            self.top = index - visible + 1
+        self.refresh()
+    
+    def refresh(self):
+        """按当前位置重新绘制可见行（数据内容变化后调用）"""
+        count = len(self.items)
+        visible = self.visible_rows()
+        self.top = max(0, min(self.top, count - visible))
+        # 多画一行，填满窗口底部不足一行的空间
+        stop = min(count, self.top + visible + 1)
+        labels = [self.formatter(self.items[index]) for index in range(self.top, stop)]
+        
+        self.listbox.delete(0, tk.END)
+        if labels:
+            self.listbox.insert(tk.END, *labels)
+        if self.selected is not None and self.top <= self.selected < stop:
+            self.listbox.selection_set(self.selected - self.top)
+            self.listbox.activate(self.selected - self.top)
+        
+        if count:
+            self.scrollbar.set(self.top / count, min(1.0, (self.top + visible) / count))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+    
+    def _scroll_to(self, top):
+        self.top = max(0, top)
+        self.refresh()
+    
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(int(float(amount) * len(self.items)))
+        elif unit == "pages":
+            self._scroll_to(self.top + int(amount) * self.visible_rows())
+        else:
+            self._scroll_to(self.top + int(amount))
+    
+    def _on_wheel(self, event):
+        if event.num == 4:
+            step = -1
+        elif event.num == 5:
+            step = 1
+        else:
+            step = -1 if event.delta > 0 else 1
+        self._scroll_to(self.top + step * WHEEL_ROWS)
+        return "break"
+    
+    def _on_select(self, event):
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        self.selected = self.top + selection[0]
+        self.event_generate("<<ListboxSelect>>")
+    
+    def _on_key(self, event):
+        count = len(self.items)
+        if not count:
+            return "break"
+        current = self.top if self.selected is None else self.selected
+        page = self.visible_rows()
+        moves = {
+            "Up": current - 1, "Down": current + 1,
+            "Prior": current - page, "Next": current + page,
+            "Home": 0, "End": count - 1
+        }
+        index = max(0, min(count - 1, moves[event.keysym]))
+        if index != self.selected:
+            self.selected = index
+            self.see(index)
+            self.event_generate("<<ListboxSelect>>")
+        return "break"
+
+
+# 聊天记录每段最多的条数，同一天的记录超过时拆成多段
+TRANSCRIPT_BLOCK_RECORDS = 200
+# Text中最多保留的行数，超过时移除远离当前位置一端的段
+TRANSCRIPT_MAX_LINES = 3000
+# 滚动位置距顶部/底部小于该比例时加载相邻的段
+TRANSCRIPT_EDGE = 0.1
+
+class ChatTranscript:
+    """在ScrolledText中按段显示聊天记录
+    
+    记录按天分段（一天的记录过多时再拆分），每段拼成一个字符串一次插入，
+    时间行和内容的标签范围预先算好后批量添加。Text中只保留当前位置附近的段，
+    滚动到接近顶部或底部时再加载相邻的段，并移除另一端超出TRANSCRIPT_MAX_LINES的段。
+    format_record(record)返回 (时间行文字, 内容)，created_at(record)返回记录时间
+    """
+    def __init__(self, text, format_record, created_at=lambda record: record[-1], empty_text="没有聊天记录"):
+        self.text = text
+        self.format_record = format_record
+        self.created_at = created_at
+        self.empty_text = empty_text
+        self.records = []
+        self.blocks = []  # 每段在records中的范围 [(start, stop)]
+        self.first = 0  # 已显示的第一段
+        self.rendered = []  # 已显示各段的行数
+        self._pending = False
+        
+        self.text.config(yscrollcommand=self._on_scrolled)
+        self.text.tag_config("time", foreground="#666666", font=("SimHei", 9))
+        self.text.tag_config("content", font=("SimHei", 10))
+    
+    def show(self, records):
+        """显示全部记录（按时间升序），先显示最后的段并滚动到底部"""
+        self.records = records
+        self.blocks = []
+        start = 0
+        day = None
+        for index, record in enumerate(records):
+            # datetime和"YYYY-MM-DD ..."字符串的前10个字符都是日期
+            current = str(self.created_at(record))[:10]
+            if index > start and (current != day or index - start >= TRANSCRIPT_BLOCK_RECORDS):
+                self.blocks.append((start, index))
+                start = index
+            day = current
+        if start < len(records):
+            self.blocks.append((start, len(records)))
+        
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(1.0, tk.END)
+        self.rendered = []
+        self.first = len(self.blocks)
+        if not self.blocks:
+            self.text.insert(tk.END, self.empty_text)
+        else:
+            # 最后一段及其前一段
+            for _ in range(min(2, len(self.blocks))):
+                self._prepend()
+        self.text.see(tk.END)
+        self.text.config(state=tk.DISABLED)
+    
+    def _insert_block(self, block, at_end):
+        """把一段记录拼成一个字符串插入，再按行号批量添加标签，返回该段的行数"""
+        start, stop = self.blocks[block]
+        parts = []
+        time_ranges = []
+        content_ranges = []
+        line = 0
+        for record in self.records[start:stop]:
+            header, content = self.format_record(record)
+            content = f"{content}\n\n"
+            lines = content.count("\n")
+            parts.append(f"{header}\n")
+            parts.append(content)
+            time_ranges.append((line, line + 1))
+            content_ranges.append((line + 1, line + 1 + lines))
+            line += 1 + lines
+        
+        base = int(self.text.index("end-1c").split(".")[0]) if at_end else 1
+        self.text.insert("end-1c" if at_end else "1.0", "".join(parts))
+        for tag, ranges in (("time", time_ranges), ("content", content_ranges)):
+            indexes = []
+            for first, last in ranges:
+                indexes.append(f"{base + first}.0")
+                indexes.append(f"{base + last}.0")
+            self.text.tag_add(tag, *indexes)
+        return line
+    
+    def _prepend(self):
+        self.first -= 1
+        self.rendered.insert(0, self._insert_block(self.first, at_end=False))
+    
+    def _append(self):
+        self.rendered.append(self._insert_block(self.first + len(self.rendered), at_end=True))
+    
+    def _on_scrolled(self, first, last):
+        """滚动时更新滚动条，接近顶部或底部且还有未显示的段时在空闲时加载"""
+        self.text.vbar.set(first, last)
+        if self._pending or not self.rendered:
+            return
+        near_top = float(first) <= TRANSCRIPT_EDGE and self.first > 0
+        near_bottom = float(last) >= 1 - TRANSCRIPT_EDGE and self.first + len(self.rendered) < len(self.blocks)
+        if near_top or near_bottom:
+            self._pending = True
+            self.text.after_idle(self._load_adjacent)
+    
+    def _load_adjacent(self):
+        """加载相邻的一段，保持当前可见的内容位置不变"""
+        self._pending = False
+        if not self.rendered:
+            return
+        first, last = self.text.yview()
+        top_line, top_char = (int(part) for part in self.text.index("@0,0").split("."))
+        self.text.config(state=tk.NORMAL)
+        if first <= TRANSCRIPT_EDGE and self.first > 0:
+            self._prepend()
+            top_line += self.rendered[0]
+            # 超出行数上限时移除末尾的段
+            while sum(self.rendered) > TRANSCRIPT_MAX_LINES and len(self.rendered) > 2:
+                start = 1 + sum(self.rendered[:-1])
+                self.text.delete(f"{start}.0", tk.END)
+                self.rendered.pop()
+        elif last >= 1 - TRANSCRIPT_EDGE and self.first + len(self.rendered) < len(self.blocks):
+            self._append()
+            # 超出行数上限时移除开头的段
+            while sum(self.rendered) > TRANSCRIPT_MAX_LINES and len(self.rendered) > 2:
+                removed = self.rendered.pop(0)
+                self.text.delete("1.0", f"{1 + removed}.0")
+                self.first += 1
+                top_line -= removed
+        self.text.yview(f"{max(top_line, 1)}.{top_char}")
+        self.text.config(state=tk.DISABLED)
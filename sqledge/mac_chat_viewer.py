@@ -3,6 +3,9 @@ from tkinter import ttk, messagebox, scrolledtext, filedialog
 import pymysql
 from datetime import datetime
 import os
+from query_stats import query_stats, traced, InstrumentedCursor
+from mac_summary import MacSummary
+from tk_widgets import ChatTranscript
 
 class MacChatViewer:
     def __init__(self, root):
@@ -24,6 +27,8 @@ class MacChatViewer:
         self.conn = None
         self.current_mac = None
         self.chat_records = []
+        self.mac_info = {}  # MAC地址 -> 汇总信息（消息数、首条/末条时间、最大id）
+        self.mac_summary = MacSummary(self.db_config)
         
         # 创建界面
         self._create_widgets()
@@ -43,6 +48,9 @@ class MacChatViewer:
         self.refresh_btn = ttk.Button(top_frame, text="刷新列表", command=self.refresh_mac_list)
         self.refresh_btn.pack(side=tk.LEFT, padx=5)
         
+        self.rebuild_btn = ttk.Button(top_frame, text="重建MAC汇总", command=self.rebuild_mac_summary)
+        self.rebuild_btn.pack(side=tk.LEFT, padx=5)
+        
         self.export_btn = ttk.Button(top_frame, text="导出为TXT", command=self.export_to_txt, state=tk.DISABLED)
         self.export_btn.pack(side=tk.RIGHT, padx=5)
         
@@ -58,6 +66,8 @@ class MacChatViewer:
         self.chat_area = scrolledtext.ScrolledText(chat_frame, wrap=tk.WORD, font=("SimHei", 10))
         self.chat_area.pack(fill=tk.BOTH, expand=True)
         self.chat_area.config(state=tk.DISABLED)  # 初始为只读
+        # 按天分段显示，只保留当前位置附近的段
+        self.transcript = ChatTranscript(self.chat_area, self._format_chat_record, empty_text="该MAC地址没有聊天记录")
         
         # 状态栏
         self.status_var = tk.StringVar(value="未连接数据库")
@@ -73,8 +83,11 @@ class MacChatViewer:
                 user=self.db_config["user"],
                 password=self.db_config["password"],
                 database=self.db_config["database"],
-                charset="utf8mb4"
+                charset="utf8mb4",
+                cursorclass=InstrumentedCursor
             )
+            # 定期在控制台输出SQL耗时统计
+            query_stats.start_periodic_log(60)
             
             self.refresh_mac_list()
             self.status_var.set(f"已连接到 {self.db_config['database']}")
@@ -92,23 +105,30 @@ class MacChatViewer:
             # 清空现有列表
             self.mac_combobox['values'] = []
             
-            # 查询所有不重复的MAC地址
-            with self.conn.cursor() as cursor:
-                cursor.execute(f"SELECT DISTINCT mac_address FROM {self.db_config['table']} WHERE mac_address IS NOT NULL ORDER BY mac_address")
-                macs = cursor.fetchall()
+            # 只统计上次刷新后新增的记录，MAC列表从本地汇总读取
+            new_rows = self.mac_summary.refresh(self.conn)
+            self.mac_info = self.mac_summary.load()
+            mac_list = list(self.mac_info)
                 
-                # 提取MAC地址列表
-                mac_list = [mac[0] for mac in macs if mac[0]]
-                
-                if mac_list:
-                    self.mac_combobox['values'] = mac_list
-                    self.status_var.set(f"找到 {len(mac_list)} 个MAC地址")
-                else:
-                    self.status_var.set("未找到任何MAC地址记录")
+            if mac_list:
+                self.mac_combobox['values'] = mac_list
+                self.status_var.set(f"找到 {len(mac_list)} 个MAC地址（新增 {new_rows} 条记录）")
+            else:
+                self.status_var.set("未找到任何MAC地址记录")
                     
         except Exception as e:
             messagebox.showerror("错误", f"获取MAC列表失败: {str(e)}")
     
+    def rebuild_mac_summary(self):
+        """清空本地MAC汇总后重新统计全部记录（已有聊天记录被删除或修改后使用）"""
+        if not self.conn:
+            return
+        if not messagebox.askyesno("确认", "将重新统计全部聊天记录，数据量大时需要较长时间，是否继续？"):
+            return
+        self.mac_summary.clear()
+        self.refresh_mac_list()
+    
+    @traced("MacChatViewer.on_mac_selected")
     def on_mac_selected(self, event=None):
         """当选择MAC地址时加载对应的聊天记录"""
         self.current_mac = self.mac_combobox.get()
@@ -138,31 +158,15 @@ class MacChatViewer:
             messagebox.showerror("错误", f"加载聊天记录失败: {str(e)}")
     
     def _display_chat_records(self):
-        """在聊天区域显示记录（模拟聊天界面样式）"""
-        self.chat_area.config(state=tk.NORMAL)
-        self.chat_area.delete(1.0, tk.END)
-        
-        if not self.chat_records:
-            self.chat_area.insert(tk.END, "该MAC地址没有聊天记录")
-            self.chat_area.config(state=tk.DISABLED)
-            return
-            
-        # 格式化显示每条记录
-        for content, created_at in self.chat_records:
-            # 格式化时间
-            time_str = created_at.strftime("%Y-%m-%d %H:%M:%S") if isinstance(created_at, datetime) else str(created_at)
-            
-            # 聊天记录样式（时间 + 内容）
-            self.chat_area.insert(tk.END, f"[{time_str}]\n", "time")
-            self.chat_area.insert(tk.END, f"{content}\n\n", "content")
-        
-        # 设置文本样式
-        self.chat_area.tag_config("time", foreground="#666666", font=("SimHei", 9))
-        self.chat_area.tag_config("content", font=("SimHei", 10))
-        
-        # 滚动到底部
-        self.chat_area.see(tk.END)
-        self.chat_area.config(state=tk.DISABLED)
+        """在聊天区域显示记录（模拟聊天界面样式），滚动到底部"""
+        self.transcript.show(self.chat_records)
+        
+    @staticmethod
+    def _format_chat_record(record):
+        """聊天记录样式（时间 + 内容）"""
+        content, created_at = record
+        time_str = created_at.strftime("%Y-%m-%d %H:%M:%S") if isinstance(created_at, datetime) else str(created_at)
+        return f"[{time_str}]", content
     
     def export_to_txt(self):
         """将当前MAC地址的聊天记录导出为TXT文件"""
@@ -0,0 +1,176 @@
+import argparse
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from db_utils import DBConfig, DBManager, DataProcessor
+from query_stats import query_stats
+
+# 输出格式 -> 文件扩展名
+OUTPUT_FORMATS = {
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "csv.zst": ".csv.zst",
+    "parquet": ".parquet",
+    "arrow": ".arrow"
+}
+
+def partition_count(value):
+    """--partitions的取值：正整数，或auto（按服务器空闲连接数决定）"""
+    if value == "auto":
+        return value
+    try:
+        count = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"应为正整数或auto: {value}")
+    if count < 1:
+        raise argparse.ArgumentTypeError(f"应为正整数或auto: {value}")
+    return count
+
+@contextmanager
+def stage(timings, name):
+    """记录一个处理阶段的耗时"""
+    start = time.perf_counter()
+    print(f"[{name}] 开始")
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings.append((name, elapsed))
+        print(f"[{name}] 用时 {elapsed:.2f} 秒")
+
+def output_path(path, output_format):
+    """按输出格式补全扩展名，未指定格式时按原路径的扩展名导出"""
+    if not output_format:
+        return path
+    suffix = OUTPUT_FORMATS[output_format]
+    if path.lower().endswith(suffix):
+        return path
+    base = path[:-len(".csv")] if path.lower().endswith(".csv") else path
+    return base + suffix
+
+def run(args):
+    """执行 刷新数据库 -> 读取CSV -> 匹配 -> 导出（-> 写回数据库），返回进程退出码"""
+    if args.config:
+        DBConfig.CONFIG_FILE = args.config
+    config = DBConfig.load_config()
+    if not config.get("database"):
+        print(f"请先在 {DBConfig.CONFIG_FILE} 中配置数据库连接")
+        return 1
+    if args.no_snapshot:
+        config = dict(config, snapshot_path="")
+    
+    timings = []
+    manager = DBManager(config)
+    try:
+        with stage(timings, "刷新数据库"):
+            if not args.full:
+                # 先加载本地快照，之后只需增量拉取变化的行
+                success, msg, _ = manager.load_snapshot(args.date_from, args.date_to)
+                if success:
+                    print(msg)
+            success, msg, cache = manager.refresh_data(
+                args.date_from, args.date_to,
+                incremental=not args.full,
+                stream=True,
+                partitions=args.partitions
+            )
+            print(msg)
+            if not success:
+                return 1
+        
+        with stage(timings, "读取CSV"):
+            extra_columns = [args.csv_key] if args.mode == "key" else []
+            csv_data = DataProcessor.load_csv(args.csv, extra_columns)
+            report = DataProcessor.validate_csv(csv_data, config.get("password_pattern"))
+            print(
+                f"读取 {len(csv_data)} 行：device_code重复 {len(report['duplicate_codes'])} 行，"
+                f"缺失 {len(report['missing_codes'])} 行，password格式不正确 {len(report['bad_passwords'])} 行"
+            )
+            if args.strict and any(len(rows) for rows in report.values()):
+                print("CSV检查未通过")
+                return 1
+        
+        with stage(timings, "匹配"):
+            disabled_rows = set()
+            if args.exclude:
+                disabled_rows = set(DataProcessor.filter_rows(cache["data"], args.exclude).tolist())
+                print(f"按条件排除 {len(disabled_rows)} 条数据库记录")
+            matched = DataProcessor.match_data(
+                cache["data"], cache["columns"], csv_data, disabled_rows,
+                mode=args.mode, db_key=args.db_key, csv_key=args.csv_key
+            )
+            if matched is None:
+                return 1
+            print(
+                f"匹配 {matched['count']} 条记录；数据库未匹配 {len(matched['unmatched_db'])} 条，"
+                f"CSV未匹配 {len(matched['unmatched_csv'])} 条"
+            )
+        
+        selected_columns = args.columns.split(",") if args.columns else config.get("export_columns")
+        selected_columns = selected_columns or matched["columns"]
+        unknown = [col for col in selected_columns if col not in matched["columns"]]
+        if unknown:
+            print(f"导出列不存在: {', '.join(unknown)}")
+            return 1
+        
+        with stage(timings, "导出"):
+            success, msg = DataProcessor.export_file(
+                matched["data"], matched["columns"],
+                output_path(args.output, args.format), selected_columns
+            )
+            print(msg)
+            if not success:
+                return 1
+        
+        if args.write_back or args.apply:
+            with stage(timings, "写回数据库"):
+                assignments, skipped = DataProcessor.write_back_rows(matched)
+                if skipped:
+                    print(f"{skipped} 条因主键、device_code或password为空而跳过")
+                success, msg, diff = manager.write_back(assignments, dry_run=not args.apply)
+                print(msg)
+                if not success:
+                    return 1
+                for key, old_code, new_code, old_password, new_password in diff["samples"]:
+                    print(f"  id {key}: device_code {old_code} -> {new_code}，password {old_password} -> {new_password}")
+    except (ValueError, OSError) as e:
+        print(str(e))
+        return 1
+    finally:
+        manager.close()
+        print("耗时: " + "，".join(f"{name} {elapsed:.2f}s" for name, elapsed in timings))
+        if args.sql_stats:
+            print(query_stats.report())
+    return 0
+
+def main():
+    today = date.today()
+    parser = argparse.ArgumentParser(description="设备数据匹配（命令行，无需图形界面）")
+    parser.add_argument("--from", dest="date_from", default=(today - timedelta(days=30)).isoformat(),
+                        help="创建日期起始，yyyy-MM-dd，默认30天前")
+    parser.add_argument("--to", dest="date_to", default=today.isoformat(), help="创建日期截止，yyyy-MM-dd，默认今天")
+    parser.add_argument("--csv", required=True, help="本地CSV文件（需包含password和device_code列）")
+    parser.add_argument("--mode", choices=("position", "key"), default="position",
+                        help="position按顺序配对，key按 --db-key 与 --csv-key 的值连接")
+    parser.add_argument("--db-key", default="mac_address", help="按键匹配时的数据库列")
+    parser.add_argument("--csv-key", default="mac_address", help="按键匹配时的CSV列")
+    parser.add_argument("--exclude", help="排除满足条件的数据库记录，例如 \"board == 'esp32s3'\"")
+    parser.add_argument("--columns", help="逗号分隔的导出列，默认使用配置中的export_columns或全部列")
+    parser.add_argument("--output", required=True, help="输出文件")
+    parser.add_argument("--format", choices=tuple(OUTPUT_FORMATS), help="输出格式，默认按输出文件扩展名")
+    parser.add_argument("--config", help=f"配置文件，默认 {DBConfig.CONFIG_FILE}")
+    parser.add_argument("--partitions", type=partition_count,
+                        help="全量读取时的并发分区数，auto按服务器空闲连接数决定，默认使用配置")
+    parser.add_argument("--full", action="store_true", help="忽略本地快照，全量刷新")
+    parser.add_argument("--no-snapshot", action="store_true", help="不读写本地快照")
+    parser.add_argument("--strict", action="store_true", help="CSV检查发现问题时不匹配，以非零状态退出")
+    parser.add_argument("--write-back", action="store_true",
+                        help="预览把device_code/password写回数据表的差异（不修改数据）")
+    parser.add_argument("--apply", action="store_true", help="确认写回数据表（在一个事务中批量更新）")
+    parser.add_argument("--sql-stats", action="store_true", help="结束时输出SQL执行统计")
+    args = parser.parse_args()
+    sys.exit(run(args))
+
+if __name__ == "__main__":
+    main()
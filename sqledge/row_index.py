@@ -0,0 +1,105 @@
+import numpy as np
+
+class EnabledRowIndex:
+    """启用行的树状数组（Fenwick树）索引
+    
+    维护每行的启用状态，切换单行状态、查询某行之前的启用行数（即按顺序匹配时
+    该行对应的CSV行号）、查找第k条启用行都是O(log n)，适合逐行点击启用/禁用时
+    只增量更新匹配结果
+    """
+    def __init__(self, row_count, disabled_rows=()):
+        self.enabled = np.ones(row_count, dtype=bool)
+        if disabled_rows:
+            disabled = np.fromiter(disabled_rows, dtype=np.int64, count=len(disabled_rows))
+            self.enabled[disabled[(disabled >= 0) & (disabled < row_count)]] = False
+        self._build()
+        # select()二分下降的起始步长
+        self._top_bit = 1 << max(row_count.bit_length() - 1, 0) if row_count else 0
+    
+    def _build(self):
+        # 0基Fenwick树：tree[i]为区间[i & (i + 1), i]内的启用行数，由前缀和一次性构建
+        prefix = np.concatenate(([0], np.cumsum(self.enabled, dtype=np.int64)))
+        positions = np.arange(len(self.enabled))
+        self._tree = prefix[positions + 1] - prefix[positions & (positions + 1)]
+        self.enabled_count = int(prefix[-1])
+    
+    def __len__(self):
+        return len(self.enabled)
+    
+    def is_enabled(self, row):
+        return bool(self.enabled[row])
+    
+    def set_enabled(self, row, enabled):
+        """设置行的启用状态，状态有变化时返回True"""
+        if bool(self.enabled[row]) == enabled:
+            return False
+        self.enabled[row] = enabled
+        delta = 1 if enabled else -1
+        self.enabled_count += delta
+        tree = self._tree
+        size = len(tree)
+        while row < size:
+            tree[row] += delta
+            row |= row + 1
+        return True
+    
+    def set_rows(self, rows, enabled):
+        """批量设置多行的启用状态，整体重建索引（O(n)，向量化）
+        
+        返回状态实际发生变化的行号数组
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        changed = rows[self.enabled[rows] != enabled]
+        if len(changed):
+            self.enabled[changed] = enabled
+            self._build()
+        return changed
+    
+    def toggle(self, row):
+        """切换行的启用状态，返回切换后的状态"""
+        enabled = not self.enabled[row]
+        self.set_enabled(row, enabled)
+        return enabled
+    
+    def rank(self, row):
+        """行row之前（不含）的启用行数"""
+        tree = self._tree
+        count = 0
+        row -= 1
+        while row >= 0:
+            count += int(tree[row])
+            row = (row & (row + 1)) - 1
+        return count
+    
+    def select(self, k):
+        """第k条（从0开始）启用行的行号，不存在时返回-1"""
+        if k < 0 or k >= self.enabled_count:
+            return -1
+        tree = self._tree
+        size = len(tree)
+        # pos为已跳过的行数，tree[pos + step - 1]恰好覆盖区间[pos, pos + step - 1]
+        pos = 0
+        step = self._top_bit
+        while step:
+            end = pos + step - 1
+            if end < size and tree[end] <= k:
+                k -= int(tree[end])
+                pos += step
+            step >>= 1
+        return pos
+    
+    def enabled_rows(self, start_rank=0, stop_rank=None):
+        """按顺序排在[start_rank, stop_rank)的启用行的行号数组
+        
+        首尾两行由树查找（O(log n)），只扫描两者之间的状态
+        """
+        stop_rank = self.enabled_count if stop_rank is None else min(stop_rank, self.enabled_count)
+        if start_rank >= stop_rank:
+            return np.empty(0, dtype=np.int64)
+        first = self.select(start_rank)
+        last = self.select(stop_rank - 1)
+        return first + np.flatnonzero(self.enabled[first:last + 1])
+    
+    def disabled_rows(self):
+        """禁用行的行号集合"""
+        return set(np.flatnonzero(~self.enabled).tolist())
@@ -0,0 +1,128 @@
+import threading
+import time
+
+# 缓存在该秒数内直接使用，不访问数据库
+CHECK_INTERVAL = 30
+
+# 表的更新时间与列校验和，一次查询取回，用于判断缓存是否失效
+_STAMP_SQL = """
+SELECT t.UPDATE_TIME, t.CREATE_TIME, c.column_count, c.column_checksum
+FROM information_schema.TABLES t
+JOIN (
+    SELECT COUNT(*) AS column_count,
+           SUM(CRC32(CONCAT_WS('|', COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, ORDINAL_POSITION))) AS column_checksum
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+) c
+WHERE t.TABLE_SCHEMA = DATABASE() AND t.TABLE_NAME = %s
+"""
+
+_COLUMNS_SQL = """
+SELECT COLUMN_NAME, DATA_TYPE, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY
+FROM information_schema.COLUMNS
+WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+ORDER BY ORDINAL_POSITION
+"""
+
+# MySQL数据类型到列存类型的映射，其余类型由数据推断
+SQL_TYPE_KINDS = {
+    "tinyint": "int",
+    "smallint": "int",
+    "mediumint": "int",
+    "int": "int",
+    "integer": "int",
+    "bigint": "int",
+    "float": "float",
+    "double": "float",
+    "datetime": "datetime",
+    "timestamp": "datetime"
+}
+
+class SchemaCache:
+    """表结构缓存，按 主机/端口/数据库/表 共享，替代每次刷新都执行的DESCRIBE
+    
+    缓存条目在CHECK_INTERVAL秒内直接使用；超过后用一次轻量查询比对
+    information_schema.TABLES 的 UPDATE_TIME/CREATE_TIME 和列校验和，变化时才重新读取列信息
+    """
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "checks": 0, "loads": 0, "invalidations": 0}
+    
+    @staticmethod
+    def _key(conn, table_name):
+        database = conn.db.decode() if isinstance(conn.db, bytes) else conn.db
+        return (conn.host, conn.port, database, table_name)
+    
+    def get(self, conn, table_name):
+        """获取表结构信息
+        
+        返回字典：columns（列名列表）、types（列名->DATA_TYPE）、column_types（列名->COLUMN_TYPE）、
+        nullable（列名->是否可空）、primary_key（主键列名列表）
+        """
+        key = self._key(conn, table_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry["checked_at"] < self.check_interval:
+                self.stats["hits"] += 1
+                return entry
+        
+        with conn.cursor() as cursor:
+            cursor.execute(_STAMP_SQL, (table_name, table_name))
+            stamp = cursor.fetchone()
+            if stamp is None:
+                raise ValueError(f"表 {table_name} 不存在")
+            stamp = tuple(stamp.values()) if isinstance(stamp, dict) else tuple(stamp)
+            
+            if entry and entry["stamp"] == stamp:
+                # 更新时间和列校验和都未变，结构仍然有效
+                with self._lock:
+                    entry["stamp"] = stamp
+                    entry["checked_at"] = time.monotonic()
+                    self.stats["checks"] += 1
+                return entry
+            
+            cursor.execute(_COLUMNS_SQL, (table_name,))
+            rows = cursor.fetchall()
+        
+        rows = [tuple(row.values()) if isinstance(row, dict) else tuple(row) for row in rows]
+        entry = {
+            "columns": [row[0] for row in rows],
+            "types": {row[0]: row[1].lower() for row in rows},
+            "column_types": {row[0]: row[2] for row in rows},
+            "nullable": {row[0]: row[3] == "YES" for row in rows},
+            "primary_key": [row[0] for row in rows if row[4] == "PRI"],
+            "stamp": stamp,
+            "checked_at": time.monotonic()
+        }
+        with self._lock:
+            old = self._entries.get(key)
+            if old and old["stamp"][2:] != stamp[2:]:
+                self.stats["invalidations"] += 1
+            self.stats["loads"] += 1
+            self._entries[key] = entry
+        return entry
+    
+    def get_columns(self, conn, table_name):
+        """获取表的列名列表"""
+        return self.get(conn, table_name)["columns"]
+    
+    def invalidate(self, conn=None, table_name=None):
+        """使缓存失效；不指定参数时清空全部缓存"""
+        with self._lock:
+            if conn is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self._key(conn, table_name), None)
+
+def column_kinds(schema):
+    """根据列的SQL类型给出列存类型提示"""
+    return {
+        name: SQL_TYPE_KINDS[data_type]
+        for name, data_type in schema["types"].items()
+        if data_type in SQL_TYPE_KINDS
+    }
+
+# 进程内共享的表结构缓存
+schema_cache = SchemaCache()
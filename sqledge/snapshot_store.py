@@ -0,0 +1,185 @@
+import json
+import os
+import pickle
+import sqlite3
+import time
+import numpy as np
+from columnar import ColumnarTable
+
+# SQLite内存映射读取的上限（字节）
+MMAP_SIZE = 1024 * 1024 * 1024
+
+class SnapshotStore:
+    """本地快照存储：把刷新得到的列存数据保存到SQLite文件，启动时直接加载显示
+    
+    每个快照按 主机/数据库/表/日期范围 区分，数值列按原始字节保存，
+    加载时直接由字节构造NumPy数组；读取通过SQLite的mmap完成，不经过额外的文件缓冲
+    """
+    def __init__(self, path):
+        self.path = path
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                snapshot_key TEXT PRIMARY KEY,
+                table_key TEXT NOT NULL,
+                date_from TEXT,
+                date_to TEXT,
+                columns TEXT NOT NULL,
+                kinds TEXT NOT NULL,
+                column_types TEXT,
+                last_refresh TEXT,
+                record_count INTEGER,
+                saved_at REAL,
+                delta_state BLOB
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS snapshot_columns (
+                snapshot_key TEXT NOT NULL,
+                column_name TEXT NOT NULL,
+                dtype TEXT NOT NULL,
+                data BLOB,
+                mask BLOB,
+                categories BLOB,
+                PRIMARY KEY (snapshot_key, column_name)
+            )
+        """)
+        return conn
+    
+    @staticmethod
+    def table_key(config):
+        """生成表键：主机:端口/数据库/表"""
+        return f"{config['host']}:{config['port']}/{config['database']}/{config['table']}"
+    
+    @staticmethod
+    def make_key(config, date_from_str, date_to_str):
+        """生成快照键：主机:端口/数据库/表/起始日期/结束日期"""
+        return f"{SnapshotStore.table_key(config)}/{date_from_str}/{date_to_str}"
+    
+    def latest_range(self, config):
+        """返回该表最近保存的快照的日期范围 (起始日期, 结束日期)，没有时返回None"""
+        if not os.path.exists(self.path):
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT date_from, date_to FROM snapshots WHERE table_key = ? ORDER BY saved_at DESC LIMIT 1",
+                (self.table_key(config),)
+            ).fetchone()
+        finally:
+            conn.close()
+        return tuple(row) if row else None
+    
+    def save(self, key, cache, delta_state=None):
+        """保存缓存数据及增量刷新状态"""
+        table = cache["data"]
+        table_key, date_from_str, date_to_str = key.rsplit("/", 2)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM snapshot_columns WHERE snapshot_key = ?", (key,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        table_key,
+                        date_from_str,
+                        date_to_str,
+                        json.dumps(table.columns, ensure_ascii=False),
+                        json.dumps(table.kinds),
+                        json.dumps(cache.get("column_types") or {}, ensure_ascii=False),
+                        cache["last_refresh"],
+                        len(table),
+                        time.time(),
+                        pickle.dumps(delta_state, protocol=pickle.HIGHEST_PROTOCOL) if delta_state else None
+                    )
+                )
+                for name in table.columns:
+                    arr, mask, categories = table.raw(name)
+                    if arr.dtype == object:
+                        dtype = "object"
+                        data = pickle.dumps(arr.tolist(), protocol=pickle.HIGHEST_PROTOCOL)
+                    else:
+                        dtype = arr.dtype.str
+                        data = np.ascontiguousarray(arr).tobytes()
+                    conn.execute(
+                        "INSERT INTO snapshot_columns VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            key, name, dtype, data,
+                            mask.tobytes() if mask is not None else None,
+                            pickle.dumps(categories.tolist(), protocol=pickle.HIGHEST_PROTOCOL)
+                            if categories is not None else None
+                        )
+                    )
+        finally:
+            conn.close()
+    
+    def load(self, key):
+        """加载快照，返回 (cache字典, 增量刷新状态)；不存在时返回 (None, None)"""
+        if not os.path.exists(self.path):
+            return None, None
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT columns, kinds, column_types, last_refresh, delta_state FROM snapshots WHERE snapshot_key = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None, None
+            columns = json.loads(row[0])
+            kinds = json.loads(row[1])
+            
+            data = {}
+            masks = {}
+            categories = {}
+            for name, dtype, blob, mask, cats in conn.execute(
+                "SELECT column_name, dtype, data, mask, categories FROM snapshot_columns WHERE snapshot_key = ?",
+                (key,)
+            ):
+                if dtype == "object":
+                    values = pickle.loads(blob)
+                    arr = np.empty(len(values), dtype=object)
+                    arr[:] = values
+                else:
+                    # 直接由字节构造数组，不再逐值转换
+                    arr = np.frombuffer(blob, dtype=np.dtype(dtype))
+                data[name] = arr
+                if mask is not None:
+                    masks[name] = np.frombuffer(mask, dtype=bool)
+                if cats is not None:
+                    values = pickle.loads(cats)
+                    categories[name] = np.empty(len(values), dtype=object)
+                    categories[name][:] = values
+        finally:
+            conn.close()
+        
+        if set(data) != set(columns):
+            # 快照不完整
+            return None, None
+        table = ColumnarTable(columns, kinds, data, masks, categories)
+        cache = {
+            "data": table,
+            "columns": columns,
+            "column_types": json.loads(row[2]) if row[2] else {},
+            "last_refresh": row[3],
+            "record_count": len(table),
+            "from_snapshot": True
+        }
+        delta_state = pickle.loads(row[4]) if row[4] else None
+        return cache, delta_state
+    
+    def delete(self, key):
+        """删除快照"""
+        if not os.path.exists(self.path):
+            return
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM snapshot_columns WHERE snapshot_key = ?", (key,))
+                conn.execute("DELETE FROM snapshots WHERE snapshot_key = ?", (key,))
+        finally:
+            conn.close()
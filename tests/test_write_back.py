@@ -0,0 +1,132 @@
+import os
+import sys
+import threading
+import unittest
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sqledge"))
+import pymysql
+from db_utils import DBManager
+
+class FakeCursor:
+    """按语句开头模拟write_back用到的MySQL语句"""
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        return False
+    
+    def executemany(self, sql, rows):
+        for row in rows:
+            self.conn.temp.append((len(self.conn.temp) + 1,) + tuple(row))
+    
+    def execute(self, sql, args=None):
+        conn = self.conn
+        table = conn.working if not conn.autocommit_mode else conn.table
+        if sql.startswith("UPDATE"):
+            conn.update_count += 1
+            if conn.fail_on_update == conn.update_count:
+                raise pymysql.err.OperationalError(1317, "Query execution was interrupted")
+            start, stop = args
+            count = 0
+            for seq, key, code, password in conn.temp:
+                selected = start < seq <= stop if "w.seq" in sql else start <= key <= stop
+                if selected and key in table:
+                    table[key] = (code, password)
+                    count += 1
+            return count
+        if sql.startswith("SELECT COALESCE(MAX(seq)"):
+            self.result = [(len(conn.temp),)]
+        elif sql.startswith("SELECT COUNT(*), "):
+            found = [(table[key], (code, password)) for _, key, code, password in conn.temp if key in table]
+            unchanged = sum(old == new for old, new in found)
+            self.result = [(len(found), unchanged, len(found) - unchanged)]
+        elif sql.startswith("SELECT COUNT(*)"):
+            self.result = [(0,)]
+        else:
+            self.result = []
+        return 0
+    
+    def fetchone(self):
+        return self.result[0]
+    
+    def fetchall(self):
+        return self.result
+
+class FakeConnection:
+    """已提交的数据在table中；关闭自动提交后修改working，commit/rollback时同步"""
+    def __init__(self, table):
+        self.table = dict(table)
+        self.working = dict(table)
+        self.autocommit_mode = True
+        self.temp = []
+        self.update_count = 0
+        self.fail_on_update = None
+    
+    def cursor(self):
+        return FakeCursor(self)
+    
+    def thread_id(self):
+        return 1
+    
+    def autocommit(self, value):
+        self.autocommit_mode = value
+        self.working = dict(self.table)
+    
+    def commit(self):
+        self.table = dict(self.working)
+    
+    def rollback(self):
+        self.working = dict(self.table)
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.connect_kwargs = {"autocommit": True}
+    
+    @contextmanager
+    def connection(self, timeout=None):
+        yield self.conn
+
+class WriteBackTest(unittest.TestCase):
+    def setUp(self):
+        self.table = {f"id{i}": (None, None) for i in range(5)}
+        self.assignments = [(f"id{i}", f"code{i}", f"pw{i}") for i in range(5)]
+        self.conn = FakeConnection(self.table)
+        self.manager = DBManager({
+            "host": "localhost", "port": 3306, "user": "", "password": "",
+            "database": "test", "table": "ai_device", "snapshot_path": "", "query_log_interval": 0
+        })
+        self.manager.pool = FakePool(self.conn)
+    
+    def test_apply_commits_all_batches(self):
+        success, _, diff = self.manager.write_back(self.assignments, dry_run=False, batch_size=2)
+        self.assertTrue(success)
+        self.assertEqual(diff["updated"], 5)
+        self.assertEqual(self.conn.table["id4"], ("code4", "pw4"))
+        self.assertTrue(self.conn.autocommit_mode)
+    
+    def test_cancel_midway_changes_nothing(self):
+        cancel_event = threading.Event()
+        success, msg, _ = self.manager.write_back(
+            self.assignments, dry_run=False, batch_size=2,
+            progress_callback=lambda done, total: cancel_event.set(), cancel_event=cancel_event
+        )
+        self.assertFalse(success)
+        self.assertEqual(self.conn.update_count, 1)
+        self.assertEqual(self.conn.table, self.table)
+        self.assertTrue(self.conn.autocommit_mode)
+    
+    def test_killed_statement_rolls_back(self):
+        self.conn.fail_on_update = 2
+        success, _, _ = self.manager.write_back(self.assignments, dry_run=False, batch_size=2)
+        self.assertFalse(success)
+        self.assertEqual(self.conn.table, self.table)
+        self.assertTrue(self.conn.autocommit_mode)
+
+if __name__ == "__main__":
+    unittest.main()